@@ -0,0 +1,156 @@
+"""
+Shared cache layer for the appointment, profile, calendar and chat caches.
+
+Entries are grouped into namespaces on one Django cache from CACHES, whose
+backend is picked by CACHE_URL: process memory by default, a directory
+shared by every worker on the host with filecache://, or a cache server. A
+Namespace adds to the plain cache API:
+
+- per-key TTLs: the namespace default, or one per set()/get_or_set();
+- bulk invalidation: keys embed the namespace version, so invalidate()
+  bumps a single counter and old entries simply expire;
+- stampede protection in get_or_set(): entries remember how long they took
+  to compute and one caller refreshes them early with a probability that
+  grows as expiry nears (XFetch), while concurrent misses in one process
+  wait for a single computation;
+- hit/miss/refresh counts per namespace, from stats() and as
+  cache_requests_total on /metrics when METRICS_ENABLED.
+"""
+import math
+import random
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .metrics import registry
+
+registry.counter("cache_requests_total", "Shared cache lookups by namespace and result.",
+                 label_names=("namespace", "result"))
+
+NAMESPACES = {}
+
+
+class Namespace:
+    def __init__(self, name, ttl=300, alias="default", beta=1.0):
+        self.name = name
+        self.ttl = ttl
+        self.alias = alias
+        self.beta = beta  # > 1 refreshes earlier, 0 disables early refresh
+        self._counts = defaultdict(int)
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    # Keys
+
+    def _version_key(self):
+        return f"{self.name}:version"
+
+    def version(self):
+        version = self.cache.get(self._version_key())
+        if version is None:
+            # Start from the clock so a version lost to eviction never revives old entries
+            self.cache.add(self._version_key(), time.time_ns(), None)
+            version = self.cache.get(self._version_key())
+        return version
+
+    def make_key(self, key):
+        return f"{self.name}:{self.version()}:{key}"
+
+    # Stats
+
+    def _record(self, result):
+        with self._lock:
+            self._counts[result] += 1
+        if getattr(settings, "METRICS_ENABLED", False):
+            registry.inc("cache_requests_total", (self.name, result))
+
+    def stats(self):
+        with self._lock:
+            counts = {result: self._counts[result] for result in ("hit", "miss", "refresh")}
+        lookups = sum(counts.values())
+        return {**counts, "hit_rate": round(counts["hit"] / lookups, 4) if lookups else None}
+
+    # Plain access
+
+    def get(self, key, default=None):
+        entry = self.cache.get(self.make_key(key))
+        self._record("miss" if entry is None else "hit")
+        return default if entry is None else entry[0]
+
+    def set(self, key, value, ttl=None):
+        self._store(self.make_key(key), value, ttl, 0.0)
+
+    def _store(self, full_key, value, ttl, delta):
+        ttl = self.ttl if ttl is None else ttl
+        # (value, wall-clock expiry, seconds it took to compute)
+        self.cache.set(full_key, (value, time.time() + ttl, delta), ttl)
+
+    def delete(self, key):
+        self.cache.delete(self.make_key(key))
+
+    def invalidate(self):
+        """Drop every key in the namespace at once"""
+        try:
+            self.cache.incr(self._version_key())
+        except ValueError:
+            self.version()
+
+    # Computed entries
+
+    def _refresh_early(self, entry):
+        _, expires_at, delta = entry
+        if not delta or not self.beta:
+            return False
+        return time.time() - delta * self.beta * math.log(1.0 - random.random()) >= expires_at
+
+    def get_or_set(self, key, compute, ttl=None):
+        """The cached value, or compute() stored for ttl seconds; see the module docstring"""
+        full_key = self.make_key(key)
+        entry = self.cache.get(full_key)
+        if entry is not None and not self._refresh_early(entry):
+            self._record("hit")
+            return entry[0]
+
+        with self._lock:
+            flight = self._flights.setdefault(full_key, threading.Lock())
+        if entry is not None:
+            # Early refresh: one caller recomputes, the rest keep serving the current value
+            if not flight.acquire(blocking=False):
+                self._record("hit")
+                return entry[0]
+        else:
+            flight.acquire()
+            entry = self.cache.get(full_key)
+            if entry is not None:
+                # Filled by the caller we waited for
+                flight.release()
+                self._record("hit")
+                return entry[0]
+        try:
+            self._record("miss" if entry is None else "refresh")
+            started = time.monotonic()
+            value = compute()
+            self._store(full_key, value, ttl, time.monotonic() - started)
+            return value
+        finally:
+            with self._lock:
+                self._flights.pop(full_key, None)
+            flight.release()
+
+
+def namespace(name, ttl=300, alias="default", beta=1.0):
+    """The process-wide Namespace called name (created on first use)"""
+    if name not in NAMESPACES:
+        NAMESPACES[name] = Namespace(name, ttl, alias, beta)
+    return NAMESPACES[name]
+
+
+def all_stats():
+    return {name: ns.stats() for name, ns in sorted(NAMESPACES.items())}
@@ -0,0 +1,54 @@
+"""
+Conditional GET for list endpoints without rendering the list.
+
+A view's get() is wrapped with @conditional(fingerprint). The fingerprint is
+a cheap aggregate over the rows the response is built from (Count and
+Max('updated_at'), say) and returns a tuple of parts. The ETag is a hash of
+the parts, the user and the full path; when the request's If-None-Match
+still matches, a 304 is returned before the list is queried or serialized.
+No Last-Modified is sent: second-resolution dates miss a second write in the
+same second, and deleting a row need not move the newest one. Responses are
+marked private and must be revalidated, since they differ per user.
+"""
+import functools
+import hashlib
+
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import quote_etag
+
+
+def make_etag(*parts):
+    return quote_etag(hashlib.sha1("|".join(map(str, parts)).encode()).hexdigest()[:20])
+
+
+def set_validators(response, etag):
+    """ETag and per-user revalidation headers"""
+    response.headers["ETag"] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    patch_vary_headers(response, ["Authorization"])
+    return response
+
+
+def not_modified(request, etag):
+    """A 304 if the client's copy is current (412 if an If-Match fails), else None"""
+    response = get_conditional_response(request, etag=etag)
+    if response is not None and response.status_code == 304:
+        set_validators(response, etag)
+    return response
+
+
+def conditional(fingerprint):
+    """Decorate a view method; fingerprint(view, request, *args, **kwargs) -> parts"""
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(view, request, *args, **kwargs):
+            parts = fingerprint(view, request, *args, **kwargs)
+            etag = make_etag(request.user.pk, request.get_full_path(), *parts)
+            response = not_modified(request, etag)
+            if response is None:
+                response = method(view, request, *args, **kwargs)
+                if response.status_code == 200:
+                    set_validators(response, etag)
+            return response
+        return wrapper
+    return decorator
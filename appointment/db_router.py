@@ -0,0 +1,101 @@
+"""
+Read-replica routing for list and history endpoints.
+
+Only reads inside a view wrapped with @replica_reads go to the "replica"
+database (configured by DATABASE_REPLICA_URL); everything else, writes
+included, uses "default". A replica trails the primary, so a user who has
+just written something is pinned to the primary for REPLICA_PIN_SECONDS:
+ReplicaPinMiddleware records the pin in the shared cache after any
+successful unsafe request, and replica_reads skips the replica while it
+lasts. Without a replica configured the router is not installed and the
+decorator does nothing.
+"""
+import functools
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+from .cache import namespace
+
+REPLICA = "replica"
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+_use_replica = ContextVar("use_replica", default=False)
+pins = namespace("replica_pins")
+
+
+def replica_configured():
+    return REPLICA in settings.DATABASES
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        return REPLICA if _use_replica.get() else None
+
+    def db_for_write(self, model, **hints):
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases hold the same data
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db != REPLICA
+
+
+def is_pinned(user):
+    return bool(user and user.is_authenticated and pins.get(user.pk))
+
+
+@contextmanager
+def reading_from_replica():
+    token = _use_replica.set(True)
+    try:
+        yield
+    finally:
+        _use_replica.reset(token)
+
+
+def replica_reads(method):
+    """Run a view method's reads on the replica, unless the user wrote recently"""
+    @functools.wraps(method)
+    def wrapper(view, request, *args, **kwargs):
+        if not replica_configured() or is_pinned(request.user):
+            return method(view, request, *args, **kwargs)
+        with reading_from_replica():
+            return method(view, request, *args, **kwargs)
+    return wrapper
+
+
+class ReplicaPinMiddleware:
+    """Pin users to the primary after their writes (see module docstring)"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not replica_configured():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        response = self.get_response(request)
+        self._pin(request, response)
+        return response
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        self._pin(request, response)
+        return response
+
+    def _pin(self, request, response):
+        # DRF copies the authenticated user onto the Django request
+        user = getattr(request, "user", None)
+        if request.method not in SAFE_METHODS and response.status_code < 400 and user and user.is_authenticated:
+            pins.set(user.pk, True, settings.REPLICA_PIN_SECONDS)
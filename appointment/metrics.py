@@ -0,0 +1,251 @@
+"""
+Per-request instrumentation: SQL query count, DB time, total latency and
+time spent in external services (LLM, payment gateway).
+
+Enabled with METRICS_ENABLED. When disabled the middleware removes itself
+from the stack and ``timer()`` is a no-op, so there is no per-request cost.
+
+Queries are counted by an execute wrapper installed on every database
+connection as it is opened, in the thread that owns it (connections are per
+thread). It adds to the timings of the request in the current context, which
+sync_to_async carries into its worker threads, so the async ORM calls of
+async views are counted too; outside a measured request it only looks up the
+context variable.
+
+/metrics is only served to a scraper sending ``Authorization: Bearer
+<METRICS_TOKEN>``; without a token configured it is not exposed at all.
+"""
+import hmac
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import Http404, HttpResponse, HttpResponseForbidden
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+_current_timings = ContextVar("request_timings", default=None)
+
+
+class Histogram:
+    """Cumulative Prometheus-style histogram keyed by a tuple of label values"""
+
+    def __init__(self, name, help_text, label_names, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series = {}
+
+    def observe(self, labels, value):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series["buckets"][i] += 1
+        series["sum"] += value
+        series["count"] += 1
+
+    def _format_labels(self, labels, extra=None):
+        pairs = [f'{name}="{value}"' for name, value in zip(self.label_names, labels)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for labels, series in sorted(self._series.items()):
+            for bound, count in zip(self.buckets, series["buckets"]):
+                le = 'le="%s"' % bound
+                lines.append(f"{self.name}_bucket{self._format_labels(labels, le)} {count}")
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{self._format_labels(labels, le)} {series['count']}")
+            lines.append(f"{self.name}_sum{self._format_labels(labels)} {series['sum']}")
+            lines.append(f"{self.name}_count{self._format_labels(labels)} {series['count']}")
+        return "\n".join(lines)
+
+
+class Counter:
+    """Monotonic Prometheus-style counter keyed by a tuple of label values"""
+
+    def __init__(self, name, help_text, label_names):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self._series = {}
+
+    def inc(self, labels, amount=1):
+        self._series[labels] = self._series.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self._series.items()):
+            pairs = ",".join(f'{name}="{label}"' for name, label in zip(self.label_names, labels))
+            lines.append(f"{self.name}{{{pairs}}} {value}" if pairs else f"{self.name} {value}")
+        return "\n".join(lines)
+
+
+class MetricsRegistry:
+    """Process-wide collection of histograms and counters, safe to update from worker threads"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.histograms = {}
+        self.counters = {}
+
+    def histogram(self, name, help_text, label_names=("view",), buckets=LATENCY_BUCKETS):
+        with self._lock:
+            if name not in self.histograms:
+                self.histograms[name] = Histogram(name, help_text, label_names, buckets)
+            return self.histograms[name]
+
+    def counter(self, name, help_text, label_names=("view",)):
+        with self._lock:
+            if name not in self.counters:
+                self.counters[name] = Counter(name, help_text, label_names)
+            return self.counters[name]
+
+    def observe(self, name, labels, value):
+        with self._lock:
+            self.histograms[name].observe(labels, value)
+
+    def inc(self, name, labels, amount=1):
+        with self._lock:
+            self.counters[name].inc(labels, amount)
+
+    def render(self):
+        with self._lock:
+            metrics = [*self.histograms.values(), *self.counters.values()]
+            return "\n".join(m.render() for m in metrics) + "\n"
+
+    def reset(self):
+        with self._lock:
+            for metric in [*self.histograms.values(), *self.counters.values()]:
+                metric._series.clear()
+
+
+registry = MetricsRegistry()
+registry.histogram("http_request_duration_seconds", "Total request latency per view.")
+registry.histogram("db_query_count", "SQL queries issued per request.", buckets=QUERY_COUNT_BUCKETS)
+registry.histogram("db_query_duration_seconds", "Time spent in SQL per request.")
+registry.histogram(
+    "external_call_duration_seconds",
+    "Time spent waiting on external services per request.",
+    label_names=("view", "component"),
+)
+
+
+class RequestTimings:
+    """Accumulates timings for the request currently being served"""
+
+    def __init__(self):
+        self.query_count = 0
+        self.db_time = 0.0
+        self.components = defaultdict(float)
+
+    def execute_wrapper(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - start
+            self.query_count += 1
+
+
+def _timed_execute(execute, sql, params, many, context):
+    timings = _current_timings.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    return timings.execute_wrapper(execute, sql, params, many, context)
+
+
+@receiver(connection_created)
+def instrument_connection(sender, connection, **kwargs):
+    # The wrapper list outlives reconnects of the same connection object
+    if _timed_execute not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_timed_execute)
+
+
+@contextmanager
+def timer(component):
+    """Attribute the enclosed block's wall time to ``component`` (e.g. "llm")"""
+    timings = _current_timings.get()
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.components[component] += time.perf_counter() - start
+
+
+class QueryTimingMiddleware:
+    """Records per-view query count and latency and adds a Server-Timing header"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, "METRICS_ENABLED", False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        timings = RequestTimings()
+        token = _current_timings.set(timings)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current_timings.reset(token)
+        return self._finish(request, response, timings, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        timings = RequestTimings()
+        token = _current_timings.set(timings)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current_timings.reset(token)
+        return self._finish(request, response, timings, time.perf_counter() - start)
+
+    def _finish(self, request, response, timings, total):
+        match = getattr(request, "resolver_match", None)
+        view = match.view_name if match and match.view_name else "unmatched"
+        if view != "metrics":
+            labels = (view,)
+            registry.observe("http_request_duration_seconds", labels, total)
+            registry.observe("db_query_count", labels, timings.query_count)
+            registry.observe("db_query_duration_seconds", labels, timings.db_time)
+            for component, seconds in timings.components.items():
+                registry.observe("external_call_duration_seconds", (view, component), seconds)
+
+        entries = [f'db;dur={timings.db_time * 1000:.1f};desc="{timings.query_count} queries"']
+        entries += [f"{component};dur={seconds * 1000:.1f}" for component, seconds in timings.components.items()]
+        entries.append(f"total;dur={total * 1000:.1f}")
+        response["Server-Timing"] = ", ".join(entries)
+        return response
+
+
+def metrics_view(request):
+    """Expose collected metrics in the Prometheus text format to holders of METRICS_TOKEN"""
+    token = getattr(settings, "METRICS_TOKEN", "")
+    if not getattr(settings, "METRICS_ENABLED", False) or not token:
+        raise Http404
+    if not hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {token}"):
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render(), content_type="text/plain; version=0.0.4")
@@ -0,0 +1,51 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.middleware.gzip import GZipMiddleware
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+
+class AsyncWhiteNoiseMiddleware(WhiteNoiseMiddleware):
+    """
+    WhiteNoise middleware that can also run in async mode.
+
+    The stock middleware is sync-only, which makes Django push every ASGI
+    request through the single thread-sensitive executor and serializes async
+    views. Here only static file serving is handed to a thread.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response, *args, **kwargs):
+        super().__init__(get_response, *args, **kwargs)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            static_file = self.find_file(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return await sync_to_async(self.serve, thread_sensitive=False)(static_file, request)
+        return await self.get_response(request)
+
+
+class ThresholdGZipMiddleware(GZipMiddleware):
+    """
+    GZipMiddleware (negotiated through Accept-Encoding) that leaves bodies
+    smaller than GZIP_MIN_SIZE alone, where compressing costs more CPU than
+    it saves on the wire, and never buffers server-sent event streams.
+    """
+
+    def process_response(self, request, response):
+        if response.streaming:
+            if response.get("Content-Type", "").startswith("text/event-stream"):
+                return response
+        elif len(response.content) < settings.GZIP_MIN_SIZE:
+            return response
+        return super().process_response(request, response)
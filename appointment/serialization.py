@@ -0,0 +1,90 @@
+"""
+Fast path for read-only list endpoints.
+
+ValuesSerializer builds response rows straight from queryset.values(): no
+model instances and no per-field DRF machinery, only a conversion for the
+columns that are not JSON-native (dates, times, decimals). The output is the
+same as the equivalent ModelSerializer's, so a view can switch without a
+client noticing.
+
+FastJSONRenderer renders with orjson when it is installed and falls back to
+DRF's JSONRenderer otherwise (and for ?indent / browsable requests).
+"""
+from django.conf import settings
+from django.db import models
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # optional dependency
+    orjson = None
+
+
+def _datetime(value):
+    # Same as rest_framework.fields.DateTimeField.to_representation
+    if settings.USE_TZ and timezone.is_aware(value):
+        value = value.astimezone(timezone.get_current_timezone())
+    value = value.isoformat()
+    return value[:-6] + "Z" if value.endswith("+00:00") else value
+
+
+def _isoformat(value):
+    return value.isoformat()
+
+
+def converter_for(model_field):
+    """Function turning a values() cell into its DRF representation, or None if it is JSON-native"""
+    if isinstance(model_field, models.DateTimeField):
+        return _datetime
+    if isinstance(model_field, (models.DateField, models.TimeField)):
+        return _isoformat
+    if isinstance(model_field, models.DecimalField):
+        return str
+    return None
+
+
+class ValuesSerializer:
+    """
+    Read-only serializer for a list of rows: set `model` and `fields` and use
+    ``Serializer(queryset).data``. Subclasses add computed or nested keys in
+    extend(rows).
+    """
+    model = None
+    fields = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if cls.model is not None:
+            cls.converters = [
+                (name, convert) for name in cls.fields
+                if (convert := converter_for(cls.model._meta.get_field(name))) is not None
+            ]
+
+    def __init__(self, queryset):
+        self.queryset = queryset
+
+    def extend(self, rows):
+        pass
+
+    @property
+    def data(self):
+        rows = list(self.queryset.values(*self.fields))
+        for row in rows:
+            for name, convert in self.converters:
+                value = row[name]
+                if value is not None:
+                    row[name] = convert(value)
+        self.extend(rows)
+        return rows
+
+
+class FastJSONRenderer(JSONRenderer):
+    """JSONRenderer that uses orjson when available"""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None or self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        # DRF's encoder covers what orjson does not (Decimal, lazy strings, querysets)
+        return orjson.dumps(data, default=JSONEncoder().default, option=orjson.OPT_NON_STR_KEYS)
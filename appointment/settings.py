@@ -1,6 +1,7 @@
 import os
 from pathlib import Path
 import dj_database_url
+from django.core.exceptions import ImproperlyConfigured
 import environ
 
 
@@ -36,9 +37,12 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "appointment.metrics.QueryTimingMiddleware",
+    "appointment.db_router.ReplicaPinMiddleware",
     "corsheaders.middleware.CorsMiddleware",
     "django.middleware.security.SecurityMiddleware",
-    "whitenoise.middleware.WhiteNoiseMiddleware",
+    "appointment.middleware.AsyncWhiteNoiseMiddleware",
+    "appointment.middleware.ThresholdGZipMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -49,6 +53,14 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = "appointment.urls"
 
+# Responses smaller than this many bytes are sent uncompressed (ThresholdGZipMiddleware)
+GZIP_MIN_SIZE = env.int("GZIP_MIN_SIZE", default=1024)
+
+# Per-request query/latency instrumentation, Server-Timing headers and /metrics
+METRICS_ENABLED = env.bool("METRICS_ENABLED", default=False)
+# Bearer token the Prometheus scraper sends; /metrics is not served without one
+METRICS_TOKEN = env("METRICS_TOKEN", default="")
+
 TEMPLATES = [
     {
         "BACKEND": "django.template.backends.django.DjangoTemplates",
@@ -67,17 +79,53 @@ TEMPLATES = [
 
 WSGI_APPLICATION = "appointment.wsgi.application"
 
-# Database: Uses Render PostgreSQL
-DATABASES = {
-    "default": {
-        "ENGINE": "django.db.backends.postgresql",
-        "NAME": env("DATABASE_NAME"),
-        "USER": env("DATABASE_USER"),
-        "PASSWORD": env("DATABASE_PASSWORD"),
-        "HOST": env("DATABASE_HOST"),
-        "PORT": env("DATABASE_PORT"),
+# Database: Uses Render PostgreSQL, from DATABASE_URL or the DATABASE_* parts
+if env("DATABASE_URL", default=""):
+    DATABASES = {"default": dj_database_url.parse(env("DATABASE_URL"))}
+else:
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.postgresql",
+            "NAME": env("DATABASE_NAME"),
+            "USER": env("DATABASE_USER"),
+            "PASSWORD": env("DATABASE_PASSWORD"),
+            "HOST": env("DATABASE_HOST"),
+            "PORT": env("DATABASE_PORT"),
+        }
     }
-}
+
+# Optional read replica for list and history endpoints (appointment/db_router.py).
+# Users who just wrote read from the primary for REPLICA_PIN_SECONDS.
+if env("DATABASE_REPLICA_URL", default=""):
+    DATABASES["replica"] = dj_database_url.parse(env("DATABASE_REPLICA_URL"))
+    DATABASES["replica"]["TEST"] = {"MIRROR": "default"}
+    DATABASE_ROUTERS = ["appointment.db_router.ReplicaRouter"]
+REPLICA_PIN_SECONDS = env.int("REPLICA_PIN_SECONDS", default=10)
+
+# Connection reuse. Persistent connections (kept DB_CONN_MAX_AGE seconds; 0 closes
+# them after every request) save a TCP + TLS handshake and authentication per request; health checks replace
+# a connection the server dropped before it is used. Under ASGI (set by asgi.py) connections
+# belong to short-lived worker threads and would pile up, so they default to per request.
+# DB_POOL switches PostgreSQL databases to Django's psycopg 3 pool instead, which also
+# suits ASGI (needs `pip install "psycopg[binary,pool]"`; persistent connections are then off).
+RUNNING_ASGI = env.bool("DJANGO_ASGI", default=False)
+DB_POOL = env.bool("DB_POOL", default=False)
+if DB_POOL:
+    try:
+        import psycopg_pool  # noqa: F401
+    except ImportError:
+        raise ImproperlyConfigured('DB_POOL needs psycopg 3 and its pool: pip install "psycopg[binary,pool]"')
+for database in DATABASES.values():
+    database["CONN_HEALTH_CHECKS"] = env.bool("DB_CONN_HEALTH_CHECKS", default=True)
+    if DB_POOL and database["ENGINE"] == "django.db.backends.postgresql":
+        database["CONN_MAX_AGE"] = 0
+        database.setdefault("OPTIONS", {})["pool"] = {
+            "min_size": env.int("DB_POOL_MIN_SIZE", default=2),
+            "max_size": env.int("DB_POOL_MAX_SIZE", default=10),
+            "timeout": env.int("DB_POOL_TIMEOUT", default=10),
+        }
+    else:
+        database["CONN_MAX_AGE"] = env.int("DB_CONN_MAX_AGE", default=0 if RUNNING_ASGI else 60)
 
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
@@ -96,6 +144,49 @@ SIMPLE_JWT = {
     'BLACKLIST_AFTER_ROTATION': True,
 }
 
+# Stateless JWT auth: seconds a full User row stays in the per-process cache
+# (used to reject deactivated accounts). 0 disables the lookup entirely.
+JWT_USER_CACHE_TTL = env.int("JWT_USER_CACHE_TTL", default=60)
+JWT_USER_CACHE_SIZE = env.int("JWT_USER_CACHE_SIZE", default=1024)
+
+# Live queue tracker: how long a long-poll / SSE request may stay open, and how
+# often a waiting request re-reads the queue row to see advances made by other
+# worker processes (advances in the same process wake it immediately). Requests
+# are only held open under ASGI; under WSGI they are answered at once, and SSE
+# clients are told to reconnect every QUEUE_REFRESH_SECONDS.
+QUEUE_LONG_POLL_MAX_SECONDS = env.int("QUEUE_LONG_POLL_MAX_SECONDS", default=25)
+QUEUE_STREAM_MAX_SECONDS = env.int("QUEUE_STREAM_MAX_SECONDS", default=300)
+QUEUE_REFRESH_SECONDS = env.float("QUEUE_REFRESH_SECONDS", default=5)
+
+# Shared cache (appointment/cache.py). CACHE_URL picks the backend:
+# "locmemcache://" keeps entries per worker process, "filecache:///var/tmp/hospital-cache"
+# shares them between the workers on one host, redis:// or pymemcache:// across hosts.
+CACHES = {"default": env.cache("CACHE_URL", default="locmemcache://?max_entries=10000")}
+
+# Read-your-writes pins (ReplicaPinMiddleware) must be seen by whichever worker serves the next read
+if "replica" in DATABASES and CACHES["default"]["BACKEND"].endswith((".LocMemCache", ".DummyCache")):
+    raise ImproperlyConfigured("DATABASE_REPLICA_URL needs a CACHE_URL shared by all workers (not locmemcache://)")
+
+# Seconds cached entries live; writes drop them immediately in the writing process
+# (and, with a shared backend, everywhere). 0 reads the database on every request.
+PROFILE_CACHE_TTL = env.int("PROFILE_CACHE_TTL", default=300)
+CONFIG_CACHE_TTL = env.int("CONFIG_CACHE_TTL", default=60)
+
+# Bookable-hours calendar (appointments/booking_calendar.py): days precomputed
+# from today, and how often a worker rebuilds it to see closures saved elsewhere.
+BOOKING_CALENDAR_DAYS = env.int("BOOKING_CALENDAR_DAYS", default=120)
+BOOKING_CALENDAR_REFRESH_SECONDS = env.int("BOOKING_CALENDAR_REFRESH_SECONDS", default=300)
+
+# Token-bucket throttles (appointments/throttling.py): "<burst>/<period>" per
+# user and scope, refilled continuously. THROTTLE_STORE "local" keeps buckets
+# per process; "cache" shares them through CACHES[THROTTLE_CACHE_ALIAS].
+THROTTLE_RATES = {
+    "chat": env("THROTTLE_CHAT_RATE", default="20/min"),
+    "booking": env("THROTTLE_BOOKING_RATE", default="10/min"),
+}
+THROTTLE_STORE = env("THROTTLE_STORE", default="local")
+THROTTLE_CACHE_ALIAS = env("THROTTLE_CACHE_ALIAS", default="default")
+
 # Static & Media Files (for Render)
 STATIC_URL = "/static/"
 STATIC_ROOT = os.path.join(BASE_DIR, "staticfiles")
@@ -108,6 +199,57 @@ MEDIA_ROOT = os.path.join(BASE_DIR, "media")
 CORS_ALLOWED_ORIGINS = env.list("CORS_ALLOWED_ORIGINS", default=["http://localhost:3000"])
 CSRF_TRUSTED_ORIGINS = CORS_ALLOWED_ORIGINS
 
+# Build the chat assistant at startup (use with `gunicorn --preload` so the
+# index is shared copy-on-write by workers). Otherwise it is built on first chat.
+CHAT_PRELOAD_ASSISTANT = env.bool("CHAT_PRELOAD_ASSISTANT", default=False)
+
+# Chat retention (prune_chat_sessions): sessions idle this long are deleted;
+# sessions over the threshold keep their newest messages and fold the rest
+# into a rolling summary of at most CHAT_SUMMARY_MAX_CHARS.
+CHAT_SESSION_TTL_DAYS = env.int("CHAT_SESSION_TTL_DAYS", default=30)
+CHAT_COMPACT_THRESHOLD = env.int("CHAT_COMPACT_THRESHOLD", default=40)
+CHAT_COMPACT_KEEP = env.int("CHAT_COMPACT_KEEP", default=10)
+CHAT_SUMMARY_MAX_CHARS = env.int("CHAT_SUMMARY_MAX_CHARS", default=2000)
+
+# Prompt packing: estimated-token budget for one Gemini call (instructions,
+# facts, knowledge chunks, history and summary), how many recent messages are
+# read as history candidates, and how many chunks retrieval proposes.
+CHAT_CONTEXT_TOKEN_BUDGET = env.int("CHAT_CONTEXT_TOKEN_BUDGET", default=1500)
+CHAT_HISTORY_MESSAGES = env.int("CHAT_HISTORY_MESSAGES", default=6)
+CHAT_RETRIEVAL_CANDIDATES = env.int("CHAT_RETRIEVAL_CANDIDATES", default=5)
+
+# Answer fee, payment, hours, doctor-list and known-symptom questions from
+# templates instead of calling Gemini (see chat/intents.py).
+CHAT_INTENT_ROUTING = env.bool("CHAT_INTENT_ROUTING", default=True)
+
+# Knowledge base chunking. The file is re-checked at most every
+# CHAT_KNOWLEDGE_RELOAD_SECONDS (0 disables) and only edited sections are re-indexed.
+CHAT_KNOWLEDGE_BASE_PATH = env("CHAT_KNOWLEDGE_BASE_PATH", default=os.path.join(BASE_DIR, "chat", "knowledge_base.txt"))
+CHAT_CHUNK_MAX_CHARS = env.int("CHAT_CHUNK_MAX_CHARS", default=400)
+CHAT_CHUNK_OVERLAP_CHARS = env.int("CHAT_CHUNK_OVERLAP_CHARS", default=100)
+CHAT_KNOWLEDGE_RELOAD_SECONDS = env.int("CHAT_KNOWLEDGE_RELOAD_SECONDS", default=60)
+
+# LLM gateway (chat/llm_gateway.py): at most LLM_MAX_CONCURRENCY model calls
+# per process, each with a deadline that includes waiting for a slot. After
+# LLM_BREAKER_FAILURES consecutive failures calls are rejected for the
+# cool-down and answered from good answers cached for LLM_FALLBACK_CACHE_TTL seconds.
+LLM_MAX_CONCURRENCY = env.int("LLM_MAX_CONCURRENCY", default=8)
+LLM_TIMEOUT_SECONDS = env.float("LLM_TIMEOUT_SECONDS", default=20.0)
+LLM_BREAKER_FAILURES = env.int("LLM_BREAKER_FAILURES", default=5)
+LLM_BREAKER_COOLDOWN_SECONDS = env.float("LLM_BREAKER_COOLDOWN_SECONDS", default=30.0)
+LLM_FALLBACK_CACHE_TTL = env.int("LLM_FALLBACK_CACHE_TTL", default=86400)
+
+# "fake" swaps Gemini for chat/fake_llm.FakeLLM (load tests, local development)
+CHAT_LLM_BACKEND = env("CHAT_LLM_BACKEND", default="gemini")
+CHAT_FAKE_LLM_LATENCY = env.float("CHAT_FAKE_LLM_LATENCY", default=0.5)
+CHAT_FAKE_LLM_ERROR_RATE = env.float("CHAT_FAKE_LLM_ERROR_RATE", default=0.0)
+
+# Estimated LLM tokens (prompt + reply) each user may spend per day; 0 disables
+CHAT_DAILY_TOKEN_QUOTA = env.int("CHAT_DAILY_TOKEN_QUOTA", default=50000)
+
 # Razorpay API Keys (from environment variables)
 RAZORPAY_KEY_ID = env("RAZORPAY_KEY_ID")
 RAZORPAY_KEY_SECRET = env("RAZORPAY_KEY_SECRET")
+
+# Consultation fee in rupees, used for revenue figures on the stats dashboard
+CONSULTATION_FEE = env.int("CONSULTATION_FEE", default=500)
@@ -1,3 +1,11 @@
 from django.contrib import admin
 
+from .models import Closure
+
 # Register your models here.
+
+@admin.register(Closure)
+class ClosureAdmin(admin.ModelAdmin):
+    list_display = ['date', 'department', 'start_hour', 'end_hour', 'reason']
+    list_filter = ['department']
+    date_hierarchy = 'date'
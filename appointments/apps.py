@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class AppointmentsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'appointments'
+
+    def ready(self):
+        # Registers the user-cache, config-cache, profile-cache, calendar rebuild, queue-token and daily-stats signal handlers
+        from . import authentication, booking_calendar, booking_rules, profile_cache, queue_tracker, stats  # noqa: F401
@@ -0,0 +1,226 @@
+import asyncio
+import json
+import logging
+from contextlib import asynccontextmanager
+from datetime import date
+
+import httpx
+import razorpay
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.shortcuts import aget_object_or_404
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+
+from appointment.metrics import timer
+from . import queue_tracker
+from .authentication import async_jwt_required
+from .models import Appointment
+from .views import razorpay_client
+
+logger = logging.getLogger(__name__)
+
+RAZORPAY_ORDERS_URL = "https://api.razorpay.com/v1/orders"
+
+# (event loop, client): one pooled client for the ASGI server's event loop so
+# concurrent orders reuse TLS connections
+_shared_client = None
+
+
+def _new_http_client():
+    return httpx.AsyncClient(auth=(settings.RAZORPAY_KEY_ID, settings.RAZORPAY_KEY_SECRET), timeout=httpx.Timeout(10.0))
+
+
+def _http_client():
+    """The shared client, replacing one left behind on an earlier (closed) event loop"""
+    global _shared_client
+    loop = asyncio.get_running_loop()
+    if _shared_client is None or _shared_client[0] is not loop:
+        _shared_client = (loop, _new_http_client())
+    return _shared_client[1]
+
+
+@asynccontextmanager
+async def _razorpay_http(request):
+    if isinstance(request, ASGIRequest):
+        yield _http_client()
+    else:
+        # Under WSGI every async view runs in a fresh event loop, so the client lives for the request
+        async with _new_http_client() as client:
+            yield client
+
+
+def _json_body(request):
+    try:
+        return json.loads(request.body or b"{}")
+    except ValueError:
+        return None
+
+
+@csrf_exempt
+@require_POST
+@async_jwt_required
+async def create_razorpay_order_async(request):
+    """Async variant of create_razorpay_order using the async ORM and an async HTTP client"""
+    data = _json_body(request)
+    if data is None:
+        return JsonResponse({"error": "Invalid JSON body"}, status=400)
+
+    amount = data.get("amount")
+    appointment_id = data.get("appointment_id")
+
+    if not amount or not str(amount).isdigit() or int(amount) <= 0:
+        return JsonResponse({"error": "Invalid amount"}, status=400)
+
+    if not appointment_id:
+        return JsonResponse({"error": "Appointment ID is required"}, status=400)
+
+    appointment = await Appointment.objects.filter(id=appointment_id, user=request.user).afirst()
+    if appointment is None:
+        return JsonResponse({"error": "Invalid appointment"}, status=404)
+
+    if appointment.payment_status == "Paid":
+        return JsonResponse({"error": "Appointment is already paid for"}, status=400)
+
+    amount = int(amount) * 100  # Convert to paise
+    currency = "INR"
+
+    try:
+        with timer("payment"):
+            async with _razorpay_http(request) as http:
+                response = await http.post(
+                    RAZORPAY_ORDERS_URL,
+                    json={"amount": amount, "currency": currency, "payment_capture": "1"},
+                )
+    except httpx.HTTPError as e:
+        logger.error(f"Error reaching Razorpay: {str(e)}")
+        return JsonResponse({"error": "Razorpay server error. Please try again later."}, status=503)
+
+    if response.status_code >= 500:
+        return JsonResponse({"error": "Razorpay server error. Please try again later."}, status=503)
+    if response.status_code >= 400:
+        try:
+            description = response.json()["error"]["description"]
+        except (ValueError, KeyError, TypeError):
+            description = response.text
+        return JsonResponse({"error": f"Razorpay error: {description}"}, status=400)
+
+    razorpay_order = response.json()
+
+    # Store order ID but DO NOT finalize booking yet
+    appointment.payment_id = razorpay_order.get("id")
+    appointment.payment_status = "Pending"
+    await appointment.asave(update_fields=["payment_id", "payment_status"])
+
+    return JsonResponse({
+        "order_id": razorpay_order.get("id", ""),
+        "amount": amount,
+        "currency": currency,
+        "status": razorpay_order.get("status", "failed")
+    })
+
+
+@csrf_exempt
+@require_POST
+@async_jwt_required
+async def verify_payment_async(request):
+    """Async variant of verify_payment; signature checking is local so only the DB is awaited"""
+    data = _json_body(request)
+    if data is None:
+        return JsonResponse({"error": "Invalid JSON body"}, status=400)
+
+    order_id = data.get("order_id")
+    payment_id = data.get("payment_id")
+    signature = data.get("signature")
+
+    if not order_id or not payment_id or not signature:
+        return JsonResponse({"error": "Missing payment details"}, status=400)
+
+    appointment = await aget_object_or_404(Appointment, payment_id=order_id, user=request.user)
+
+    try:
+        razorpay_client.utility.verify_payment_signature({
+            'razorpay_order_id': order_id,
+            'razorpay_payment_id': payment_id,
+            'razorpay_signature': signature
+        })
+    except razorpay.errors.SignatureVerificationError:
+        return JsonResponse({"error": "Payment verification failed"}, status=400)
+
+    appointment.payment_status = "Paid"
+    await appointment.asave(update_fields=["payment_status"])
+
+    appointment_data = {
+        "name": appointment.name,
+        "age": appointment.age,
+        "date": appointment.date,
+        "department": appointment.department,
+        "doctor": appointment.doctor,
+        "token_number": appointment.token_number,
+    }
+    return JsonResponse({"message": "Payment successful", "appointment": appointment_data}, status=200)
+
+
+# Live queue
+
+def _holds_requests(request):
+    # An open request only costs a coroutine under ASGI; under WSGI it would tie up a worker thread
+    return isinstance(request, ASGIRequest)
+
+
+async def _queued_appointment(request, appointment_id):
+    return await (
+        Appointment.objects.active().only("id", "date", "department", "token_number")
+        .filter(id=appointment_id, user=request.user).afirst()
+    )
+
+
+@require_GET
+@async_jwt_required
+async def queue_status(request, appointment_id):
+    """
+    Position and estimated wait for one of the user's appointments.
+    Long-poll with ?version=<last seen>&wait=<seconds>: under ASGI the request is
+    held until the queue advances past that version or the wait runs out; under
+    WSGI it is answered at once and the client polls again.
+    """
+    appointment = await _queued_appointment(request, appointment_id)
+    if appointment is None:
+        return JsonResponse({"detail": "Not found."}, status=404)
+    try:
+        known_version = int(request.GET.get("version", -1))
+        wait = float(request.GET.get("wait", 0))
+    except ValueError:
+        return JsonResponse({"error": "version and wait must be numbers"}, status=400)
+
+    wait = max(0, min(wait, settings.QUEUE_LONG_POLL_MAX_SECONDS)) if _holds_requests(request) else 0
+    if wait and appointment.date == date.today():
+        queue = await queue_tracker.wait_for_change(appointment.department, appointment.date, known_version, wait)
+    else:
+        queue = await queue_tracker.aget_queue(appointment.department, appointment.date)
+    return JsonResponse(await queue_tracker.asnapshot(appointment, queue))
+
+
+@require_GET
+@async_jwt_required
+async def queue_stream(request, appointment_id):
+    """
+    Server-sent events: pushes the queue snapshot every time the department advances.
+    Under WSGI one snapshot is sent with a retry hint, so EventSource reconnects
+    every QUEUE_REFRESH_SECONDS instead of holding a worker thread.
+    """
+    appointment = await _queued_appointment(request, appointment_id)
+    if appointment is None:
+        return JsonResponse({"detail": "Not found."}, status=404)
+
+    if _holds_requests(request):
+        response = StreamingHttpResponse(queue_tracker.event_stream(appointment), content_type="text/event-stream")
+        response["X-Accel-Buffering"] = "no"  # stop nginx from buffering the stream
+    else:
+        queue = await queue_tracker.aget_queue(appointment.department, appointment.date)
+        snapshot = await queue_tracker.asnapshot(appointment, queue)
+        retry = None if queue_tracker.is_final(snapshot) else int(settings.QUEUE_REFRESH_SECONDS * 1000)
+        response = HttpResponse(queue_tracker.sse_event(snapshot, retry), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    return response
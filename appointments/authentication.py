@@ -0,0 +1,137 @@
+import functools
+import threading
+import time
+from collections import OrderedDict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.http import JsonResponse
+from rest_framework.exceptions import APIException
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+
+class UserCache:
+    """Small in-process LRU of full User rows with a short TTL"""
+
+    def __init__(self, max_size=1024, ttl=60):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.ttl > 0 and self.max_size > 0
+
+    def get(self, user_id):
+        """Return the cached User for user_id, loading it from the DB on a miss"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry and entry[1] > now:
+                self._entries.move_to_end(user_id)
+                return entry[0]
+
+        user = User.objects.filter(id=user_id).first()
+        if user is None:
+            return None
+
+        with self._lock:
+            self._entries[user_id] = (user, now + self.ttl)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return user
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+user_cache = UserCache(
+    max_size=getattr(settings, "JWT_USER_CACHE_SIZE", 1024),
+    ttl=getattr(settings, "JWT_USER_CACHE_TTL", 60),
+)
+
+
+def build_token_user(validated_token, is_staff=None):
+    """Build an unsaved-looking User instance from token claims without a query"""
+    user = User(
+        id=validated_token[api_settings.USER_ID_CLAIM],
+        username=validated_token.get("username", ""),
+        is_active=True,
+        is_staff=validated_token.get("is_staff", False) if is_staff is None else is_staff,
+    )
+    # Mark the instance as loaded so it behaves like a fetched row in FK
+    # assignments and filters (e.g. Appointment.objects.filter(user=user)).
+    user._state.adding = False
+    user._state.db = DEFAULT_DB_ALIAS
+    return user
+
+
+class StatelessJWTAuthentication(JWTAuthentication):
+    """
+    JWT authentication that attaches a lightweight user built from the token
+    claims instead of loading the User row on every request.
+
+    When the user cache is enabled (JWT_USER_CACHE_TTL > 0) the full User is
+    looked up through the in-process LRU so deactivated accounts are still
+    rejected, costing at most one query per user per TTL window.
+    """
+
+    def get_user(self, validated_token):
+        if api_settings.USER_ID_CLAIM not in validated_token:
+            raise InvalidToken("Token contained no recognizable user identification")
+
+        if user_cache.enabled:
+            user = user_cache.get(validated_token[api_settings.USER_ID_CLAIM])
+            if user is None:
+                raise AuthenticationFailed("User not found", code="user_not_found")
+            if not user.is_active:
+                raise AuthenticationFailed("User is inactive", code="user_inactive")
+            # Prefer the cached flag over the claim so revoked staff access applies within the TTL
+            return build_token_user(validated_token, is_staff=user.is_staff)
+
+        return build_token_user(validated_token)
+
+
+def async_jwt_required(view_func):
+    """
+    Authenticate an async (non-DRF) view with StatelessJWTAuthentication.
+
+    Sets request.user/request.auth on success and answers 401 otherwise. The
+    authenticator may hit the user cache, so it runs via sync_to_async.
+    """
+    @functools.wraps(view_func)
+    async def wrapper(request, *args, **kwargs):
+        authenticator = StatelessJWTAuthentication()
+        try:
+            result = await sync_to_async(authenticator.authenticate)(request)
+        except APIException as exc:
+            return JsonResponse({"detail": exc.detail}, status=exc.status_code)
+        if result is None:
+            return JsonResponse({"detail": "Authentication credentials were not provided."}, status=401)
+        request.user, request.auth = result
+        return await view_func(request, *args, **kwargs)
+    return wrapper
+
+
+@receiver(post_save, sender=User)
+def invalidate_cached_user(sender, instance, **kwargs):
+    # Any save may flip is_active; drop the entry so the next request re-reads it
+    user_cache.invalidate(instance.id)
+
+
+@receiver(post_delete, sender=User)
+def evict_deleted_user(sender, instance, **kwargs):
+    user_cache.invalidate(instance.id)
@@ -0,0 +1,152 @@
+"""
+Bookable-hours calendar.
+
+For each of the next BOOKING_CALENDAR_DAYS days the calendar holds a 24-bit
+mask per department (bit h set = a slot starting at hour h can be booked),
+built from the fixed weekly rules (closed Sundays, lunch hour) and the
+Closure table. Departments without closures of their own share the
+hospital-wide masks. Booking rules then answer "is this hour open?" with a
+list index and a bit test instead of date arithmetic and queries.
+
+The masks are rebuilt lazily: when a Closure is saved or deleted in this
+process, when the day rolls over, and at least every
+BOOKING_CALENDAR_REFRESH_SECONDS so other workers pick up closures too.
+Built masks are kept in the "availability" namespace of the shared cache,
+so with a shared backend one worker queries Closure per refresh and the rest
+load its result; saving a Closure invalidates the namespace. Dates past the
+horizon are computed on demand with one query.
+"""
+import threading
+import time
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from appointment.cache import namespace
+from .models import Closure
+
+availability = namespace("availability")
+
+HOURS_PER_DAY = 24
+FULL_DAY = (1 << HOURS_PER_DAY) - 1
+SUNDAY = 6
+LUNCH_HOUR = 13
+
+
+def weekly_mask(day):
+    """Hours open by the fixed weekly rules: every hour but lunch, never on Sundays"""
+    return 0 if day.weekday() == SUNDAY else FULL_DAY & ~(1 << LUNCH_HOUR)
+
+
+def closure_bits(start_hour, end_hour):
+    if start_hour is None:
+        return FULL_DAY
+    return ((1 << end_hour) - 1) & ~((1 << start_hour) - 1)
+
+
+def closures_on(day, department=None):
+    """Closures affecting a department (or the whole hospital) on one day"""
+    departments = Q(department='') | Q(department=department) if department else Q(department='')
+    return Closure.objects.filter(departments, date=day)
+
+
+class BookableCalendar:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._start = None
+        self._days = 0
+        self._masks = {}  # department ('' = hospital-wide) -> [mask per day from _start]
+        self._built_at = None
+
+    @staticmethod
+    def compute(start, days):
+        """Masks per department for `days` days from start (one query)"""
+        closures = list(
+            Closure.objects.filter(date__gte=start, date__lt=start + timedelta(days=days))
+            .values_list('date', 'department', 'start_hour', 'end_hour')
+        )
+        base = [weekly_mask(start + timedelta(days=i)) for i in range(days)]
+        masks = {'': base}
+        for department in {department for _, department, _, _ in closures if department}:
+            masks[department] = list(base)
+        for day, department, start_hour, end_hour in closures:
+            index, bits = (day - start).days, closure_bits(start_hour, end_hour)
+            # A hospital-wide closure closes every department; a department closure only its own
+            for mask in (masks.values() if not department else [masks[department]]):
+                mask[index] &= ~bits
+        return masks
+
+    def rebuild(self, shared=False):
+        """Recompute the masks; shared=True takes them from the shared cache when another worker already has"""
+        days, start = settings.BOOKING_CALENDAR_DAYS, date.today()
+        if shared:
+            masks = availability.get_or_set(
+                f"{start}:{days}", lambda: self.compute(start, days), settings.BOOKING_CALENDAR_REFRESH_SECONDS,
+            )
+        else:
+            masks = self.compute(start, days)
+            availability.set(f"{start}:{days}", masks, settings.BOOKING_CALENDAR_REFRESH_SECONDS)
+
+        with self._lock:
+            self._start, self._days, self._masks = start, days, masks
+            self._built_at = time.monotonic()
+
+    def invalidate(self):
+        with self._lock:
+            self._built_at = None
+
+    def _fresh(self):
+        built_at = self._built_at
+        return (
+            built_at is not None
+            and self._start == date.today()
+            and time.monotonic() - built_at < settings.BOOKING_CALENDAR_REFRESH_SECONDS
+        )
+
+    def day_mask(self, day, department=None):
+        if not self._fresh():
+            self.rebuild(shared=True)
+        start, days, masks = self._start, self._days, self._masks
+        index = (day - start).days
+        if 0 <= index < days:
+            return masks.get(department or '', masks[''])[index]
+        # Outside the precomputed window
+        mask = weekly_mask(day)
+        for start_hour, end_hour in closures_on(day, department).values_list('start_hour', 'end_hour'):
+            mask &= ~closure_bits(start_hour, end_hour)
+        return mask
+
+    def is_open(self, day, department=None):
+        return self.day_mask(day, department) != 0
+
+    def is_bookable(self, day, hour, department=None):
+        return bool(self.day_mask(day, department) >> hour & 1)
+
+    def open_hours(self, day, department=None):
+        mask = self.day_mask(day, department)
+        return [hour for hour in range(HOURS_PER_DAY) if mask >> hour & 1]
+
+    def reason(self, day, hour=None, department=None):
+        """Why a day (or hour) is closed; only called on the rejection path, so it may query"""
+        for closure in closures_on(day, department):
+            if hour is None or closure.start_hour is None or closure.start_hour <= hour < closure.end_hour:
+                where = closure.department or "The hospital"
+                return f"{where} is closed {'on this day' if closure.start_hour is None else 'at this time'} ({closure.reason})."
+        if day.weekday() == SUNDAY:
+            return "Appointments are not available on Sundays."
+        if hour == LUNCH_HOUR:
+            return "Appointments are not available during lunch break (1 PM to 2 PM)."
+        return "Appointments are not available at this time."
+
+
+calendar = BookableCalendar()
+
+
+@receiver(post_save, sender=Closure)
+@receiver(post_delete, sender=Closure)
+def closure_changed(sender, **kwargs):
+    availability.invalidate()
+    calendar.invalidate()
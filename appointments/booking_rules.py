@@ -0,0 +1,204 @@
+"""
+Booking rules shared by the create, update and waitlist paths.
+
+A rule is a function of the requested slot (and, for capacity rules, a
+SlotSnapshot) that returns an error message or None. Calendar rules run
+first and cost nothing; if they pass, one aggregate query counts the day's
+and the hour's active bookings and the capacity rules run against that
+snapshot. Validating a booking therefore costs at most two queries (the
+config row, usually served from the shared cache, and the snapshot) however
+many rules are registered.
+
+Paths that add bookings to a day (booking, group booking, moving one,
+reschedules, waitlist promotion) check the calendar rules up front and leave
+capacity to reserve() or lock_config() inside their transaction: the config
+row is locked, capacity is checked against a fresh snapshot and tokens are
+numbered while the lock is held, so concurrent bookings cannot overfill an
+hour or share a token.
+
+Opening days and hours come from the precomputed booking calendar (Sundays, the
+lunch hour and Closure rows). Other rules are added with @booking_rule and
+apply to every path without touching the views:
+
+    @booking_rule("time")
+    def within_department_hours(slot, snapshot):
+        if slot.time.hour >= DEPARTMENT_CLOSING.get(slot.department, 24):
+            return "The department is closed at this time."
+"""
+from datetime import date, time
+from typing import Callable, NamedTuple, Optional
+
+from django.conf import settings
+from django.db.models import Count, Max, Q
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from appointment.cache import namespace
+
+from .booking_calendar import calendar
+from .models import Appointment, AppointmentConfig
+
+config_cache = namespace("config")
+
+# Hours a slot can start in (department clinics run 9 AM to 5 PM); used when picking slots, e.g. for reschedules
+BOOKABLE_HOURS = range(9, 17)
+
+
+class BookingSlot(NamedTuple):
+    date: date
+    time: time
+    department: Optional[str] = None
+    exclude_id: Optional[int] = None  # the appointment being moved, not counted against capacity
+    size: int = 1  # bookings requested together for this slot (group booking)
+
+
+class SlotSnapshot(NamedTuple):
+    config: AppointmentConfig
+    daily_count: int
+    hourly_count: int
+
+
+class Violation(NamedTuple):
+    field: str
+    message: str
+
+
+class Rule(NamedTuple):
+    name: str
+    field: str
+    check: Callable
+    needs_snapshot: bool
+
+
+RULES = []
+
+
+def booking_rule(field, needs_snapshot=False):
+    """Register a rule; it runs after the rules registered before it"""
+    def register(check):
+        RULES.append(Rule(check.__name__, field, check, needs_snapshot))
+        return check
+    return register
+
+
+def _load_config():
+    return AppointmentConfig.objects.first() or AppointmentConfig.objects.create()
+
+
+def get_config():
+    """The booking limits, from the shared cache ("config" namespace) for CONFIG_CACHE_TTL seconds"""
+    if settings.CONFIG_CACHE_TTL <= 0:
+        return _load_config()
+    return config_cache.get_or_set("appointment_config", _load_config, settings.CONFIG_CACHE_TTL)
+
+
+@receiver(post_save, sender=AppointmentConfig)
+@receiver(post_delete, sender=AppointmentConfig)
+def config_changed(sender, **kwargs):
+    config_cache.invalidate()
+
+
+def take_snapshot(slot, config=None):
+    """Active bookings on the slot's day and in its hour, in one aggregate query"""
+    hour_start, hour_end = time(hour=slot.time.hour), time(hour=slot.time.hour, minute=59, second=59)
+    bookings = Appointment.objects.active().filter(date=slot.date)
+    if slot.exclude_id is not None:
+        bookings = bookings.exclude(id=slot.exclude_id)
+    counts = bookings.aggregate(
+        daily=Count('id'),
+        hourly=Count('id', filter=Q(time__gte=hour_start, time__lte=hour_end)),
+    )
+    return SlotSnapshot(config or get_config(), counts['daily'], counts['hourly'])
+
+
+def lock_config():
+    """The config row, locked until the end of the current transaction (see the module docstring)"""
+    return AppointmentConfig.objects.select_for_update().first() or AppointmentConfig.objects.create()
+
+
+def next_token(day):
+    """First unused token of the day (cancelled appointments keep theirs); call under lock_config()"""
+    return (Appointment.objects.filter(date=day).aggregate(m=Max('token_number'))['m'] or 0) + 1
+
+
+def reserve(slot):
+    """
+    Lock the config row and re-check capacity for the slot against a fresh snapshot.
+    Returns (violations, first token for the slot's bookings); the token is None when
+    there are violations. Must run inside transaction.atomic().
+    """
+    config = lock_config()
+    violations, _ = evaluate(slot, capacity_rules(), take_snapshot(slot, config))
+    return violations, None if violations else next_token(slot.date)
+
+
+def evaluate(slot, rules=None, snapshot=None):
+    """
+    Violations of `rules` (default: all registered) for a slot, stopping at the first.
+    Returns (violations, snapshot); the snapshot is None when no capacity rule had to run.
+    """
+    rules = RULES if rules is None else rules
+    for rule in rules:
+        if not rule.needs_snapshot:
+            message = rule.check(slot, None)
+            if message:
+                return [Violation(rule.field, message)], snapshot
+    for rule in rules:
+        if rule.needs_snapshot:
+            if snapshot is None:
+                snapshot = take_snapshot(slot)
+            message = rule.check(slot, snapshot)
+            if message:
+                return [Violation(rule.field, message)], snapshot
+    return [], snapshot
+
+
+def calendar_rules():
+    """Rules that need no counts, e.g. for the waitlist (which wants a full hour)"""
+    return [rule for rule in RULES if not rule.needs_snapshot]
+
+
+def capacity_rules():
+    """Rules checked against a SlotSnapshot, e.g. again under a lock"""
+    return [rule for rule in RULES if rule.needs_snapshot]
+
+
+@booking_rule("date")
+def not_in_past(slot, snapshot):
+    if slot.date < date.today():
+        return "Appointment date cannot be in the past."
+
+
+@booking_rule("date")
+def day_is_open(slot, snapshot):
+    # Sundays, holidays and whole-day department closures (see booking_calendar)
+    if not calendar.is_open(slot.date, slot.department):
+        return calendar.reason(slot.date, department=slot.department)
+
+
+@booking_rule("time")
+def hour_is_open(slot, snapshot):
+    # The lunch hour and partial-day closures
+    if not calendar.is_bookable(slot.date, slot.time.hour, slot.department):
+        return calendar.reason(slot.date, slot.time.hour, slot.department)
+
+
+@booking_rule("date", needs_snapshot=True)
+def within_daily_cap(slot, snapshot):
+    if snapshot.daily_count + slot.size > snapshot.config.max_daily_appointments:
+        if slot.size > 1:
+            left = max(snapshot.config.max_daily_appointments - snapshot.daily_count, 0)
+            return f"Only {left} appointment(s) left on this day for {slot.size} patients."
+        return f"Maximum appointments ({snapshot.config.max_daily_appointments}) for this day have been reached."
+
+
+@booking_rule("time", needs_snapshot=True)
+def within_hourly_cap(slot, snapshot):
+    if snapshot.hourly_count + slot.size > snapshot.config.max_per_hour:
+        if slot.size > 1:
+            left = max(snapshot.config.max_per_hour - snapshot.hourly_count, 0)
+            return f"Only {left} appointment(s) left in this hour for {slot.size} patients."
+        return (
+            f"Maximum appointments ({snapshot.config.max_per_hour}) for this hour have been reached. "
+            "Please select a different time."
+        )
@@ -0,0 +1,55 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from appointments import stats
+from appointments.models import Appointment, ArchivedAppointment
+
+ARCHIVED_FIELDS = [
+    "id", "user_id", "name", "age", "sex", "date", "time", "department", "doctor", "token_number",
+    "payment_id", "payment_status", "status", "cancelled_at", "created_at",
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Move appointments dated more than --days days ago from the hot Appointment table into "
+        "ArchivedAppointment, one batch per transaction. Safe to re-run and to interrupt."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=90, help="Archive appointments older than this many days")
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument("--dry-run", action="store_true", help="Only report how many rows would move")
+
+    def handle(self, *args, **options):
+        if options["days"] < 1 or options["batch_size"] < 1:
+            raise CommandError("--days and --batch-size must be positive")
+
+        cutoff = date.today() - timedelta(days=options["days"])
+        candidates = Appointment.objects.filter(date__lt=cutoff)
+        if options["dry_run"]:
+            self.stdout.write(f"{candidates.count()} appointments dated before {cutoff} would be archived")
+            return
+
+        moved = 0
+        while True:
+            with transaction.atomic():
+                # Lock the batch so a concurrent payment/cancel cannot change a row mid-copy
+                rows = list(
+                    candidates.select_for_update().order_by("id").values(*ARCHIVED_FIELDS)[:options["batch_size"]]
+                )
+                if not rows:
+                    break
+                ids = [row["id"] for row in rows]
+                ArchivedAppointment.objects.bulk_create(
+                    [ArchivedAppointment(original_id=row.pop("id"), **row) for row in rows],
+                    ignore_conflicts=True,  # rows copied by an earlier, interrupted run
+                )
+                with stats.archiving():
+                    Appointment.objects.filter(id__in=ids).delete()
+            moved += len(rows)
+            self.stdout.write(f"archived {moved} appointments")
+
+        self.stdout.write(self.style.SUCCESS(f"Archived {moved} appointments dated before {cutoff}"))
@@ -0,0 +1,40 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max, Min
+
+from appointments import stats
+from appointments.models import Appointment, ArchivedAppointment
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the DailyStats rollup from live and archived appointments, one chunk of days per "
+        "transaction. Defaults to every date that has appointments."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--start", type=date.fromisoformat)
+        parser.add_argument("--end", type=date.fromisoformat)
+        parser.add_argument("--chunk-days", type=int, default=31)
+
+    def handle(self, *args, **options):
+        if options["chunk_days"] < 1:
+            raise CommandError("--chunk-days must be positive")
+
+        bounds = [model.objects.aggregate(first=Min("date"), last=Max("date")) for model in (Appointment, ArchivedAppointment)]
+        start = options["start"] or min((b["first"] for b in bounds if b["first"]), default=None)
+        end = options["end"] or max((b["last"] for b in bounds if b["last"]), default=None)
+        if start is None or end is None:
+            self.stdout.write("No appointments to aggregate")
+            return
+        if start > end:
+            raise CommandError("--start must not be after --end")
+
+        rows = 0
+        chunk_start = start
+        while chunk_start <= end:
+            chunk_end = min(chunk_start + timedelta(days=options["chunk_days"] - 1), end)
+            rows += stats.rebuild(chunk_start, chunk_end)
+            chunk_start = chunk_end + timedelta(days=1)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {rows} DailyStats rows for {start}..{end}"))
@@ -0,0 +1,266 @@
+import json
+import os
+import random
+import subprocess
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.db.models.functions import ExtractHour
+from django.test import Client, override_settings
+from django.urls import reverse
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from appointments.models import Appointment, AppointmentConfig
+
+BENCH_USER_PREFIX = "bench_user_"
+BOOKING_HOURS = [9, 10, 11, 12, 14, 15, 16, 17]
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(int(round(pct / 100.0 * len(sorted_values))) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+def booking_days(count):
+    days = []
+    day = date.today() + timedelta(days=1)
+    while len(days) < count:
+        if day.weekday() != 6:
+            days.append(day)
+        day += timedelta(days=1)
+    return days
+
+
+class Command(BaseCommand):
+    help = (
+        "Fire concurrent booking, reschedule and cancel requests through the API and report "
+        "throughput, latency percentiles, overbooking violations and duplicate tokens. "
+        "Writes to the configured database, so run it against a local DB."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=8, help="Concurrent client threads")
+        parser.add_argument("--requests", type=int, default=200, help="Total requests to send")
+        parser.add_argument("--users", type=int, default=20, help="Number of benchmark accounts")
+        parser.add_argument("--days", type=int, default=2, help="Number of upcoming days to book into")
+        parser.add_argument("--mix", default="book=0.7,reschedule=0.2,cancel=0.1",
+                            help="Workload mix as op=weight pairs")
+        parser.add_argument("--seed", type=int, default=42)
+        parser.add_argument("--output", help="JSON results path (default: bench_results/booking-<commit>.json)")
+        parser.add_argument("--keep", action="store_true", help="Keep benchmark users and appointments")
+        parser.add_argument("--throttle", action="store_true",
+                            help="Keep the booking throttle on (off by default: it caps each user at THROTTLE_RATES)")
+
+    def handle(self, *args, **options):
+        if connection.vendor == "sqlite" and connection.settings_dict["NAME"] in ("", ":memory:"):
+            raise CommandError("An in-memory SQLite database cannot be shared between worker threads.")
+
+        mix = self._parse_mix(options["mix"])
+        rng = random.Random(options["seed"])
+        config = AppointmentConfig.objects.first() or AppointmentConfig.objects.create()
+        days = booking_days(options["days"])
+
+        users = self._create_users(options["users"])
+        tokens = {user.id: self._access_token(user) for user in users}
+        workload = [
+            (rng.choices(list(mix), weights=list(mix.values()))[0], rng.choice(users).id)
+            for _ in range(options["requests"])
+        ]
+
+        self.days = days
+        self.rng_lock = threading.Lock()
+        self.rng = rng
+        self.owned = defaultdict(list)  # user id -> appointment ids booked during the run
+        self.local = threading.local()
+        self.host = next((h for h in settings.ALLOWED_HOSTS if h != "*" and not h.startswith(".")), "localhost")
+
+        results = defaultdict(lambda: {"latencies": [], "statuses": defaultdict(int)})
+        results_lock = threading.Lock()
+
+        def run(op_and_user):
+            op, user_id = op_and_user
+            op, elapsed, status_code = self._run_op(op, user_id, tokens[user_id])
+            with results_lock:
+                # Throttled requests never reach the booking code; keep them out of the latencies
+                if status_code != 429:
+                    results[op]["latencies"].append(elapsed)
+                results[op]["statuses"][str(status_code)] += 1
+
+        throttle_rates = settings.THROTTLE_RATES if options["throttle"] else {**settings.THROTTLE_RATES, "booking": None}
+        started = time.perf_counter()
+        try:
+            with override_settings(THROTTLE_RATES=throttle_rates), \
+                    ThreadPoolExecutor(max_workers=options["workers"]) as pool:
+                list(pool.map(run, workload))
+            wall_time = time.perf_counter() - started
+            report = self._build_report(options, config, days, results, wall_time)
+        finally:
+            if not options["keep"]:
+                User.objects.filter(username__startswith=BENCH_USER_PREFIX).delete()
+
+        output = options["output"] or os.path.join("bench_results", f"booking-{report['commit'] or 'unknown'}.json")
+        os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+        with open(output, "w") as f:
+            json.dump(report, f, indent=2)
+
+        self._print_report(report)
+        self.stdout.write(self.style.SUCCESS(f"Results written to {output}"))
+
+    def _parse_mix(self, value):
+        mix = {}
+        for pair in value.split(","):
+            op, _, weight = pair.partition("=")
+            if op not in ("book", "reschedule", "cancel"):
+                raise CommandError(f"Unknown operation in --mix: {op}")
+            mix[op] = float(weight or 1)
+        return mix
+
+    def _create_users(self, count):
+        User.objects.filter(username__startswith=BENCH_USER_PREFIX).delete()
+        User.objects.bulk_create([User(username=f"{BENCH_USER_PREFIX}{i}") for i in range(count)])
+        return list(User.objects.filter(username__startswith=BENCH_USER_PREFIX))
+
+    def _access_token(self, user):
+        refresh = RefreshToken.for_user(user)
+        refresh["username"] = user.username
+        return str(refresh.access_token)
+
+    def _client(self):
+        if not hasattr(self.local, "client"):
+            # Server errors are recorded as 500s rather than aborting the run
+            self.local.client = Client(HTTP_HOST=self.host, raise_request_exception=False)
+        return self.local.client
+
+    def _random_slot(self):
+        with self.rng_lock:
+            return self.rng.choice(self.days), self.rng.choice(BOOKING_HOURS)
+
+    def _take_owned(self, user_id, remove):
+        with self.rng_lock:
+            ids = self.owned[user_id]
+            if not ids:
+                return None
+            index = self.rng.randrange(len(ids))
+            return ids.pop(index) if remove else ids[index]
+
+    def _run_op(self, op, user_id, token):
+        client = self._client()
+        headers = {"HTTP_AUTHORIZATION": f"Bearer {token}"}
+        day, hour = self._random_slot()
+
+        appointment_id = None
+        if op in ("reschedule", "cancel"):
+            appointment_id = self._take_owned(user_id, remove=(op == "cancel"))
+            if appointment_id is None:
+                op = "book"
+
+        start = time.perf_counter()
+        if op == "book":
+            response = client.post(
+                reverse("create-appointment"),
+                {"name": "Bench Patient", "age": 30, "sex": "O", "date": day.isoformat(),
+                 "time": f"{hour:02d}:00", "department": "General Medicine", "doctor": "Bench"},
+                content_type="application/json", **headers,
+            )
+        elif op == "reschedule":
+            response = client.put(
+                reverse("update-appointment"),
+                {"id": appointment_id, "date": day.isoformat(), "time": f"{hour:02d}:30"},
+                content_type="application/json", **headers,
+            )
+        else:
+            response = client.delete(reverse("cancel-appointment", args=[appointment_id]), **headers)
+        elapsed = time.perf_counter() - start
+
+        if op == "book" and response.status_code == 201:
+            with self.rng_lock:
+                self.owned[user_id].append(response.json()["id"])
+        return op, elapsed, response.status_code
+
+    def _build_report(self, options, config, days, results, wall_time):
+        operations = {}
+        total = throttled = 0
+        for op, data in results.items():
+            latencies = sorted(data["latencies"])
+            total += len(latencies)
+            throttled += data["statuses"].get("429", 0)
+            operations[op] = {
+                "count": len(latencies),
+                "throttled": data["statuses"].get("429", 0),
+                "throughput_per_sec": round(len(latencies) / wall_time, 2) if wall_time else None,
+                **{f"p{pct}_ms": round(percentile(latencies, pct) * 1000, 2) if latencies else None
+                   for pct in (50, 95, 99)},
+                "statuses": dict(data["statuses"]),
+            }
+
+        day_appointments = Appointment.objects.active().filter(date__in=days)
+        daily_overbooked = list(
+            day_appointments.values("date").annotate(n=Count("id"))
+            .filter(n__gt=config.max_daily_appointments).values_list("date", "n")
+        )
+        hourly_overbooked = list(
+            day_appointments.annotate(hour=ExtractHour("time")).values("date", "hour").annotate(n=Count("id"))
+            .filter(n__gt=config.max_per_hour).values_list("date", "hour", "n")
+        )
+        duplicate_tokens = list(
+            day_appointments.values("date", "token_number").annotate(n=Count("id"))
+            .filter(n__gt=1).values_list("date", "token_number", "n")
+        )
+
+        return {
+            "commit": self._git_commit(),
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "database": connection.vendor,
+            "parameters": {k: options[k] for k in ("workers", "requests", "users", "days", "mix", "seed", "throttle")},
+            "config": {"max_daily_appointments": config.max_daily_appointments, "max_per_hour": config.max_per_hour},
+            "wall_time_sec": round(wall_time, 3),
+            "throughput_per_sec": round(total / wall_time, 2) if wall_time else None,
+            "throttled": throttled,
+            "operations": operations,
+            "violations": {
+                "daily_overbooked": [{"date": str(d), "count": n} for d, n in daily_overbooked],
+                "hourly_overbooked": [{"date": str(d), "hour": h, "count": n} for d, h, n in hourly_overbooked],
+                "duplicate_tokens": [{"date": str(d), "token": t, "count": n} for d, t, n in duplicate_tokens],
+            },
+        }
+
+    def _git_commit(self):
+        try:
+            return subprocess.run(
+                ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+                cwd=settings.BASE_DIR,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    def _print_report(self, report):
+        self.stdout.write(f"Commit {report['commit']} on {report['database']}: "
+                          f"{report['throughput_per_sec']} req/s over {report['wall_time_sec']}s")
+        for op, stats in sorted(report["operations"].items()):
+            self.stdout.write(
+                f"  {op:<10} n={stats['count']:<5} {stats['throughput_per_sec']:>8} req/s  "
+                f"p50={stats['p50_ms']}ms p95={stats['p95_ms']}ms p99={stats['p99_ms']}ms  "
+                f"throttled={stats['throttled']}  {stats['statuses']}"
+            )
+        if report["throttled"]:
+            self.stdout.write(self.style.WARNING(
+                f"  {report['throttled']} requests were throttled (429) and are excluded from the figures"
+            ))
+        violations = report["violations"]
+        style = self.style.ERROR if any(violations.values()) else self.style.SUCCESS
+        self.stdout.write(style(
+            f"  overbooked days={len(violations['daily_overbooked'])} "
+            f"overbooked hours={len(violations['hourly_overbooked'])} "
+            f"duplicate tokens={len(violations['duplicate_tokens'])}"
+        ))
@@ -0,0 +1,120 @@
+import json
+import os
+import time
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connections
+from django.db.backends.signals import connection_created
+from django.test import Client
+from django.urls import reverse
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from appointments.models import Appointment
+
+from .bench_booking import percentile
+
+BENCH_USERNAME = "bench_db_connections"
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure per-request latency of the appointment list with a new database connection per "
+        "request (CONN_MAX_AGE=0) against a persistent connection, and count the connections opened. "
+        "Run it against the real database: the cost being measured is the connection setup."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=300, help="Requests per case")
+        parser.add_argument("--appointments", type=int, default=20, help="Appointments in the listed account")
+        parser.add_argument("--max-age", type=int, default=600, help="CONN_MAX_AGE of the persistent case")
+        parser.add_argument("--output", help="Optional JSON results path")
+
+    def handle(self, *args, **options):
+        db = connections["default"]
+        if db.vendor == "sqlite" and db.settings_dict["NAME"] in ("", ":memory:"):
+            raise CommandError("An in-memory SQLite database does not survive closing the connection.")
+
+        user = self._create_rows(options["appointments"])
+        refresh = RefreshToken.for_user(user)
+        refresh["username"] = user.username
+        headers = {"HTTP_AUTHORIZATION": f"Bearer {refresh.access_token}"}
+        host = next((h for h in settings.ALLOWED_HOSTS if h != "*" and not h.startswith(".")), "localhost")
+        client = Client(HTTP_HOST=host)
+        url = reverse("view-appointment")
+
+        original_max_age = db.settings_dict["CONN_MAX_AGE"]
+        results = {}
+        try:
+            for name, max_age in (("per_request", 0), ("persistent", options["max_age"])):
+                db.close()
+                db.settings_dict["CONN_MAX_AGE"] = max_age
+                results[name] = self._measure(client, url, headers, options["requests"])
+        finally:
+            db.close()
+            db.settings_dict["CONN_MAX_AGE"] = original_max_age
+            User.objects.filter(username=BENCH_USERNAME).delete()
+
+        report = {
+            "database": db.vendor,
+            "pool": bool(db.settings_dict.get("OPTIONS", {}).get("pool")),
+            "parameters": {k: options[k] for k in ("requests", "appointments", "max_age")},
+            "cases": results,
+        }
+        self.stdout.write(f"{report['database']} (pool: {report['pool']}), {options['requests']} requests per case")
+        for name, result in results.items():
+            self.stdout.write(
+                f"  {name:<12} p50={result['p50_ms']}ms p95={result['p95_ms']}ms "
+                f"mean={result['mean_ms']}ms  connections opened={result['connections_opened']}"
+            )
+        saved = results["per_request"]["mean_ms"] - results["persistent"]["mean_ms"]
+        self.stdout.write(self.style.SUCCESS(f"  persistent connections save {saved:.2f}ms per request"))
+
+        if options["output"]:
+            os.makedirs(os.path.dirname(options["output"]) or ".", exist_ok=True)
+            with open(options["output"], "w") as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
+
+    def _create_rows(self, count):
+        User.objects.filter(username=BENCH_USERNAME).delete()
+        user = User.objects.create(username=BENCH_USERNAME)
+        day = date.today() + timedelta(days=1)
+        Appointment.objects.bulk_create([
+            Appointment(user=user, name=f"Patient {i}", age=30, sex="O", date=day + timedelta(days=i // 8),
+                        time=f"{9 + i % 8:02d}:00", department="Cardiology", doctor="Dr. Bench", token_number=i + 1)
+            for i in range(count)
+        ])
+        return user
+
+    def _measure(self, client, url, headers, requests):
+        opened = []
+
+        def count(sender, connection, **kwargs):
+            if connection.alias == "default":
+                opened.append(1)
+
+        latencies = []
+        connection_created.connect(count)
+        try:
+            for _ in range(requests):
+                start = time.perf_counter()
+                response = client.get(url, **headers)
+                # The test client skips the request_finished handler that applies CONN_MAX_AGE
+                close_old_connections()
+                latencies.append(time.perf_counter() - start)
+                if response.status_code != 200:
+                    raise CommandError(f"{url} returned {response.status_code}")
+        finally:
+            connection_created.disconnect(count)
+
+        latencies.sort()
+        return {
+            "requests": requests,
+            "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+            "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+            "mean_ms": round(sum(latencies) / len(latencies) * 1000, 3),
+            "connections_opened": len(opened),
+        }
@@ -0,0 +1,101 @@
+import json
+import os
+import time
+from datetime import date, timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+
+from appointment.serialization import FastJSONRenderer, orjson
+from appointments.models import Appointment
+from appointments.serializers import AppointmentListSerializer, AppointmentSerializer
+from chat.models import ChatMessage, ChatSession
+from chat.serializers import ChatSessionListSerializer, ChatSessionSerializer
+
+BENCH_USERNAME = "bench_serializers"
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare rows per second of the DRF ModelSerializers against the values()-based list "
+        "serializers (query + serialize), and of DRF's JSON renderer against FastJSONRenderer. "
+        "Test rows are created in a transaction that is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--appointments", type=int, default=2000, help="Appointments in the list")
+        parser.add_argument("--sessions", type=int, default=50, help="Chat sessions in the list")
+        parser.add_argument("--messages", type=int, default=20, help="Messages per chat session")
+        parser.add_argument("--repeat", type=int, default=5, help="Timed runs per case (best is kept)")
+        parser.add_argument("--output", help="Optional JSON results path")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            user = self._create_rows(options)
+            appointments = Appointment.objects.filter(user=user)
+            sessions = ChatSession.objects.filter(user=user).order_by("-last_interaction")
+            appointment_rows = options["appointments"]
+            session_rows = options["sessions"] * (options["messages"] + 1)
+
+            cases = {
+                "appointments_model_serializer": (
+                    appointment_rows, lambda: AppointmentSerializer(appointments, many=True).data),
+                "appointments_values_serializer": (
+                    appointment_rows, lambda: AppointmentListSerializer(appointments).data),
+                "chat_sessions_model_serializer": (
+                    session_rows, lambda: ChatSessionSerializer(sessions.prefetch_related("messages"), many=True).data),
+                "chat_sessions_values_serializer": (
+                    session_rows, lambda: ChatSessionListSerializer(sessions).data),
+            }
+            results = {name: self._measure(rows, build, options["repeat"]) for name, (rows, build) in cases.items()}
+
+            data = AppointmentListSerializer(appointments).data
+            for name, renderer in (("render_drf_json", JSONRenderer()), ("render_fast_json", FastJSONRenderer())):
+                results[name] = self._measure(appointment_rows, lambda: renderer.render(data), options["repeat"])
+            transaction.set_rollback(True)
+
+        report = {
+            "parameters": {k: options[k] for k in ("appointments", "sessions", "messages", "repeat")},
+            "orjson": orjson is not None,
+            "cases": results,
+        }
+        self.stdout.write(f"orjson installed: {report['orjson']}")
+        for name, result in results.items():
+            self.stdout.write(f"  {name:<34} {result['rows_per_sec']:>12,} rows/s  best {result['best_ms']}ms")
+        for model in ("appointments", "chat_sessions"):
+            speedup = results[f"{model}_values_serializer"]["rows_per_sec"] / results[f"{model}_model_serializer"]["rows_per_sec"]
+            self.stdout.write(self.style.SUCCESS(f"  {model}: values() serializer is {speedup:.1f}x faster"))
+
+        if options["output"]:
+            os.makedirs(os.path.dirname(options["output"]) or ".", exist_ok=True)
+            with open(options["output"], "w") as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
+
+    def _create_rows(self, options):
+        user = User.objects.create(username=BENCH_USERNAME)
+        day = date.today() + timedelta(days=1)
+        Appointment.objects.bulk_create([
+            Appointment(user=user, name=f"Patient {i}", age=20 + i % 60, sex="O", date=day + timedelta(days=i // 30),
+                        time=f"{9 + i % 8:02d}:00", department="Cardiology", doctor="Dr. Bench", token_number=i % 30 + 1)
+            for i in range(options["appointments"])
+        ], batch_size=1000)
+        sessions = ChatSession.objects.bulk_create([
+            ChatSession(user=user, session_id=f"{BENCH_USERNAME}-{i}") for i in range(options["sessions"])
+        ])
+        ChatMessage.objects.bulk_create([
+            ChatMessage(session=session, is_user=j % 2 == 0, message=f"Message {j} about visiting hours and fees.")
+            for session in sessions for j in range(options["messages"])
+        ], batch_size=1000)
+        return user
+
+    def _measure(self, rows, build, repeat):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            build()
+            timings.append(time.perf_counter() - start)
+        best = min(timings)
+        return {"rows": rows, "best_ms": round(best * 1000, 2), "rows_per_sec": int(rows / best) if best else None}
@@ -0,0 +1,39 @@
+import json
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from appointments.reschedule import RescheduleError, reschedule
+
+
+class Command(BaseCommand):
+    help = (
+        "Move all active appointments on --from (optionally only one --doctor or --department) to --to "
+        "in one transaction, keeping each hour where there is room and reissuing tokens."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--from", dest="source_date", required=True, type=date.fromisoformat)
+        parser.add_argument("--to", dest="target_date", required=True, type=date.fromisoformat)
+        parser.add_argument("--doctor")
+        parser.add_argument("--department")
+        parser.add_argument("--to-doctor", help="Reassign the moved appointments to this doctor")
+        parser.add_argument("--allow-partial", action="store_true",
+                            help="Move what fits instead of refusing when some appointments do not fit")
+        parser.add_argument("--dry-run", action="store_true", help="Print the plan without saving it")
+
+    def handle(self, *args, **options):
+        try:
+            plan = reschedule(
+                options["source_date"], options["target_date"],
+                doctor=options["doctor"], department=options["department"], to_doctor=options["to_doctor"],
+                allow_partial=options["allow_partial"], dry_run=options["dry_run"],
+            )
+        except RescheduleError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(json.dumps(plan.as_dict(), indent=2))
+        verb = "Would move" if options["dry_run"] else "Moved"
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {len(plan.moves)} appointment(s) to {options['target_date']}; {len(plan.unplaced)} did not fit"
+        ))
@@ -0,0 +1,35 @@
+# Generated by Django 5.1.7 on 2026-10-19 17:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0009_appointmentconfig_appointment_sex_appointment_time_and_more'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='appointmentconfig',
+            name='max_daily_appointments',
+            field=models.PositiveIntegerField(default=30),
+        ),
+        migrations.CreateModel(
+            name='DepartmentQueue',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('department', models.CharField(max_length=255)),
+                ('date', models.DateField()),
+                ('now_serving', models.PositiveIntegerField(blank=True, null=True)),
+                ('served_count', models.PositiveIntegerField(default=0)),
+                ('avg_consult_seconds', models.FloatField(default=600)),
+                ('version', models.PositiveIntegerField(default=0)),
+                ('last_advanced_at', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'unique_together': {('department', 'date')},
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.1.7 on 2026-10-19 17:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0012_appointment_status_archive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Closure',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('department', models.CharField(blank=True, default='', max_length=255)),
+                ('start_hour', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('end_hour', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('reason', models.CharField(max_length=255)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['date', 'start_hour'],
+                'indexes': [models.Index(fields=['date', 'department'], name='closure_date_dept_idx')],
+            },
+        ),
+    ]
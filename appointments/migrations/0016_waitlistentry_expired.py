@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-19 18:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0015_appointment_updated_at'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='waitlistentry',
+            name='status',
+            field=models.CharField(choices=[('Waiting', 'Waiting'), ('Promoted', 'Promoted'), ('Withdrawn', 'Withdrawn'), ('Expired', 'Expired')], default='Waiting', max_length=20),
+        ),
+    ]
@@ -18,7 +18,18 @@ class AppointmentConfig(models.Model):
         verbose_name = "Appointment Configuration"
         verbose_name_plural = "Appointment Configurations"
 
+class AppointmentQuerySet(models.QuerySet):
+    def active(self):
+        """Bookings that still hold a slot (cancelled rows are kept for audit)"""
+        return self.exclude(status='Cancelled')
+
+
 class Appointment(models.Model):
+    STATUS_CHOICES = [
+        ('Booked', 'Booked'),
+        ('Cancelled', 'Cancelled'),
+        ('Completed', 'Completed'),
+    ]
     SEX_CHOICES = [
         ('M', 'Male'),
         ('F', 'Female'),
@@ -36,7 +47,26 @@ class Appointment(models.Model):
     token_number = models.PositiveIntegerField(blank=True, null=True)
     payment_id = models.CharField(max_length=100, blank=True, null=True)
     payment_status = models.CharField(max_length=50, choices=[("Pending", "Pending"), ("Paid", "Paid")], default="Pending")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='Booked')
+    cancelled_at = models.DateTimeField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Last write; list endpoints derive ETag/Last-Modified from Max('updated_at')
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = AppointmentQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Daily/hourly capacity counts filter on date, time and status
+            models.Index(fields=['date', 'time', 'status'], name='appointment_slot_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        # auto_now is only written when listed, so partial saves must include it
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'updated_at' not in update_fields:
+            kwargs['update_fields'] = [*update_fields, 'updated_at']
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"{self.name} - {self.date} {self.time} (Token: {self.token_number})"
@@ -64,4 +94,122 @@ class PatientProfile(models.Model):
         unique_together = ['user', 'profile_name']  # Ensure profile names are unique per user
 
     def __str__(self):
-        return f"{self.profile_name} - {self.patient_name}"
\ No newline at end of file
+        return f"{self.profile_name} - {self.patient_name}"
+
+class DepartmentQueue(models.Model):
+    """'Now serving' state of one department's token queue for one day"""
+    department = models.CharField(max_length=255)
+    date = models.DateField()
+    now_serving = models.PositiveIntegerField(blank=True, null=True)  # token number currently being seen
+    served_count = models.PositiveIntegerField(default=0)
+    avg_consult_seconds = models.FloatField(default=600)  # rolling average used for wait estimates
+    version = models.PositiveIntegerField(default=0)  # bumped on every advance, used by long-poll/SSE clients
+    last_advanced_at = models.DateTimeField(blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ['department', 'date']
+
+    def __str__(self):
+        return f"{self.department} {self.date}: serving token {self.now_serving}"
+
+class WaitlistEntry(models.Model):
+    """A request for a full hourly slot, promoted to an appointment when a booking in that hour is cancelled"""
+    STATUS_CHOICES = [
+        ('Waiting', 'Waiting'),
+        ('Promoted', 'Promoted'),
+        ('Withdrawn', 'Withdrawn'),
+        ('Expired', 'Expired'),  # the slot was closed before the entry's turn came
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='waitlist_entries')
+    name = models.CharField(max_length=255)
+    age = models.PositiveIntegerField()
+    sex = models.CharField(max_length=1, choices=Appointment.SEX_CHOICES, default='O')
+    date = models.DateField()
+    time = models.TimeField()
+    hour = models.PositiveSmallIntegerField()  # slot the entry waits on, derived from time
+    department = models.CharField(max_length=255, default='General Medicine')
+    doctor = models.CharField(max_length=255)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='Waiting')
+    appointment = models.OneToOneField(Appointment, on_delete=models.SET_NULL, blank=True, null=True, related_name='waitlist_entry')
+    created_at = models.DateTimeField(auto_now_add=True)
+    promoted_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        ordering = ['created_at', 'id']
+        indexes = [
+            # FIFO lookup of the next entry for a freed slot
+            models.Index(fields=['date', 'hour', 'status', 'created_at'], name='waitlist_slot_fifo_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.hour = self.time.hour
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return f"{self.name} waiting for {self.date} {self.hour}:00 ({self.department}, {self.status})"
+
+class ArchivedAppointment(models.Model):
+    """Appointments moved out of the hot table by the archive_appointments command"""
+    original_id = models.PositiveIntegerField(unique=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='archived_appointments')
+    name = models.CharField(max_length=255)
+    age = models.PositiveIntegerField()
+    sex = models.CharField(max_length=1, choices=Appointment.SEX_CHOICES, default='O')
+    date = models.DateField(db_index=True)
+    time = models.TimeField()
+    department = models.CharField(max_length=255)
+    doctor = models.CharField(max_length=255)
+    token_number = models.PositiveIntegerField(blank=True, null=True)
+    payment_id = models.CharField(max_length=100, blank=True, null=True)
+    payment_status = models.CharField(max_length=50)
+    status = models.CharField(max_length=20, choices=Appointment.STATUS_CHOICES)
+    cancelled_at = models.DateTimeField(blank=True, null=True)
+    created_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"[archived] {self.name} - {self.date} {self.time} (Token: {self.token_number})"
+
+class Closure(models.Model):
+    """A public holiday or closure: the whole hospital or one department, all day or for some hours"""
+    date = models.DateField()
+    department = models.CharField(max_length=255, blank=True, default='')  # blank: every department
+    start_hour = models.PositiveSmallIntegerField(blank=True, null=True)  # blank: the whole day
+    end_hour = models.PositiveSmallIntegerField(blank=True, null=True)  # exclusive
+    reason = models.CharField(max_length=255)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['date', 'start_hour']
+        indexes = [models.Index(fields=['date', 'department'], name='closure_date_dept_idx')]
+
+    def clean(self):
+        if (self.start_hour is None) != (self.end_hour is None):
+            raise ValidationError("Give both start and end hour, or neither for a whole-day closure.")
+        if self.start_hour is not None and not 0 <= self.start_hour < self.end_hour <= 24:
+            raise ValidationError("Hours must satisfy 0 <= start < end <= 24.")
+
+    def __str__(self):
+        where = self.department or "Hospital"
+        when = f" {self.start_hour}:00-{self.end_hour}:00" if self.start_hour is not None else ""
+        return f"{where} closed {self.date}{when}: {self.reason}"
+
+class DailyStats(models.Model):
+    """Dashboard rollup: appointment counts per day, department and doctor (see appointments/stats.py)"""
+    date = models.DateField()
+    department = models.CharField(max_length=255)
+    doctor = models.CharField(max_length=255)
+    appointments = models.IntegerField(default=0)  # not cancelled
+    cancelled = models.IntegerField(default=0)
+    completed = models.IntegerField(default=0)
+    paid = models.IntegerField(default=0)  # not cancelled and paid
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'department', 'doctor'], name='daily_stats_key_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.date} {self.department}/{self.doctor}: {self.appointments} booked, {self.paid} paid"
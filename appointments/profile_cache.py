@@ -0,0 +1,71 @@
+"""
+Per-user cache of saved patient profiles.
+
+The booking form and the profile endpoints are served from one cached entry
+per user in the shared "profiles" cache namespace: the serialized profiles
+in name order plus an ETag, so a repeat load costs no query and an unchanged
+client copy gets a 304. Saving or deleting a profile drops the entry after
+commit, so a reader that raced the write cannot put the old map back.
+"""
+import hashlib
+import json
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from appointment.cache import namespace
+from . import serializers
+from .models import PatientProfile
+
+cache = namespace("profiles")
+
+
+def enabled():
+    return settings.PROFILE_CACHE_TTL > 0
+
+
+def load(user_id):
+    """(profiles, etag) from the database"""
+    rows = PatientProfile.objects.filter(user_id=user_id).order_by('profile_name')
+    profiles = [dict(row) for row in serializers.PatientProfileSerializer(rows, many=True).data]
+    digest = hashlib.sha1(json.dumps(profiles, sort_keys=True).encode()).hexdigest()
+    return profiles, f'"{digest[:20]}"'
+
+
+def get_profiles(user_id):
+    """(profiles, etag) for a user, loading and caching them on a miss"""
+    if not enabled():
+        return load(user_id)
+    return cache.get_or_set(user_id, lambda: load(user_id), settings.PROFILE_CACHE_TTL)
+
+
+def get_profile(user_id, profile_name):
+    profiles, _ = get_profiles(user_id)
+    return next((p for p in profiles if p['profile_name'] == profile_name), None)
+
+
+def get_profile_by_id(user_id, profile_id):
+    profiles, _ = get_profiles(user_id)
+    return next((p for p in profiles if p['id'] == profile_id), None)
+
+
+def lookup(user_id, ref):
+    """A profile by name, or by id when ref is a number that no profile is named"""
+    ref = str(ref)
+    profile = get_profile(user_id, ref)
+    if profile is None and ref.isdigit():
+        profile = get_profile_by_id(user_id, int(ref))
+    return profile
+
+
+def invalidate(user_id):
+    cache.delete(user_id)
+
+
+@receiver(post_save, sender=PatientProfile)
+@receiver(post_delete, sender=PatientProfile)
+def invalidate_profiles(sender, instance, **kwargs):
+    invalidate(instance.user_id)
+    transaction.on_commit(lambda: invalidate(instance.user_id))
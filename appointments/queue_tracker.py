@@ -0,0 +1,251 @@
+"""
+Live queue position tracking.
+
+Staff advance a department's "now serving" token; patients get their position
+and an estimated wait without re-reading their appointment list. Changes are
+fanned out in-process through QueueBroadcaster, so waiting long-poll/SSE
+clients wake immediately. Clients served by another worker process pick the
+change up on their next periodic re-read of the small DepartmentQueue row.
+
+Waiting clients are coroutines, so holding them open only costs memory under
+ASGI; the views answer at once under WSGI (see async_views). The day's
+booked tokens are kept in the "queue_tokens" namespace of the shared cache,
+dropped on every appointment change in this process and re-read at most every
+QUEUE_REFRESH_SECONDS otherwise, instead of once per client per update.
+"""
+import asyncio
+import bisect
+import json
+import threading
+import time
+from collections import defaultdict
+from datetime import date
+from urllib.parse import quote
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from appointment.cache import namespace
+
+from .models import Appointment, DepartmentQueue
+
+# Weight of the newest consultation in the rolling average
+CONSULT_EWMA_ALPHA = 0.2
+# Gaps longer than this (breaks, end of day) are not counted as consultations
+MAX_CONSULT_SECONDS = 2 * 60 * 60
+
+token_cache = namespace("queue_tokens")
+
+
+class QueueBroadcaster:
+    """In-memory fan-out of queue versions to waiting coroutines in this process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._versions = {}
+        self._waiters = defaultdict(set)  # key -> {(event loop, asyncio.Event)}
+
+    def publish(self, key, version):
+        """Record a new version and wake its waiters; safe to call from any thread"""
+        with self._lock:
+            self._versions[key] = max(version, self._versions.get(key, 0))
+            waiters = list(self._waiters.get(key, ()))
+        for loop, event in waiters:
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:
+                pass  # the waiter's loop has closed
+
+    async def wait(self, key, known_version, timeout):
+        """Wait until the version for key passes known_version; False on timeout"""
+        waiter = (asyncio.get_running_loop(), asyncio.Event())
+        with self._lock:
+            # Versions only grow, so a stale value seen earlier never looks like news
+            if self._versions.get(key, 0) > known_version:
+                return True
+            self._waiters[key].add(waiter)
+        try:
+            await asyncio.wait_for(waiter[1].wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            with self._lock:
+                self._waiters[key].discard(waiter)
+                if not self._waiters[key]:
+                    del self._waiters[key]
+
+
+broadcaster = QueueBroadcaster()
+
+
+def queue_key(department, day):
+    return (department, day.isoformat())
+
+
+def department_tokens(department, day):
+    """Sorted token numbers booked for a department on a day"""
+    return list(
+        Appointment.objects.active().filter(department=department, date=day, token_number__isnull=False)
+        .order_by('token_number').values_list('token_number', flat=True)
+    )
+
+
+@receiver(post_save, sender=Appointment)
+@receiver(post_delete, sender=Appointment)
+def tokens_changed(sender=None, **kwargs):
+    """Drop the cached token lists; bulk writes that send no signals call this themselves"""
+    token_cache.invalidate()
+
+
+async def aget_queue(department, day):
+    return await DepartmentQueue.objects.filter(department=department, date=day).afirst()
+
+
+async def wait_for_change(department, day, known_version, timeout):
+    """
+    Wait up to `timeout` seconds for the queue to move past known_version.
+    Returns the current DepartmentQueue row (or None if the queue has not started).
+    """
+    key = queue_key(department, day)
+    deadline = time.monotonic() + timeout
+    queue = await aget_queue(department, day)
+    while (queue.version if queue else 0) <= known_version:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        await broadcaster.wait(key, known_version, min(remaining, settings.QUEUE_REFRESH_SECONDS))
+        queue = await aget_queue(department, day)
+    return queue
+
+
+def advance_queue(department, token=None):
+    """
+    Move today's queue for a department to `token`, or to the next booked token.
+    Updates the rolling consultation-time average and notifies waiting clients.
+    """
+    today = date.today()
+    now = timezone.now()
+    with transaction.atomic():
+        queue, _ = DepartmentQueue.objects.select_for_update().get_or_create(department=department, date=today)
+
+        if token is None:
+            upcoming = Appointment.objects.active().filter(department=department, date=today, token_number__isnull=False)
+            if queue.now_serving is not None:
+                upcoming = upcoming.filter(token_number__gt=queue.now_serving)
+            token = upcoming.order_by('token_number').values_list('token_number', flat=True).first()
+            if token is None:
+                return queue, False
+
+        if queue.last_advanced_at is not None:
+            elapsed = (now - queue.last_advanced_at).total_seconds()
+            if 0 < elapsed <= MAX_CONSULT_SECONDS:
+                queue.avg_consult_seconds += CONSULT_EWMA_ALPHA * (elapsed - queue.avg_consult_seconds)
+
+        # The patient seen until now is done
+        if queue.now_serving is not None:
+            finished = Appointment.objects.filter(
+                department=department, date=today, token_number=queue.now_serving, status='Booked'
+            ).first()
+            if finished:
+                # save() rather than update() so the daily stats see the change
+                finished.status = 'Completed'
+                finished.save(update_fields=['status'])
+
+        queue.now_serving = token
+        queue.served_count += 1
+        queue.version += 1
+        queue.last_advanced_at = now
+        queue.save()
+
+        key, version = queue_key(department, today), queue.version
+        transaction.on_commit(lambda: broadcaster.publish(key, version))
+    return queue, True
+
+
+def position_snapshot(appointment, queue, tokens):
+    """Position and estimated wait for an appointment given the queue state and the day's tokens"""
+    now_serving = queue.now_serving if queue else None
+    avg_seconds = queue.avg_consult_seconds if queue else DepartmentQueue._meta.get_field('avg_consult_seconds').default
+    my_token = appointment.token_number
+
+    if appointment.date != date.today():
+        state = 'upcoming' if appointment.date > date.today() else 'past'
+        ahead = None
+    elif now_serving is not None and my_token == now_serving:
+        state, ahead = 'serving', 0
+    elif now_serving is not None and my_token < now_serving:
+        state, ahead = 'done', 0
+    else:
+        lower = bisect.bisect_right(tokens, now_serving) if now_serving is not None else 0
+        ahead = max(bisect.bisect_left(tokens, my_token) - lower, 0)
+        # The patient currently being seen is still ahead of everyone waiting
+        if now_serving is not None:
+            ahead += 1
+        state = 'waiting'
+
+    return {
+        'appointment_id': appointment.id,
+        'department': appointment.department,
+        'token_number': my_token,
+        'now_serving': now_serving,
+        'status': state,
+        'position': ahead,
+        'estimated_wait_minutes': round(ahead * avg_seconds / 60) if ahead is not None else None,
+        'version': queue.version if queue else 0,
+    }
+
+
+def day_tokens(appointment):
+    """Department tokens for the appointment's day, only needed while that day is today"""
+    if appointment.date != date.today():
+        return []
+    return token_cache.get_or_set(
+        f"{appointment.date.isoformat()}:{quote(appointment.department)}",
+        lambda: department_tokens(appointment.department, appointment.date),
+        settings.QUEUE_REFRESH_SECONDS,
+    )
+
+
+async def asnapshot(appointment, queue):
+    """position_snapshot for async views; the tokens are read off the event loop"""
+    return position_snapshot(appointment, queue, await sync_to_async(day_tokens)(appointment))
+
+
+def sse_event(snapshot, retry=None):
+    """One server-sent event; retry (ms) tells EventSource when to reconnect"""
+    prefix = f"retry: {retry}\n" if retry is not None else ""
+    return f"{prefix}id: {snapshot['version']}\nevent: queue\ndata: {json.dumps(snapshot)}\n\n"
+
+
+def is_final(snapshot):
+    # Nothing more will change for this appointment
+    return snapshot['status'] in ('done', 'past', 'upcoming')
+
+
+async def event_stream(appointment):
+    """Server-sent events for one appointment: a snapshot per queue advance, comment heartbeats in between"""
+    deadline = time.monotonic() + settings.QUEUE_STREAM_MAX_SECONDS
+    queue = await aget_queue(appointment.department, appointment.date)
+    while True:
+        snapshot = await asnapshot(appointment, queue)
+        yield sse_event(snapshot)
+        if is_final(snapshot):
+            return
+
+        known_version = snapshot['version']
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            queue = await wait_for_change(
+                appointment.department, appointment.date, known_version,
+                min(remaining, settings.QUEUE_LONG_POLL_MAX_SECONDS),
+            )
+            if queue and queue.version > known_version:
+                break
+            yield ": keep-alive\n\n"
@@ -0,0 +1,145 @@
+"""
+Bulk rescheduling: move a set of bookings (a day's appointments, optionally
+for one doctor or department) to another day in one transaction.
+
+The plan is made in memory: one aggregate query gives the target day's
+bookings per hour, and each appointment keeps its hour if there is room or
+takes the nearest hour that passes the calendar rules and has capacity.
+The moves are then written with a single bulk_update, with tokens on the
+target day reissued after its current highest token in (time, old token)
+order. Either every selected appointment is placed or nothing is written,
+unless allow_partial is set.
+"""
+from datetime import time
+from typing import NamedTuple
+
+from django.db import transaction
+from django.db.models import Count
+from django.db.models.functions import ExtractHour
+from django.utils import timezone
+
+from . import booking_rules, queue_tracker, stats
+from .models import Appointment
+
+
+class Move(NamedTuple):
+    appointment: Appointment
+    old_date: object
+    old_time: object
+
+
+class ReschedulePlan(NamedTuple):
+    moves: list
+    unplaced: list  # appointments that did not fit anywhere on the target day
+
+    def as_dict(self):
+        return {
+            "moved": len(self.moves),
+            "moves": [
+                {"id": m.appointment.id, "from": f"{m.old_date} {m.old_time:%H:%M}",
+                 "date": str(m.appointment.date), "time": f"{m.appointment.time:%H:%M}",
+                 "token_number": m.appointment.token_number}
+                for m in self.moves
+            ],
+            "unplaced": [appointment.id for appointment in self.unplaced],
+        }
+
+
+class RescheduleError(Exception):
+    def __init__(self, message, plan=None):
+        super().__init__(message)
+        self.plan = plan
+
+
+def select_appointments(source_date, doctor=None, department=None):
+    appointments = Appointment.objects.filter(date=source_date, status='Booked')
+    if doctor:
+        appointments = appointments.filter(doctor=doctor)
+    if department:
+        appointments = appointments.filter(department=department)
+    return appointments.order_by('time', 'token_number', 'id')
+
+
+def _hour_counts(target_date):
+    rows = (
+        Appointment.objects.active().filter(date=target_date)
+        .annotate(hour=ExtractHour('time')).values('hour').annotate(n=Count('id'))
+        .values_list('hour', 'n')
+    )
+    return dict(rows)
+
+
+def _candidate_hours(hour):
+    """The original hour first, then bookable hours by distance from it (earlier first on ties)"""
+    return sorted(booking_rules.BOOKABLE_HOURS, key=lambda h: (h != hour, abs(h - hour), h))
+
+
+def plan_moves(appointments, target_date, config, hour_counts):
+    """Assign each appointment a slot on target_date, in memory only (appointments and hour_counts are updated)"""
+    daily_count = sum(hour_counts.values())
+    moves, unplaced = [], []
+    for appointment in appointments:
+        placed = None
+        if daily_count < config.max_daily_appointments:
+            for hour in _candidate_hours(appointment.time.hour):
+                new_time = appointment.time.replace(hour=hour) if hour != appointment.time.hour else appointment.time
+                slot = booking_rules.BookingSlot(target_date, new_time, appointment.department)
+                violations, _ = booking_rules.evaluate(slot, booking_rules.calendar_rules())
+                if not violations and hour_counts.get(hour, 0) < config.max_per_hour:
+                    placed = new_time
+                    break
+        if placed is None:
+            unplaced.append(appointment)
+            continue
+        hour_counts[placed.hour] = hour_counts.get(placed.hour, 0) + 1
+        daily_count += 1
+        moves.append(Move(appointment, appointment.date, appointment.time))
+        appointment.date, appointment.time = target_date, placed
+    return ReschedulePlan(moves, unplaced)
+
+
+def reschedule(source_date, target_date, doctor=None, department=None, to_doctor=None,
+               allow_partial=False, dry_run=False):
+    """Plan and apply a bulk move; raises RescheduleError when nothing can or may be moved"""
+    if source_date == target_date:
+        raise RescheduleError("Source and target dates must differ.")
+    violations, _ = booking_rules.evaluate(
+        booking_rules.BookingSlot(target_date, time(hour=booking_rules.BOOKABLE_HOURS[0])),
+        [rule for rule in booking_rules.calendar_rules() if rule.field == 'date'],
+    )
+    if violations:
+        raise RescheduleError(violations[0].message)
+
+    with transaction.atomic():
+        # Lock the config row so concurrent reschedules of the same capacity are serialized,
+        # and the moving rows so they cannot be cancelled or edited mid-move
+        config = booking_rules.lock_config()
+        appointments = list(select_appointments(source_date, doctor, department).select_for_update())
+        if not appointments:
+            raise RescheduleError("No active appointments match.")
+
+        plan = plan_moves(appointments, target_date, config, _hour_counts(target_date))
+        if plan.unplaced and not allow_partial:
+            raise RescheduleError(f"{len(plan.unplaced)} appointment(s) do not fit on {target_date}.", plan)
+        if not plan.moves:
+            return plan
+
+        # Reissue tokens in one pass after the target day's highest (cancelled rows keep theirs)
+        next_token = booking_rules.next_token(target_date)
+        for move in sorted(plan.moves, key=lambda m: (m.appointment.time, m.appointment.token_number or 0)):
+            move.appointment.token_number = next_token
+            next_token += 1
+            if to_doctor:
+                move.appointment.doctor = to_doctor
+
+        if dry_run:
+            return plan
+        fields = ['date', 'time', 'token_number', 'updated_at'] + (['doctor'] if to_doctor else [])
+        now = timezone.now()
+        for move in plan.moves:
+            move.appointment.updated_at = now
+        Appointment.objects.bulk_update([m.appointment for m in plan.moves], fields, batch_size=500)
+        # bulk_update sends no signals
+        stats.track_changes([m.appointment for m in plan.moves])
+        queue_tracker.tokens_changed()
+    return plan
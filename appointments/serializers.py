@@ -1,8 +1,13 @@
+from contextlib import nullcontext
+
 from django.contrib.auth.models import User
+from django.db import IntegrityError, transaction
 from rest_framework import serializers
 from rest_framework_simplejwt.tokens import RefreshToken
-from .models import Appointment, PatientProfile, AppointmentConfig
-from datetime import date, datetime, time
+from .models import Appointment, PatientProfile, AppointmentConfig, WaitlistEntry
+from appointment.serialization import ValuesSerializer
+from . import booking_rules, profile_cache, queue_tracker, stats
+from datetime import date
 
 
 class RegisterSerializer(serializers.ModelSerializer):
@@ -25,68 +30,151 @@ class LoginSerializer(serializers.Serializer):
         user = User.objects.filter(username=data['username']).first()
         if user and user.check_password(data['password']):
             refresh = RefreshToken.for_user(user)
+            # Carried into the access token so authentication needs no User query
+            refresh['username'] = user.username
+            refresh['is_staff'] = user.is_staff
             return {'refresh': str(refresh), 'access': str(refresh.access_token)}
         raise serializers.ValidationError("Invalid credentials")
 
 
+# Appointment patient fields and the PatientProfile fields they are copied from
+PROFILE_FIELDS = {'name': 'patient_name', 'age': 'age', 'sex': 'sex'}
+
+
+def profile_patient_fields(profile):
+    return {field: profile[source] for field, source in PROFILE_FIELDS.items()}
+
+
+def reserve_slot(slot):
+    """booking_rules.reserve() for serializers: the first token, or a ValidationError"""
+    violations, token = booking_rules.reserve(slot)
+    if violations:
+        raise serializers.ValidationError({v.field: v.message for v in violations})
+    return token
+
+
 class AppointmentSerializer(serializers.ModelSerializer):
-    """Serializer for handling appointment data"""
+    """
+    Serializer for handling appointment data. Instead of name/age/sex a saved
+    profile can be given by profile_name or by id (profile); it is resolved
+    server-side from the profile cache.
+    """
     department = serializers.CharField(default="General Medicine")
     doctor = serializers.CharField(default="Unassigned")
-    sex = serializers.ChoiceField(choices=Appointment.SEX_CHOICES)
+    sex = serializers.ChoiceField(choices=Appointment.SEX_CHOICES, required=False)
+    profile_name = serializers.CharField(write_only=True, required=False)
+    profile = serializers.IntegerField(write_only=True, required=False)
 
     class Meta:
         model = Appointment
-        fields = ['id', 'name', 'age', 'sex', 'date', 'time', 'department', 'doctor', 'token_number', 'payment_id', 'payment_status']
-        read_only_fields = ['token_number', 'payment_id', 'payment_status']
+        fields = ['id', 'name', 'age', 'sex', 'date', 'time', 'department', 'doctor', 'token_number', 'payment_id', 'payment_status', 'status',
+                  'profile_name', 'profile']
+        read_only_fields = ['token_number', 'payment_id', 'payment_status', 'status']
+        extra_kwargs = {'name': {'required': False}, 'age': {'required': False}}
+
+    def _patient_from_profile(self, data):
+        """Fill name/age/sex from the referenced profile, or insist on them"""
+        profile_name, profile_id = data.pop('profile_name', None), data.pop('profile', None)
+        if profile_name is not None or profile_id is not None:
+            user_id = self.context['request'].user.id
+            if profile_name is not None:
+                profile = profile_cache.get_profile(user_id, profile_name)
+            else:
+                profile = profile_cache.get_profile_by_id(user_id, profile_id)
+            if profile is None:
+                field = 'profile_name' if profile_name is not None else 'profile'
+                raise serializers.ValidationError({field: "Profile not found."})
+            data.update(profile_patient_fields(profile))
+        missing = [field for field in PROFILE_FIELDS if field not in data]
+        if missing and not self.partial:
+            raise serializers.ValidationError({field: "This field is required." for field in missing})
+        return data
 
     def validate(self, data):
-        """Full validation of appointment data"""
-        # Get configuration
-        config = AppointmentConfig.objects.first()
-        if not config:
-            config = AppointmentConfig.objects.create()
-        
-        # Validate date is not in the past
-        if data['date'] < date.today():
-            raise serializers.ValidationError({"date": "Appointment date cannot be in the past."})
-            
-        # Check if booking on Sunday
-        if data['date'].weekday() == 6:  # 6 is Sunday
-            raise serializers.ValidationError({"date": "Appointments are not available on Sundays."})
-            
-        # Check if time is during lunch break (1 PM to 2 PM)
-        if data['time'].hour == 13:
-            raise serializers.ValidationError({"time": "Appointments are not available during lunch break (1 PM to 2 PM)."})
-        
-        # Check daily appointment limit
-        daily_count = Appointment.objects.filter(date=data['date']).count()
-        if daily_count >= config.max_daily_appointments:
-            raise serializers.ValidationError({"date": f"Maximum appointments ({config.max_daily_appointments}) for this day have been reached."})
-        
-        # Check hourly appointment limit
-        start_hour_time = datetime.combine(data['date'], time(hour=data['time'].hour))
-        end_hour_time = datetime.combine(data['date'], time(hour=data['time'].hour, minute=59, second=59))
-        
-        hourly_count = Appointment.objects.filter(
-            date=data['date'],
-            time__gte=start_hour_time.time(),
-            time__lte=end_hour_time.time()
-        ).count()
-        
-        if hourly_count >= config.max_per_hour:
-            raise serializers.ValidationError({
-                "time": f"Maximum appointments ({config.max_per_hour}) for this hour have been reached. Please select a different time."
-            })
-            
+        """Calendar rules (see booking_rules); capacity is checked in create() under the config lock"""
+        data = self._patient_from_profile(data)
+        violations, _ = booking_rules.evaluate(self._slot(data), booking_rules.calendar_rules())
+        if violations:
+            raise serializers.ValidationError({v.field: v.message for v in violations})
         return data
 
+    def _slot(self, data):
+        return booking_rules.BookingSlot(data['date'], data['time'], data.get('department'))
+
+    def create(self, validated_data):
+        with transaction.atomic():
+            validated_data['token_number'] = reserve_slot(self._slot(validated_data))
+            return super().create(validated_data)
+
     def validate_date(self, value):
         """Ensure the appointment date is today or in the future"""
         if value < date.today():
             raise serializers.ValidationError("Appointment date cannot be in the past.")
         return value
     
+
+class AppointmentListSerializer(ValuesSerializer):
+    """Read-only rows for appointment lists; same output as AppointmentSerializer"""
+    model = Appointment
+    fields = ['id', 'name', 'age', 'sex', 'date', 'time', 'department', 'doctor', 'token_number', 'payment_id', 'payment_status', 'status']
+
+
+class GroupAppointmentSerializer(serializers.Serializer):
+    """
+    Book one slot for several saved profiles in one request. The profiles are
+    given by name or id; capacity is checked for the whole group under the
+    config lock (booking_rules.reserve), so either every profile is booked or
+    none is.
+    """
+    MAX_PROFILES = 10
+
+    profiles = serializers.ListField(child=serializers.CharField(), min_length=1, max_length=MAX_PROFILES)
+    date = serializers.DateField()
+    time = serializers.TimeField()
+    department = serializers.CharField(default="General Medicine")
+    doctor = serializers.CharField(default="Unassigned")
+
+    def validate_date(self, value):
+        if value < date.today():
+            raise serializers.ValidationError("Appointment date cannot be in the past.")
+        return value
+
+    def validate_profiles(self, refs):
+        user_id = self.context['request'].user.id
+        profiles = {ref: profile_cache.lookup(user_id, ref) for ref in refs}
+        missing = [ref for ref, profile in profiles.items() if profile is None]
+        if missing:
+            raise serializers.ValidationError(f"Profile(s) not found: {', '.join(missing)}.")
+        if len({profile['id'] for profile in profiles.values()}) < len(refs):
+            raise serializers.ValidationError("Each profile can only be booked once per request.")
+        return list(profiles.values())
+
+    def validate(self, data):
+        # Calendar rules cost nothing; capacity is checked in create() under the lock
+        violations, _ = booking_rules.evaluate(self._slot(data), booking_rules.calendar_rules())
+        if violations:
+            raise serializers.ValidationError({v.field: v.message for v in violations})
+        return data
+
+    def _slot(self, data):
+        return booking_rules.BookingSlot(data['date'], data['time'], data['department'], size=len(data['profiles']))
+
+    def create(self, validated_data):
+        slot = self._slot(validated_data)
+        profiles = validated_data.pop('profiles')
+        with transaction.atomic():
+            # Same lock, capacity check and numbering as a single booking
+            first_token = reserve_slot(slot)
+            appointments = Appointment.objects.bulk_create([
+                Appointment(token_number=first_token + i, **validated_data, **profile_patient_fields(profile))
+                for i, profile in enumerate(profiles)
+            ])
+            # bulk_create sends no signals
+            stats.track_changes(appointments, created=True)
+            queue_tracker.tokens_changed()
+        return appointments
+
+
 # Profile management
 class PatientProfileSerializer(serializers.ModelSerializer):
     """Serializer for patient profiles"""
@@ -95,19 +183,18 @@ class PatientProfileSerializer(serializers.ModelSerializer):
         model = PatientProfile
         fields = ['id', 'profile_name', 'patient_name', 'age', 'sex', 'created_at', 'updated_at']
         read_only_fields = ['created_at', 'updated_at']
-        
-    def validate_profile_name(self, value):
-        """Ensure profile_name is unique for this user"""
-        user = self.context['request'].user
-        
-        if not self.instance:
-            if PatientProfile.objects.filter(user=user, profile_name=value).exists():
-                raise serializers.ValidationError("A profile with this name already exists.")
-        else:
-            if PatientProfile.objects.filter(user=user, profile_name=value).exclude(id=self.instance.id).exists():
-                raise serializers.ValidationError("A profile with this name already exists.")
-                
-        return value
+
+    # Uniqueness of (user, profile_name) is left to the database constraint instead of
+    # an exists() query per write. Inside an outer transaction the write gets a savepoint
+    # so a violation does not abort it; in autocommit the statement stands alone.
+
+    def save(self, **kwargs):
+        guard = transaction.atomic() if transaction.get_connection().in_atomic_block else nullcontext()
+        try:
+            with guard:
+                return super().save(**kwargs)
+        except IntegrityError:
+            raise serializers.ValidationError({"profile_name": ["A profile with this name already exists."]})
 
 class AppointmentConfigSerializer(serializers.ModelSerializer):
     """Serializer for appointment configuration"""
@@ -115,4 +202,44 @@ class AppointmentConfigSerializer(serializers.ModelSerializer):
     class Meta:
         model = AppointmentConfig
         fields = ['id', 'max_daily_appointments', 'max_per_hour', 'updated_at']
-        read_only_fields = ['updated_at']
\ No newline at end of file
+        read_only_fields = ['updated_at']
+
+
+class WaitlistEntrySerializer(serializers.ModelSerializer):
+    """Serializer for joining the waitlist of a full hourly slot"""
+    department = serializers.CharField(default="General Medicine")
+    doctor = serializers.CharField(default="Unassigned")
+    sex = serializers.ChoiceField(choices=Appointment.SEX_CHOICES)
+
+    class Meta:
+        model = WaitlistEntry
+        fields = ['id', 'name', 'age', 'sex', 'date', 'time', 'department', 'doctor', 'status', 'appointment', 'created_at']
+        read_only_fields = ['status', 'appointment', 'created_at']
+
+    def validate(self, data):
+        """Only full slots can be waitlisted, once per user"""
+        slot = booking_rules.BookingSlot(data['date'], data['time'], data.get('department'))
+        violations, _snapshot = booking_rules.evaluate(slot, booking_rules.calendar_rules())
+        if violations:
+            raise serializers.ValidationError({v.field: v.message for v in violations})
+
+        user = self.context['request'].user
+        if WaitlistEntry.objects.filter(user=user, date=data['date'], hour=data['time'].hour, status='Waiting').exists():
+            raise serializers.ValidationError({"time": "You are already on the waitlist for this hour."})
+
+        snapshot = booking_rules.take_snapshot(slot)
+        if snapshot.hourly_count < snapshot.config.max_per_hour:
+            raise serializers.ValidationError({"time": "This hour still has free slots. Please book it directly."})
+
+        return data
+
+
+class RescheduleRequestSerializer(serializers.Serializer):
+    """Input for moving a day's appointments (optionally one doctor's or department's) to another day"""
+    source_date = serializers.DateField()
+    target_date = serializers.DateField()
+    doctor = serializers.CharField(required=False, allow_blank=True)
+    department = serializers.CharField(required=False, allow_blank=True)
+    to_doctor = serializers.CharField(required=False, allow_blank=True)
+    allow_partial = serializers.BooleanField(default=False)
+    dry_run = serializers.BooleanField(default=False)
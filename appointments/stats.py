@@ -0,0 +1,171 @@
+"""
+Daily dashboard statistics.
+
+DailyStats holds one row per (date, department, doctor) with counts of
+active, cancelled, completed and paid appointments. Rows are maintained
+incrementally: every Appointment remembers the stats-relevant fields it was
+loaded with, and on save the difference between that state and the new one
+is applied to at most two rows with a single upsert. Paths that bypass
+save() (bulk_update, QuerySet.update) call track_changes() themselves.
+
+Deleting an appointment subtracts it from its row. Archiving deletes inside
+archiving() and leaves the rollup alone, so history survives the archive;
+backfill_daily_stats recomputes any date range from both tables.
+"""
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, Q, Sum
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from .models import Appointment, ArchivedAppointment, DailyStats
+
+TRACKED_FIELDS = ('date', 'department', 'doctor', 'status', 'payment_status')
+COUNTERS = ('appointments', 'cancelled', 'completed', 'paid')
+GROUPINGS = {'day': ('date',), 'department': ('department',), 'doctor': ('department', 'doctor')}
+
+_archiving = ContextVar('stats_archiving', default=False)
+
+
+def contribution(status, payment_status):
+    """Counter increments one appointment in this state adds to its row"""
+    if status == 'Cancelled':
+        return {'cancelled': 1}
+    counts = {'appointments': 1}
+    if status == 'Completed':
+        counts['completed'] = 1
+    if payment_status == 'Paid':
+        counts['paid'] = 1
+    return counts
+
+
+def _state(instance):
+    # Read loaded values only: touching a deferred field would cost a query per instance
+    values = instance.__dict__
+    if any(field not in values for field in TRACKED_FIELDS):
+        return None
+    return tuple(values[field] for field in TRACKED_FIELDS)
+
+
+def _add(deltas, state, sign):
+    day, department, doctor, status, payment_status = state
+    for counter, amount in contribution(status, payment_status).items():
+        deltas[(day, department, doctor)][counter] += sign * amount
+
+
+def apply_deltas(deltas):
+    """Add counter deltas to their rows, creating missing rows, in one INSERT ... ON CONFLICT"""
+    rows = [
+        (day, department, doctor, *(counts.get(counter, 0) for counter in COUNTERS))
+        for (day, department, doctor), counts in deltas.items()
+        if any(counts.values())
+    ]
+    if not rows:
+        return
+    table = DailyStats._meta.db_table
+    updates = ", ".join(f"{c} = {table}.{c} + EXCLUDED.{c}" for c in COUNTERS)
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f"INSERT INTO {table} (date, department, doctor, {', '.join(COUNTERS)}) "
+            f"VALUES (%s, %s, %s, {', '.join(['%s'] * len(COUNTERS))}) "
+            f"ON CONFLICT (date, department, doctor) DO UPDATE SET {updates}",
+            rows,
+        )
+
+
+def track_changes(appointments, created=False):
+    """Apply the stats difference for appointments saved since they were loaded (or created)"""
+    deltas = defaultdict(lambda: defaultdict(int))
+    for appointment in appointments:
+        new = _state(appointment)
+        old = None if created else getattr(appointment, '_stats_state', None)
+        if new is None or (old is None and not created) or old == new:
+            continue
+        if old is not None:
+            _add(deltas, old, -1)
+        _add(deltas, new, +1)
+        appointment._stats_state = new
+    apply_deltas(deltas)
+
+
+@receiver(post_init, sender=Appointment)
+def remember_stats_state(sender, instance, **kwargs):
+    instance._stats_state = _state(instance)
+
+
+@receiver(post_save, sender=Appointment)
+def update_daily_stats(sender, instance, created, **kwargs):
+    track_changes([instance], created=created)
+
+
+@contextmanager
+def archiving():
+    """Deletes inside this block move rows to the archive and keep their counts"""
+    token = _archiving.set(True)
+    try:
+        yield
+    finally:
+        _archiving.reset(token)
+
+
+@receiver(post_delete, sender=Appointment)
+def remove_from_daily_stats(sender, instance, **kwargs):
+    state = getattr(instance, '_stats_state', None)
+    if state is None or _archiving.get():
+        return
+    deltas = defaultdict(lambda: defaultdict(int))
+    _add(deltas, state, -1)
+    apply_deltas(deltas)
+
+
+def rebuild(start, end):
+    """Recompute rows for start..end (inclusive) from live and archived appointments"""
+    counts = defaultdict(lambda: defaultdict(int))
+    for model in (Appointment, ArchivedAppointment):
+        rows = (
+            model.objects.filter(date__range=(start, end))
+            .values('date', 'department', 'doctor')
+            .annotate(
+                appointments=Count('id', filter=~Q(status='Cancelled')),
+                cancelled=Count('id', filter=Q(status='Cancelled')),
+                completed=Count('id', filter=Q(status='Completed')),
+                paid=Count('id', filter=~Q(status='Cancelled') & Q(payment_status='Paid')),
+            )
+        )
+        for row in rows:
+            key = (row['date'], row['department'], row['doctor'])
+            for counter in COUNTERS:
+                counts[key][counter] += row[counter]
+
+    with transaction.atomic():
+        DailyStats.objects.filter(date__range=(start, end)).delete()
+        DailyStats.objects.bulk_create(
+            [DailyStats(date=d, department=dep, doctor=doc, **c) for (d, dep, doc), c in counts.items()],
+            batch_size=1000,
+        )
+    return len(counts)
+
+
+def summarize(start, end, group_by='day'):
+    """Totals and grouped rows for a date range, read from the rollup only"""
+    fee = settings.CONSULTATION_FEE
+    sums = {counter: Sum(counter) for counter in COUNTERS}
+    stats = DailyStats.objects.filter(date__range=(start, end))
+
+    def with_revenue(row):
+        row = {key: (value or 0) if key in COUNTERS else value for key, value in row.items()}
+        row['paid_revenue'] = row['paid'] * fee
+        row['pending_revenue'] = (row['appointments'] - row['paid']) * fee
+        return row
+
+    group = GROUPINGS[group_by]
+    rows = stats.values(*group).annotate(**sums).order_by(*group)
+    return {
+        'start': start, 'end': end, 'group_by': group_by, 'consultation_fee': fee,
+        'totals': with_revenue(stats.aggregate(**sums)),
+        'rows': [with_revenue(row) for row in rows],
+    }
@@ -1,3 +1,1032 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import json
+import re
+import tempfile
+from contextlib import contextmanager
+from io import StringIO
+from datetime import date, time, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from time import monotonic, sleep
+from unittest import mock
 
-# Create your tests here.
+import httpx
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.management import call_command
+from django.db import connection
+from django.http import HttpResponse
+from django.test import AsyncClient, RequestFactory, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.http import http_date
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from appointment import db_router
+from appointment.cache import Namespace
+from appointment.metrics import registry
+from appointment.serialization import FastJSONRenderer
+from . import booking_rules, waitlist
+from .booking_calendar import calendar
+from .authentication import user_cache
+from .serializers import AppointmentListSerializer, AppointmentSerializer
+from .throttling import bucket_store
+from .models import (
+    Appointment, AppointmentConfig, ArchivedAppointment, Closure, DailyStats, PatientProfile, WaitlistEntry,
+)
+
+
+def next_booking_day(offset=1):
+    """First non-Sunday date at least `offset` days from today"""
+    day = date.today() + timedelta(days=offset)
+    while day.weekday() == 6:
+        day += timedelta(days=1)
+    return day
+
+
+def auth_header(user):
+    refresh = RefreshToken.for_user(user)
+    refresh['username'] = user.username
+    refresh['is_staff'] = user.is_staff
+    return f"Bearer {refresh.access_token}"
+
+
+def authenticated_client(user):
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=auth_header(user))
+    return client
+
+
+class QueryBudgetMixin:
+    """Assertions that fail when an endpoint issues more queries or bytes than budgeted"""
+
+    @contextmanager
+    def assertMaxQueries(self, max_queries):
+        with CaptureQueriesContext(connection) as ctx:
+            yield ctx
+        executed = len(ctx.captured_queries)
+        self.assertLessEqual(
+            executed, max_queries,
+            f"{executed} queries executed, budget is {max_queries}:\n"
+            + "\n".join(q['sql'] for q in ctx.captured_queries)
+        )
+
+    def assertMaxResponseSize(self, response, max_bytes):
+        self.assertLessEqual(
+            len(response.content), max_bytes,
+            f"Response is {len(response.content)} bytes, budget is {max_bytes}"
+        )
+
+
+class AppointmentAPITestCase(QueryBudgetMixin, TestCase):
+    """Shared fixture: a few thousand appointments spread over other users and past days"""
+
+    OTHER_USERS = 50
+    PAST_DAYS = 300
+    PER_DAY = 10
+    OWN_APPOINTMENTS = 25
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.config = AppointmentConfig.objects.create(max_daily_appointments=30, max_per_hour=3)
+        cls.user = User.objects.create_user('patient', password='secret123')
+        others = [User(username=f'other{i}') for i in range(cls.OTHER_USERS)]
+        User.objects.bulk_create(others)
+        others = list(User.objects.filter(username__startswith='other'))
+
+        appointments = []
+        for day_offset in range(1, cls.PAST_DAYS + 1):
+            day = date.today() - timedelta(days=day_offset)
+            for slot in range(cls.PER_DAY):
+                appointments.append(Appointment(
+                    user=others[(day_offset + slot) % len(others)],
+                    name=f'Patient {day_offset}-{slot}', age=30, sex='O',
+                    date=day, time=time(hour=9 + slot % 4),
+                    department='Cardiology', doctor='Dr. Sharma', token_number=slot + 1,
+                ))
+        for i in range(cls.OWN_APPOINTMENTS):
+            appointments.append(Appointment(
+                user=cls.user, name='Own Patient', age=40, sex='F',
+                date=date.today() - timedelta(days=i + 1), time=time(hour=10),
+                department='Pediatrics', doctor='Dr. Joshi', token_number=cls.PER_DAY + 1,
+            ))
+        Appointment.objects.bulk_create(appointments, batch_size=1000)
+
+    def setUp(self):
+        user_cache.clear()
+        bucket_store.clear()
+        cache.clear()
+        calendar.rebuild()
+        self.client = authenticated_client(self.user)
+
+    def book(self, day, hour=10, user=None):
+        return Appointment.objects.create(
+            user=user or self.user, name='Upcoming', age=35, sex='M',
+            date=day, time=time(hour=hour), department='Cardiology', doctor='Dr. Patel',
+        )
+
+
+class AuthEndpointTests(AppointmentAPITestCase):
+
+    def test_register(self):
+        client = APIClient()
+        with self.assertMaxQueries(2):
+            response = client.post(reverse('register'), {'username': 'newuser', 'password': 'secret123'}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertMaxResponseSize(response, 200)
+
+    def test_login(self):
+        client = APIClient()
+        with self.assertMaxQueries(1):
+            response = client.post(reverse('login'), {'username': 'patient', 'password': 'secret123'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('access', response.json())
+        self.assertMaxResponseSize(response, 1000)
+
+    def test_protected(self):
+        with self.assertMaxQueries(1):
+            response = self.client.get(reverse('protected'))
+        self.assertEqual(response.status_code, 200)
+
+        # Second request is served from the user cache
+        with self.assertMaxQueries(0):
+            self.client.get(reverse('protected'))
+
+
+class AppointmentEndpointTests(AppointmentAPITestCase):
+
+    def test_create_appointment(self):
+        payload = {
+            'name': 'New Patient', 'age': 28, 'sex': 'F', 'date': next_booking_day().isoformat(),
+            'time': '10:00', 'department': 'Cardiology', 'doctor': 'Dr. Sharma',
+        }
+        # Rules are checked once against a single aggregate snapshot; +1 for the stats upsert
+        with self.assertMaxQueries(8):
+            response = self.client.post(reverse('create-appointment'), payload, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertMaxResponseSize(response, 500)
+
+    def test_create_appointment_rejects_full_hour(self):
+        day = next_booking_day()
+        for _ in range(self.config.max_per_hour):
+            self.book(day, hour=11)
+        payload = {'name': 'Late', 'age': 28, 'sex': 'F', 'date': day.isoformat(), 'time': '11:30'}
+        # user, config lock, snapshot (+ savepoint pair from the atomic block)
+        with self.assertMaxQueries(6):
+            response = self.client.post(reverse('create-appointment'), payload, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_booking_rules_are_shared_and_pluggable(self):
+        day = next_booking_day()
+        closed = booking_rules.Rule(
+            'closed_for_audit', 'date', lambda slot, snapshot: "Closed for audit." if slot.date == day else None, False,
+        )
+        other_day = next_booking_day((day - date.today()).days + 1)
+        appointment = self.book(other_day)
+        with mock.patch.object(booking_rules, 'RULES', [*booking_rules.RULES, closed]):
+            # One config read and one snapshot, however many rules there are
+            with self.assertMaxQueries(2):
+                violations, snapshot = booking_rules.evaluate(booking_rules.BookingSlot(other_day, time(10)))
+            self.assertEqual(violations, [])
+
+            payload = {'name': 'Audit', 'age': 30, 'sex': 'M', 'date': day.isoformat(), 'time': '10:00'}
+            response = self.client.post(reverse('create-appointment'), payload, format='json')
+            self.assertEqual(response.json(), {'date': ['Closed for audit.']})
+
+            payload = {'id': appointment.id, 'date': day.isoformat(), 'time': '10:00'}
+            response = self.client.put(reverse('update-appointment'), payload, format='json')
+            self.assertEqual(response.json(), {'error': 'Closed for audit.'})
+
+    def test_create_appointment_is_throttled(self):
+        payload = {'name': 'Spam', 'age': 28, 'sex': 'F', 'date': date.today().isoformat(), 'time': '13:00'}
+        with self.settings(THROTTLE_RATES={'booking': '3/min'}):
+            statuses = [
+                self.client.post(reverse('create-appointment'), payload, format='json').status_code
+                for _ in range(4)
+            ]
+            self.assertEqual(statuses, [400, 400, 400, 429])
+            # Throttled requests are turned away after authentication, before any booking query
+            with self.assertMaxQueries(1):
+                response = self.client.post(reverse('create-appointment'), payload, format='json')
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+
+    def test_single_and_group_bookings_share_token_numbering(self):
+        day = next_booking_day()
+        self.book(day, hour=9)
+        moved_in = self.book(day, hour=9, user=User.objects.get(username='other0'))
+        # A reschedule left a gap: tokens continue after the highest, not after the count
+        Appointment.objects.filter(id=moved_in.id).update(token_number=7)
+        for name in ('member1', 'member2'):
+            PatientProfile.objects.create(user=self.user, profile_name=name, patient_name=name.title(), age=30)
+
+        payload = {'name': 'Single', 'age': 28, 'sex': 'F', 'date': day.isoformat(), 'time': '10:00'}
+        response = self.client.post(reverse('create-appointment'), payload, format='json')
+        self.assertEqual(response.json()['token_number'], 8)
+        payload = {'profiles': ['member1', 'member2'], 'date': day.isoformat(), 'time': '11:00'}
+        response = self.client.post(reverse('create-appointment'), payload, format='json')
+        self.assertEqual([a['token_number'] for a in response.json()], [9, 10])
+
+        # The moved appointment is numbered after them on its new day
+        appointment = self.book(next_booking_day(2))
+        payload = {'id': appointment.id, 'date': day.isoformat(), 'time': '12:00'}
+        response = self.client.put(reverse('update-appointment'), payload, format='json')
+        self.assertEqual(response.json()['appointment']['token_number'], 11)
+
+    def test_update_appointment(self):
+        appointment = self.book(next_booking_day())
+        payload = {'id': appointment.id, 'date': next_booking_day(2).isoformat(), 'time': '15:00'}
+        # Capacity is re-checked under the config lock, which adds the lock and the token query
+        with self.assertMaxQueries(9):
+            response = self.client.put(reverse('update-appointment'), payload, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertMaxResponseSize(response, 600)
+
+    def test_view_appointments(self):
+        # user, the ETag aggregate, the list
+        with self.assertMaxQueries(3):
+            response = self.client.get(reverse('view-appointment'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), self.OWN_APPOINTMENTS)
+        self.assertMaxResponseSize(response, self.OWN_APPOINTMENTS * 300)
+
+    def test_view_appointments_is_conditional(self):
+        url = reverse('view-appointment')
+        response = self.client.get(url)
+        etag = response['ETag']
+        self.assertIn('private', response['Cache-Control'])
+        self.assertNotIn('Last-Modified', response)
+
+        # One aggregate decides; the list is neither queried nor serialized
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        # Partial saves (update_fields) still move updated_at, so the cancelled row changes the ETag
+        appointment = Appointment.objects.filter(user=self.user).first()
+        appointment.status = 'Cancelled'
+        appointment.save(update_fields=['status'])
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_cancelled_appointments_are_listed_only_on_request(self):
+        url = reverse('view-appointment')
+        cancelled = self.book(next_booking_day())
+        self.client.delete(reverse('cancel-appointment', args=[cancelled.id]))
+
+        ids = [row['id'] for row in self.client.get(url).json()]
+        self.assertEqual(len(ids), self.OWN_APPOINTMENTS)
+        self.assertNotIn(cancelled.id, ids)
+        history = self.client.get(url, {'include_cancelled': '1'}).json()
+        self.assertIn(('Cancelled', cancelled.id), [(row['status'], row['id']) for row in history])
+
+    def test_if_modified_since_alone_never_gets_a_stale_304(self):
+        url = reverse('view-appointment')
+        # The client's copy is dated this second; a booking in the same second, then a deletion
+        since = http_date(timezone.now().timestamp() + 1)
+        self.book(next_booking_day())
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=since)
+        self.assertEqual((response.status_code, len(response.json())), (200, self.OWN_APPOINTMENTS + 1))
+
+        Appointment.objects.filter(user=self.user).order_by('date').first().delete()
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=since)
+        self.assertEqual((response.status_code, len(response.json())), (200, self.OWN_APPOINTMENTS))
+
+    def test_large_responses_are_gzipped(self):
+        response = self.client.get(reverse('view-appointment'), HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(len(json.loads(gzip.decompress(response.content))), self.OWN_APPOINTMENTS)
+
+        with self.settings(GZIP_MIN_SIZE=10 ** 6):
+            response = self.client.get(reverse('view-appointment'), HTTP_ACCEPT_ENCODING='gzip')
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+    def test_fast_list_serializer_matches_model_serializer(self):
+        appointments = Appointment.objects.filter(user=self.user).order_by('id')
+        Appointment.objects.filter(id=appointments[0].id).update(payment_id='order_1', payment_status='Paid')
+        self.assertEqual(AppointmentListSerializer(appointments).data, AppointmentSerializer(appointments, many=True).data)
+
+        fast = FastJSONRenderer().render(AppointmentListSerializer(appointments).data)
+        self.assertEqual(json.loads(fast), json.loads(JSONRenderer().render(AppointmentSerializer(appointments, many=True).data)))
+
+    def test_cancel_appointment(self):
+        appointment = self.book(next_booking_day())
+        # config lock, get, locked re-read, status update, stats upsert, waitlist lookup (+ savepoint pair)
+        with self.assertMaxQueries(9):
+            response = self.client.delete(reverse('cancel-appointment', args=[appointment.id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertMaxResponseSize(response, 200)
+
+        # Soft-deleted: kept for audit, no longer holds a slot, cannot be cancelled twice
+        appointment.refresh_from_db()
+        self.assertEqual(appointment.status, 'Cancelled')
+        self.assertFalse(Appointment.objects.active().filter(id=appointment.id).exists())
+        response = self.client.delete(reverse('cancel-appointment', args=[appointment.id]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_archive_old_appointments(self):
+        call_command('archive_appointments', days=30, batch_size=500, stdout=StringIO())
+        cutoff = date.today() - timedelta(days=30)
+        self.assertFalse(Appointment.objects.filter(date__lt=cutoff).exists())
+        self.assertEqual(ArchivedAppointment.objects.count(), (self.PAST_DAYS - 30) * self.PER_DAY)
+        self.assertEqual(Appointment.objects.filter(user=self.user).count(), self.OWN_APPOINTMENTS)
+
+    def test_cannot_cancel_other_users_appointment(self):
+        appointment = self.book(next_booking_day(), user=User.objects.get(username='other0'))
+        with self.assertMaxQueries(2):
+            response = self.client.delete(reverse('cancel-appointment', args=[appointment.id]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_config_get_and_update(self):
+        with self.assertMaxQueries(2):
+            response = self.client.get(reverse('appointment-config'))
+        self.assertEqual(response.status_code, 200)
+        self.assertMaxResponseSize(response, 300)
+
+        with self.assertMaxQueries(2):
+            response = self.client.patch(reverse('appointment-config'), {'max_per_hour': 4}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+
+
+class WaitlistEndpointTests(AppointmentAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.day = next_booking_day()
+        self.other = User.objects.get(username='other0')
+        # Fill the 10 o'clock hour (max_per_hour=3)
+        self.booked = [self.book(self.day, hour=10, user=self.other) for _ in range(3)]
+        self.payload = {'name': 'Waiting', 'age': 30, 'sex': 'F', 'date': str(self.day), 'time': '10:15',
+                        'department': 'Cardiology'}
+
+    def test_join_waitlist(self):
+        with self.assertMaxQueries(6):
+            response = self.client.post(reverse('waitlist'), self.payload, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(response.json()['position'], 1)
+
+        response = self.client.post(reverse('waitlist'), self.payload, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_rejects_hour_with_free_slots(self):
+        response = self.client.post(reverse('waitlist'), {**self.payload, 'time': '11:00'}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_cancellation_promotes_oldest_entry(self):
+        self.client.post(reverse('waitlist'), self.payload, format='json')
+        second = User.objects.get(username='other1')
+        authenticated_client(second).post(reverse('waitlist'), self.payload, format='json')
+
+        response = authenticated_client(self.other).delete(reverse('cancel-appointment', args=[self.booked[0].id]))
+        self.assertEqual(response.status_code, 200)
+
+        first_entry, second_entry = WaitlistEntry.objects.order_by('id')
+        self.assertEqual(first_entry.status, 'Promoted')
+        self.assertEqual(first_entry.appointment.user, self.user)
+        self.assertEqual(first_entry.appointment.time, time(10, 15))
+        self.assertEqual(second_entry.status, 'Waiting')
+        self.assertEqual(Appointment.objects.active().filter(date=self.day).count(), 3)
+
+    def test_cancelling_twice_promotes_one_entry(self):
+        self.client.post(reverse('waitlist'), self.payload, format='json')
+        authenticated_client(User.objects.get(username='other1')).post(reverse('waitlist'), self.payload, format='json')
+
+        # Both requests loaded the booking before either cancelled it, as with a double-click
+        stale = Appointment.objects.get(id=self.booked[0].id)
+        self.assertEqual(waitlist.cancel_and_backfill(self.booked[0])[0], True)
+        self.assertEqual(waitlist.cancel_and_backfill(stale), (False, None))
+
+        self.assertEqual(list(WaitlistEntry.objects.order_by('id').values_list('status', flat=True)),
+                         ['Promoted', 'Waiting'])
+        self.assertEqual(Appointment.objects.active().filter(date=self.day).count(), 3)
+        response = authenticated_client(self.other).delete(reverse('cancel-appointment', args=[self.booked[0].id]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_promotion_follows_the_booking_rules(self):
+        first = self.client.post(reverse('waitlist'), self.payload, format='json').json()['id']
+        second = authenticated_client(User.objects.get(username='other1')).post(
+            reverse('waitlist'), {**self.payload, 'department': 'Pediatrics'}, format='json').json()['id']
+        # Cardiology closed the hour after the first entry was waitlisted
+        Closure.objects.create(date=self.day, department='Cardiology', start_hour=10, end_hour=11, reason='Audit')
+        AppointmentConfig.objects.update(max_per_hour=2)
+
+        waitlist.cancel_and_backfill(self.booked[0])
+        self.assertEqual(WaitlistEntry.objects.get(id=first).status, 'Expired')
+        # Lowered to two an hour, the hour is still full after the cancellation
+        self.assertEqual(WaitlistEntry.objects.get(id=second).status, 'Waiting')
+
+        waitlist.cancel_and_backfill(self.booked[1])
+        self.assertEqual(WaitlistEntry.objects.get(id=second).status, 'Promoted')
+        self.assertEqual(Appointment.objects.active().filter(date=self.day).count(), 2)
+
+    def test_position_matches_promotion_order(self):
+        self.client.post(reverse('waitlist'), self.payload, format='json')
+        response = authenticated_client(User.objects.get(username='other1')).post(
+            reverse('waitlist'), {**self.payload, 'department': 'Pediatrics'}, format='json')
+        # One queue per hour across departments: the Pediatrics entry is promoted second
+        self.assertEqual(response.json()['position'], 2)
+
+        waitlist.cancel_and_backfill(self.booked[0])
+        self.assertEqual(waitlist.position(WaitlistEntry.objects.get(id=response.json()['id'])), 1)
+
+    def test_withdrawn_entry_is_skipped(self):
+        entry_id = self.client.post(reverse('waitlist'), self.payload, format='json').json()['id']
+        self.assertEqual(self.client.delete(reverse('leave-waitlist', args=[entry_id])).status_code, 204)
+
+        authenticated_client(self.other).delete(reverse('cancel-appointment', args=[self.booked[0].id]))
+        self.assertEqual(WaitlistEntry.objects.get(id=entry_id).status, 'Withdrawn')
+        self.assertEqual(Appointment.objects.active().filter(date=self.day).count(), 2)
+
+class PaymentEndpointTests(AppointmentAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch('appointments.views.razorpay_client')
+        self.razorpay = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.razorpay.order.create.return_value = {'id': 'order_test123', 'status': 'created'}
+        self.razorpay.utility.verify_payment_signature.return_value = True
+
+    def test_create_order(self):
+        appointment = self.book(next_booking_day())
+        with self.assertMaxQueries(3):
+            response = self.client.post(
+                reverse('create-razorpay-order'), {'amount': 500, 'appointment_id': appointment.id}, format='json'
+            )
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.json()['order_id'], 'order_test123')
+        self.assertMaxResponseSize(response, 300)
+
+    def test_verify_payment(self):
+        appointment = self.book(next_booking_day())
+        Appointment.objects.filter(id=appointment.id).update(payment_id='order_test123')
+        payload = {'order_id': 'order_test123', 'payment_id': 'pay_1', 'signature': 'sig'}
+        with self.assertMaxQueries(4):
+            response = self.client.post(reverse('verify-payment'), payload, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        appointment.refresh_from_db()
+        self.assertEqual(appointment.payment_status, 'Paid')
+        self.assertMaxResponseSize(response, 500)
+
+    async def test_create_order_async(self):
+        appointment = await Appointment.objects.acreate(
+            user=self.user, name='Async', age=35, sex='M', date=next_booking_day(), time=time(hour=10),
+        )
+        gateway = mock.Mock()
+        gateway.post = mock.AsyncMock(return_value=httpx.Response(200, json={'id': 'order_async', 'status': 'created'}))
+        with mock.patch('appointments.async_views._http_client', return_value=gateway):
+            response = await self.async_client.post(
+                reverse('create-razorpay-order-async'), {'amount': 500, 'appointment_id': appointment.id},
+                content_type='application/json', headers={'authorization': auth_header(self.user)},
+            )
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.json()['order_id'], 'order_async')
+        await appointment.arefresh_from_db()
+        self.assertEqual(appointment.payment_id, 'order_async')
+
+    async def test_verify_payment_async(self):
+        await Appointment.objects.acreate(
+            user=self.user, name='Async', age=35, sex='M', date=next_booking_day(), time=time(hour=10),
+            payment_id='order_async',
+        )
+        with mock.patch('appointments.async_views.razorpay_client', self.razorpay):
+            response = await self.async_client.post(
+                reverse('verify-payment-async'), {'order_id': 'order_async', 'payment_id': 'pay_1', 'signature': 'sig'},
+                content_type='application/json', headers={'authorization': auth_header(self.user)},
+            )
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.json()['appointment']['name'], 'Async')
+
+    async def test_async_payment_requires_token(self):
+        response = await self.async_client.post(reverse('verify-payment-async'), {}, content_type='application/json')
+        self.assertEqual(response.status_code, 401)
+
+
+class ProfileEndpointTests(AppointmentAPITestCase):
+    PROFILES = 20
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        PatientProfile.objects.bulk_create([
+            PatientProfile(user=cls.user, profile_name=f'member{i}', patient_name=f'Member {i}', age=20 + i, sex='O')
+            for i in range(cls.PROFILES)
+        ])
+
+    def test_list_profiles(self):
+        with self.assertMaxQueries(2):
+            response = self.client.get(reverse('patient-profiles'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), self.PROFILES)
+        self.assertMaxResponseSize(response, self.PROFILES * 250)
+
+    def test_list_profiles_is_cached_with_etag(self):
+        url = reverse('patient-profiles')
+        etag = self.client.get(url)['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(len(response.json()), self.PROFILES)
+
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        # A write anywhere drops the cached map, so the next list sees it under a new ETag
+        self.client.patch(reverse('patient-profile-detail', args=['member3']), {'age': 70}, format='json')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()[13]['age'], 70)  # name order: member0, member1, member10..19, member2, member3
+
+    def test_create_profile(self):
+        payload = {'profile_name': 'spouse', 'patient_name': 'Spouse', 'age': 33, 'sex': 'F'}
+        # user, insert; the savepoint pair guarding the constraint only appears under the test transaction
+        with self.assertMaxQueries(4):
+            response = self.client.post(reverse('patient-profiles'), payload, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+
+    def test_duplicate_profile_name_is_rejected_by_constraint(self):
+        payload = {'profile_name': 'member1', 'patient_name': 'Twin', 'age': 33, 'sex': 'F'}
+        response = self.client.post(reverse('patient-profiles'), payload, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('profile_name', response.json())
+
+        response = self.client.patch(reverse('patient-profile-detail', args=['member2']),
+                                     {'profile_name': 'member1'}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('profile_name', response.json())
+        self.assertEqual(PatientProfile.objects.filter(user=self.user).count(), self.PROFILES)
+
+    def test_profile_detail(self):
+        url = reverse('patient-profile-detail', args=['member1'])
+        with self.assertMaxQueries(2):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertMaxResponseSize(response, 300)
+
+        with self.assertMaxQueries(4):  # select, update, plus the savepoint pair (see test_create_profile)
+            response = self.client.patch(url, {'age': 50}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+        with self.assertMaxQueries(2):
+            response = self.client.delete(url)
+        self.assertEqual(response.status_code, 204)
+
+    def test_profile_for_appointment(self):
+        with self.assertMaxQueries(2):
+            response = self.client.get(reverse('get-profile-for-appointment', args=['member2']))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['name'], 'Member 2')
+        self.assertMaxResponseSize(response, 100)
+
+    def test_book_from_profile(self):
+        slot = {'date': next_booking_day().isoformat(), 'time': '10:00', 'department': 'Cardiology'}
+        # The profile map is one query; the booking itself costs what a plain create does
+        with self.assertMaxQueries(9):
+            response = self.client.post(reverse('create-appointment'), {'profile_name': 'member4', **slot}, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual((response.json()['name'], response.json()['age']), ('Member 4', 24))
+
+        profile_id = PatientProfile.objects.get(user=self.user, profile_name='member5').id
+        response = self.client.post(reverse('create-appointment'), {'profile': profile_id, **slot}, format='json')
+        self.assertEqual(response.json()['name'], 'Member 5')
+
+        response = self.client.post(reverse('create-appointment'), {'profile_name': 'nobody', **slot}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('profile_name', response.json())
+        response = self.client.post(reverse('create-appointment'), slot, format='json')
+        self.assertEqual(set(response.json()), {'name', 'age', 'sex'})
+
+    def test_book_several_profiles_at_once(self):
+        day = next_booking_day()
+        payload = {'profiles': ['member1', 'member2', 'member3'], 'date': day.isoformat(), 'time': '11:00',
+                   'department': 'Cardiology', 'doctor': 'Dr. Patel'}
+        self.book(day, hour=9, user=User.objects.get(username='other0'))
+        with self.assertMaxQueries(9):
+            response = self.client.post(reverse('create-appointment'), payload, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual([a['name'] for a in response.json()], ['Member 1', 'Member 2', 'Member 3'])
+        self.assertEqual([a['token_number'] for a in response.json()], [2, 3, 4])
+        self.assertEqual(DailyStats.objects.get(date=day, doctor='Dr. Patel').appointments, 4)
+
+        # The group filled the 11 o'clock hour; with one booking at noon only two seats remain there
+        payload['time'] = '11:30'
+        payload['profiles'] = ['member4']
+        response = self.client.post(reverse('create-appointment'), payload, format='json')
+        self.assertEqual(response.status_code, 400)
+
+        self.book(day, hour=12, user=User.objects.get(username='other0'))
+        payload.update(time='12:00', profiles=['member4', 'member5', 'member6'])
+        response = self.client.post(reverse('create-appointment'), payload, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Only 2 appointment(s) left', response.json()['time'])
+        self.assertFalse(Appointment.objects.filter(date=day, name='Member 4').exists())
+
+        payload['profiles'] = ['member4', str(PatientProfile.objects.get(user=self.user, profile_name='member4').id)]
+        response = self.client.post(reverse('create-appointment'), payload, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('profiles', response.json())
+
+
+class QueueEndpointTests(AppointmentAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.staff = User.objects.create_user('nurse', password='secret123', is_staff=True)
+        self.staff_client = authenticated_client(self.staff)
+        # Today's Cardiology queue: tokens 1 and 2 for others, 3 for the patient
+        other = User.objects.get(username='other0')
+        for hour in (9, 10):
+            self.book(date.today(), hour=hour, user=other)
+        self.appointment = self.book(date.today(), hour=11)
+
+    def advance(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.staff_client.post(reverse('queue-advance', args=['Cardiology']))
+
+    def test_advance_requires_staff(self):
+        response = self.client.post(reverse('queue-advance', args=['Cardiology']))
+        self.assertEqual(response.status_code, 403)
+
+    def test_position_and_wait(self):
+        self.assertEqual(self.advance().json()['now_serving'], 1)
+        with self.assertMaxQueries(4):
+            response = self.client.get(reverse('queue-status', args=[self.appointment.id]))
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual(body['status'], 'waiting')
+        self.assertEqual(body['position'], 2)
+        self.assertEqual(body['estimated_wait_minutes'], 20)
+
+        self.advance()
+        self.advance()
+        body = self.client.get(reverse('queue-status', args=[self.appointment.id])).json()
+        self.assertEqual(body['status'], 'serving')
+        self.assertEqual(self.advance().status_code, 409)
+
+    def test_cancellations_and_cancelled_appointments(self):
+        self.advance()
+        url = reverse('queue-status', args=[self.appointment.id])
+        self.assertEqual(self.client.get(url).json()['position'], 2)
+        # The day's tokens are served from the cache until an appointment changes
+        with self.assertMaxQueries(2):
+            self.client.get(url)
+
+        waitlist.cancel_and_backfill(Appointment.objects.get(date=date.today(), token_number=2))
+        self.assertEqual(self.client.get(url).json()['position'], 1)
+
+        self.client.delete(reverse('cancel-appointment', args=[self.appointment.id]))
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_long_poll_under_wsgi_answers_at_once(self):
+        with mock.patch('appointments.queue_tracker.broadcaster.wait') as wait:
+            response = self.client.get(reverse('queue-status', args=[self.appointment.id]), {'version': 0, 'wait': 20})
+        wait.assert_not_called()
+        self.assertEqual(response.json()['version'], 0)
+
+    async def test_long_poll_wakes_on_advance(self):
+        headers = {'authorization': auth_header(self.user)}
+        url = reverse('queue-status', args=[self.appointment.id])
+        with mock.patch('appointments.queue_tracker.broadcaster.wait') as wait:
+            response = await self.async_client.get(url, {'version': -1, 'wait': 20}, headers=headers)
+        wait.assert_not_called()  # the version is already newer
+        self.assertEqual(response.json()['version'], 0)
+
+        started = monotonic()
+        poll = asyncio.ensure_future(self.async_client.get(url, {'version': 0, 'wait': 20}, headers=headers))
+        await asyncio.sleep(0.1)
+        await sync_to_async(self.advance)()
+        body = (await poll).json()
+        self.assertLess(monotonic() - started, 2)
+        self.assertEqual((body['version'], body['now_serving']), (1, 1))
+
+    async def test_stream_pushes_snapshots(self):
+        response = await self.async_client.get(
+            reverse('queue-stream', args=[self.appointment.id]), headers={'authorization': auth_header(self.user)})
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        events = aiter(response.streaming_content)
+        self.assertIn('"version": 0', (await anext(events)).decode())
+        await sync_to_async(self.advance)()
+        event = (await anext(events)).decode()
+        self.assertIn('event: queue', event)
+        self.assertIn('"now_serving": 1', event)
+        await response.streaming_content.aclose()
+
+    def test_stream_under_wsgi_sends_one_snapshot(self):
+        response = self.client.get(reverse('queue-stream', args=[self.appointment.id]))
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        event = response.content.decode()
+        self.assertTrue(event.startswith('retry: 5000\n'))
+        self.assertIn('"status": "waiting"', event)
+
+        response = self.client.get(reverse('queue-stream', args=[self.book(next_booking_day()).id]))
+        self.assertIn('"status": "upcoming"', response.content.decode())
+        self.assertNotIn('retry:', response.content.decode())
+
+
+class RescheduleTests(AppointmentAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.staff = User.objects.create_user('scheduler', password='secret123', is_staff=True)
+        self.staff_client = authenticated_client(self.staff)
+        self.other = User.objects.get(username='other0')
+        self.source = next_booking_day()
+        self.target = next_booking_day((self.source - date.today()).days + 1)
+        self.moving = [self.book(self.source, hour=10) for _ in range(5)]
+        self.staying = self.book(self.source, hour=10, user=self.other)
+        Appointment.objects.filter(id=self.staying.id).update(doctor='Dr. Mehta')
+        # Two of the target day's three 10 AM places are taken
+        self.existing = [self.book(self.target, hour=10, user=self.other) for _ in range(2)]
+        Appointment.objects.filter(id__in=[a.id for a in self.existing]).update(doctor='Dr. Mehta')
+
+    def test_bulk_reschedule_packs_nearest_hours(self):
+        payload = {
+            'source_date': self.source.isoformat(), 'target_date': self.target.isoformat(),
+            'doctor': 'Dr. Patel', 'to_doctor': 'Dr. Rao',
+        }
+        # Fixed cost however many appointments move (one bulk update, one stats upsert batch)
+        with self.assertMaxQueries(9):
+            response = self.staff_client.post(reverse('reschedule-appointments'), payload, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.json()['moved'], 5)
+
+        moved = Appointment.objects.filter(id__in=[a.id for a in self.moving]).order_by('token_number')
+        self.assertEqual({a.date for a in moved}, {self.target})
+        self.assertEqual({a.doctor for a in moved}, {'Dr. Rao'})
+        # One place left at 10, then the nearest hours, earlier first on ties
+        self.assertEqual(sorted(a.time.hour for a in moved), [9, 9, 9, 10, 11])
+        existing_tokens = [a.token_number for a in self.existing]
+        self.assertEqual([a.token_number for a in moved], list(range(max(existing_tokens) + 1, max(existing_tokens) + 6)))
+        self.assertEqual(Appointment.objects.get(id=self.staying.id).date, self.source)
+
+    def test_reschedule_is_all_or_nothing(self):
+        AppointmentConfig.objects.filter(id=self.config.id).update(max_daily_appointments=5)
+        payload = {'source_date': self.source.isoformat(), 'target_date': self.target.isoformat(), 'doctor': 'Dr. Patel'}
+        response = self.staff_client.post(reverse('reschedule-appointments'), payload, format='json')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(len(response.json()['unplaced']), 2)
+        self.assertFalse(Appointment.objects.filter(date=self.target, doctor='Dr. Patel').exists())
+
+        call_command(
+            'reschedule_appointments', '--from', self.source.isoformat(), '--to', self.target.isoformat(),
+            '--doctor', 'Dr. Patel', '--allow-partial', stdout=StringIO(),
+        )
+        self.assertEqual(Appointment.objects.filter(date=self.target, doctor='Dr. Patel').count(), 3)
+
+        response = self.client.post(reverse('reschedule-appointments'), payload, format='json')
+        self.assertEqual(response.status_code, 403)
+
+
+class ClosureCalendarTests(AppointmentAPITestCase):
+
+    def test_calendar_checks_are_bitmap_lookups(self):
+        day = next_booking_day()
+        slot = booking_rules.BookingSlot(day, time(10), 'Cardiology')
+        with self.assertMaxQueries(0):
+            violations, _ = booking_rules.evaluate(slot, booking_rules.calendar_rules())
+        self.assertEqual(violations, [])
+        self.assertNotIn(13, calendar.open_hours(day))
+        sunday = day + timedelta(days=(6 - day.weekday()) % 7)
+        self.assertFalse(calendar.is_open(sunday))
+
+    def test_closures_block_bookings(self):
+        holiday = next_booking_day()
+        other_day = next_booking_day((holiday - date.today()).days + 1)
+        # Saving closures invalidates the calendar; the next check rebuilds it
+        Closure.objects.create(date=holiday, reason='Public holiday')
+        Closure.objects.create(date=other_day, department='Cardiology', start_hour=9, end_hour=12, reason='Staff training')
+
+        payload = {'name': 'Holiday', 'age': 30, 'sex': 'M', 'date': holiday.isoformat(), 'time': '10:00',
+                   'department': 'Pediatrics'}
+        response = self.client.post(reverse('create-appointment'), payload, format='json')
+        self.assertEqual(response.json(), {'date': ['The hospital is closed on this day (Public holiday).']})
+
+        payload.update(date=other_day.isoformat(), department='Cardiology')
+        response = self.client.post(reverse('create-appointment'), payload, format='json')
+        self.assertEqual(response.json(), {'time': ['Cardiology is closed at this time (Staff training).']})
+
+        # Other departments and later hours are unaffected
+        for department, hour in (('Pediatrics', '10:00'), ('Cardiology', '12:00')):
+            payload.update(department=department, time=hour)
+            response = self.client.post(reverse('create-appointment'), payload, format='json')
+            self.assertEqual(response.status_code, 201, response.content)
+
+
+class DailyStatsTests(AppointmentAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.staff = User.objects.create_user('manager', password='secret123', is_staff=True)
+        self.staff_client = authenticated_client(self.staff)
+
+    def assertRollupMatchesRebuild(self, start, end):
+        live = sorted(DailyStats.objects.filter(date__range=(start, end)).values_list(
+            'date', 'department', 'doctor', 'appointments', 'cancelled', 'completed', 'paid'))
+        call_command('backfill_daily_stats', '--start', start.isoformat(), '--end', end.isoformat(), stdout=StringIO())
+        rebuilt = sorted(DailyStats.objects.filter(date__range=(start, end)).values_list(
+            'date', 'department', 'doctor', 'appointments', 'cancelled', 'completed', 'paid'))
+        self.assertEqual(live, rebuilt)
+
+    def test_rollup_follows_create_update_cancel_and_payment(self):
+        day = next_booking_day()
+        later = next_booking_day((day - date.today()).days + 1)
+        payload = {'name': 'Stats', 'age': 30, 'sex': 'M', 'date': day.isoformat(), 'time': '10:00',
+                   'department': 'Cardiology', 'doctor': 'Dr. Patel'}
+        ids = [self.client.post(reverse('create-appointment'), payload, format='json').json()['id'] for _ in range(3)]
+
+        paid = Appointment.objects.get(id=ids[0])
+        paid.payment_status = 'Paid'
+        paid.save(update_fields=['payment_status'])
+        self.client.delete(reverse('cancel-appointment', args=[ids[1]]))
+        self.client.put(reverse('update-appointment'), {'id': ids[2], 'date': later.isoformat(), 'time': '11:00'}, format='json')
+
+        row = DailyStats.objects.get(date=day, department='Cardiology', doctor='Dr. Patel')
+        self.assertEqual((row.appointments, row.cancelled, row.paid), (1, 1, 1))
+        self.assertEqual(DailyStats.objects.get(date=later).appointments, 1)
+        self.assertRollupMatchesRebuild(day, later)
+
+    def test_deletes_subtract_but_archiving_keeps_counts(self):
+        old = date.today() - timedelta(days=5)
+        call_command('backfill_daily_stats', stdout=StringIO())
+        before = DailyStats.objects.get(date=old, doctor='Dr. Sharma').appointments
+
+        Appointment.objects.filter(date=old, doctor='Dr. Sharma').first().delete()
+        self.assertEqual(DailyStats.objects.get(date=old, doctor='Dr. Sharma').appointments, before - 1)
+
+        call_command('archive_appointments', days=1, stdout=StringIO())
+        self.assertEqual(DailyStats.objects.get(date=old, doctor='Dr. Sharma').appointments, before - 1)
+        self.assertRollupMatchesRebuild(old, old)
+
+    def test_stats_endpoint_reads_rollup_only(self):
+        start, end = date.today() - timedelta(days=30), date.today() - timedelta(days=1)
+        call_command('backfill_daily_stats', stdout=StringIO())
+        with self.assertMaxQueries(3):
+            response = self.staff_client.get(reverse('stats'), {'start': start.isoformat(), 'end': end.isoformat()})
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        # Fixture: PER_DAY appointments a day, plus one own appointment on each of the last 25 days
+        self.assertEqual(body['totals']['appointments'], 30 * self.PER_DAY + 25)
+        self.assertEqual(body['totals']['pending_revenue'], (30 * self.PER_DAY + 25) * 500)
+        self.assertEqual(len(body['rows']), 30)
+
+        response = self.staff_client.get(reverse('stats'), {'start': start.isoformat(), 'end': end.isoformat(),
+                                                            'group_by': 'doctor'})
+        self.assertEqual([(r['doctor'], r['appointments']) for r in response.json()['rows']],
+                         [('Dr. Sharma', 30 * self.PER_DAY), ('Dr. Joshi', 25)])
+        self.assertEqual(self.client.get(reverse('stats')).status_code, 403)
+
+
+class SharedCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.ns = Namespace('test', ttl=60)
+
+    def test_ttl_invalidation_and_stats(self):
+        self.ns.set('short', 1, ttl=0.2)
+        self.ns.set('long', 2)
+        self.assertEqual(self.ns.get('short'), 1)
+        sleep(0.3)
+        self.assertIsNone(self.ns.get('short'))
+        self.assertEqual(self.ns.get('long'), 2)
+
+        # One version bump drops every key of the namespace, and only of this one
+        other = Namespace('other')
+        other.set('long', 3)
+        self.ns.invalidate()
+        self.assertIsNone(self.ns.get('long'))
+        self.assertEqual(other.get('long'), 3)
+        self.assertEqual(self.ns.stats(), {'hit': 2, 'miss': 2, 'refresh': 0, 'hit_rate': 0.5})
+
+    def test_concurrent_misses_compute_once(self):
+        calls = []
+
+        def compute():
+            calls.append(1)
+            sleep(0.1)
+            return 'value'
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            results = list(pool.map(lambda _: self.ns.get_or_set('slow', compute), range(8)))
+        self.assertEqual(results, ['value'] * 8)
+        self.assertEqual(len(calls), 1)
+
+    def test_entries_are_refreshed_early_near_expiry(self):
+        # An entry that took as long to compute as it has left to live is refreshed before it expires
+        self.ns._store(self.ns.make_key('k'), 'old', 1, 5.0)
+        with mock.patch('appointment.cache.random.random', return_value=0.5):
+            self.assertEqual(self.ns.get_or_set('k', lambda: 'new'), 'new')
+        self.assertEqual(self.ns.stats()['refresh'], 1)
+
+    def test_file_backend(self):
+        with tempfile.TemporaryDirectory() as directory:
+            backend = {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': directory}
+            with self.settings(CACHES={'default': backend}):
+                ns = Namespace('files')
+                self.assertEqual(ns.get_or_set('k', lambda: {'a': 1}), {'a': 1})
+                self.assertEqual(Namespace('files').get('k'), {'a': 1})  # e.g. another worker
+                ns.invalidate()
+                self.assertIsNone(ns.get('k'))
+
+    def test_config_is_cached_until_saved(self):
+        config = AppointmentConfig.objects.create(max_daily_appointments=30, max_per_hour=3)
+        booking_rules.get_config()
+        with self.assertNumQueries(0):
+            self.assertEqual(booking_rules.get_config().max_per_hour, 3)
+        config.max_per_hour = 5
+        config.save()
+        self.assertEqual(booking_rules.get_config().max_per_hour, 5)
+
+
+class ReplicaRoutingTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('reader', password='secret123')
+        self.replica = mock.patch.dict(settings.DATABASES, {'replica': dict(settings.DATABASES['default'])})
+
+    def read_db(self, user):
+        class View:
+            @db_router.replica_reads
+            def get(self, request):
+                return db_router.ReplicaRouter().db_for_read(Appointment)
+
+        request = RequestFactory().get('/')
+        request.user = user
+        return View().get(request)
+
+    def test_router(self):
+        router = db_router.ReplicaRouter()
+        self.assertIsNone(router.db_for_read(Appointment))
+        with db_router.reading_from_replica():
+            self.assertEqual(router.db_for_read(Appointment), 'replica')
+            self.assertIsNone(router.db_for_write(Appointment))
+        self.assertFalse(router.allow_migrate('replica', 'appointments'))
+        self.assertTrue(router.allow_migrate('default', 'appointments'))
+
+    def test_reads_use_the_replica_only_when_configured(self):
+        self.assertIsNone(self.read_db(self.user))
+        with self.replica:
+            self.assertEqual(self.read_db(self.user), 'replica')
+
+    def test_writers_are_pinned_to_the_primary(self):
+        with self.replica:
+            middleware = db_router.ReplicaPinMiddleware(lambda request: HttpResponse(status=201))
+            request = RequestFactory().get('/')
+            request.user = self.user
+            middleware(request)
+            self.assertEqual(self.read_db(self.user), 'replica')
+
+            request = RequestFactory().post('/')
+            request.user = self.user
+            middleware(request)
+            self.assertIsNone(self.read_db(self.user))
+
+    def test_pin_middleware_is_unused_without_a_replica(self):
+        with self.assertRaises(MiddlewareNotUsed):
+            db_router.ReplicaPinMiddleware(lambda request: HttpResponse())
+
+
+class MetricsTests(TestCase):
+
+    def setUp(self):
+        registry.reset()
+        user = User.objects.create_user('measured', password='secret123')
+        self.appointment = Appointment.objects.create(
+            user=user, name='Measured', age=30, sex='O', date=date.today(), time=time(10), department='Cardiology',
+        )
+        self.headers = {'authorization': auth_header(user)}
+
+    @staticmethod
+    def server_timing_queries(response):
+        return int(re.search(r'desc="(\d+) queries"', response['Server-Timing']).group(1))
+
+    async def test_async_view_queries_are_counted(self):
+        with self.settings(METRICS_ENABLED=True):
+            response = await AsyncClient().get(
+                reverse('queue-status', args=[self.appointment.id]), headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        # The appointment and the queue row at least, run by the async ORM in a worker thread
+        self.assertGreaterEqual(self.server_timing_queries(response), 2)
+        self.assertIn('db_query_count_count{view="queue-status"} 1', registry.render())
+
+    def test_metrics_need_the_scrape_token(self):
+        url = reverse('metrics')
+        with self.settings(METRICS_ENABLED=True):
+            self.assertEqual(self.client.get(url).status_code, 404)
+            with self.settings(METRICS_TOKEN='scrape-secret'):
+                self.assertEqual(self.client.get(url).status_code, 403)
+                self.assertEqual(self.client.get(url, headers=self.headers).status_code, 403)
+                response = self.client.get(url, headers={'authorization': 'Bearer scrape-secret'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'# TYPE', response.content)
@@ -0,0 +1,131 @@
+"""
+Token-bucket rate limiting for DRF views (and the async chat view).
+
+Each scope has a policy in THROTTLE_RATES written like DRF rates, "20/min":
+a bucket of 20 tokens per user that refills continuously at 20 per minute,
+so short bursts are allowed but the sustained rate is capped. Buckets live
+in THROTTLE_STORE: "local" keeps them in process memory (no I/O, per-worker
+limits), "cache" keeps them in a Django cache so workers share one budget.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.throttling import BaseThrottle
+
+PERIODS = {"s": 1, "sec": 1, "m": 60, "min": 60, "h": 3600, "hour": 3600, "d": 86400, "day": 86400}
+
+
+def parse_rate(rate):
+    """'20/min' -> (capacity, tokens per second); None disables the throttle"""
+    if not rate:
+        return None
+    count, period = rate.split("/")
+    capacity = int(count)
+    return capacity, capacity / PERIODS[period]
+
+
+def _refill(bucket, capacity, refill_rate, now):
+    tokens, updated = bucket[:2] if bucket else (capacity, now)
+    return min(capacity, tokens + (now - updated) * refill_rate)
+
+
+class LocalBucketStore:
+    """Buckets in a process-local dict; idle full buckets are swept occasionally"""
+
+    SWEEP_EVERY = 1000
+
+    def __init__(self):
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self._calls = 0
+
+    def consume(self, key, capacity, refill_rate):
+        """Take one token; returns seconds to wait (0.0 when allowed)"""
+        now = time.monotonic()
+        with self._lock:
+            tokens = _refill(self._buckets.get(key), capacity, refill_rate, now)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            # (tokens, updated, time at which the bucket is full again)
+            self._buckets[key] = (tokens, now, now + (capacity - tokens) / refill_rate)
+            self._calls += 1
+            if self._calls % self.SWEEP_EVERY == 0:
+                self._sweep(now)
+        return 0.0 if allowed else (1 - tokens) / refill_rate
+
+    def _sweep(self, now):
+        # A bucket that has refilled completely is the same as no bucket
+        self._buckets = {key: bucket for key, bucket in self._buckets.items() if bucket[2] > now}
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+class CacheBucketStore:
+    """
+    Buckets in a Django cache shared by all workers.
+    The read-modify-write is not atomic across processes, so two simultaneous
+    requests may both take the last token; the limit is approximate by one.
+    """
+
+    def __init__(self, alias="default"):
+        self.alias = alias
+        self._lock = threading.Lock()
+
+    def consume(self, key, capacity, refill_rate):
+        cache = caches[self.alias]
+        now = time.time()
+        with self._lock:
+            tokens = _refill(cache.get(f"throttle:{key}"), capacity, refill_rate, now)
+            allowed = tokens >= 1
+            # Expire once the bucket would be full again anyway
+            timeout = int(capacity / refill_rate) + 1
+            cache.set(f"throttle:{key}", (tokens - 1 if allowed else tokens, now), timeout)
+        return 0.0 if allowed else (1 - tokens) / refill_rate
+
+
+def _build_store():
+    if getattr(settings, "THROTTLE_STORE", "local") == "cache":
+        return CacheBucketStore(getattr(settings, "THROTTLE_CACHE_ALIAS", "default"))
+    return LocalBucketStore()
+
+
+bucket_store = _build_store()
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """Per-user (or per-IP for anonymous requests) token bucket for one scope"""
+
+    scope = None
+
+    def __init__(self):
+        self.policy = parse_rate(getattr(settings, "THROTTLE_RATES", {}).get(self.scope))
+        self._wait = None
+
+    def get_ident_key(self, request):
+        user = getattr(request, "user", None)
+        if user is not None and user.is_authenticated:
+            return f"{self.scope}:user:{user.pk}"
+        return f"{self.scope}:ip:{self.get_ident(request)}"
+
+    def allow_request(self, request, view):
+        if self.policy is None:
+            return True
+        capacity, refill_rate = self.policy
+        self._wait = bucket_store.consume(self.get_ident_key(request), capacity, refill_rate)
+        return self._wait == 0.0
+
+    def wait(self):
+        return self._wait
+
+
+class ChatThrottle(TokenBucketThrottle):
+    scope = "chat"
+
+
+class BookingThrottle(TokenBucketThrottle):
+    scope = "booking"
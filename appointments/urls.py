@@ -2,9 +2,13 @@ from django.urls import path
 from .views import (
     RegisterView, LoginView, ProtectedView,
     CreateAppointmentView, UpdateAppointmentView, ViewAppointmentsView, CancelAppointmentView,
+    RescheduleAppointmentsView,
     create_razorpay_order, verify_payment, PatientProfileView, PatientProfileDetailView, 
     GetProfileForAppointmentView, AppointmentConfigView,
+    QueueAdvanceView, WaitlistView, LeaveWaitlistView,
+    StatsView,
 )
+from .async_views import create_razorpay_order_async, queue_status, queue_stream, verify_payment_async
 
 urlpatterns = [
     # Authentication routes
@@ -17,14 +21,31 @@ urlpatterns = [
     path('appointments/update/', UpdateAppointmentView.as_view(), name='update-appointment'),
     path('appointments/view/', ViewAppointmentsView.as_view(), name='view-appointment'),
     path('appointments/cancel/<int:pk>/', CancelAppointmentView.as_view(), name='cancel-appointment'),
+    path('appointments/reschedule/', RescheduleAppointmentsView.as_view(), name='reschedule-appointments'),
     
+    # Waitlist routes
+    path('appointments/waitlist/', WaitlistView.as_view(), name='waitlist'),
+    path('appointments/waitlist/<int:pk>/', LeaveWaitlistView.as_view(), name='leave-waitlist'),
+
     # Appointment configuration
     path('appointments/config/', AppointmentConfigView.as_view(), name='appointment-config'),
 
+    # Live queue routes
+    path('queue/<str:department>/advance/', QueueAdvanceView.as_view(), name='queue-advance'),
+    path('queue/status/<int:appointment_id>/', queue_status, name='queue-status'),
+    path('queue/stream/<int:appointment_id>/', queue_stream, name='queue-stream'),
+
+    # Dashboard
+    path('stats/', StatsView.as_view(), name='stats'),
+
     # Payment routes
     path("create-order/", create_razorpay_order, name="create-razorpay-order"),
     path("verify-payment/", verify_payment, name="verify-payment"),
 
+    # Async payment routes (served natively under ASGI)
+    path("async/create-order/", create_razorpay_order_async, name="create-razorpay-order-async"),
+    path("async/verify-payment/", verify_payment_async, name="verify-payment-async"),
+
     # Patient Profile routes
     path('profiles/', PatientProfileView.as_view(), name='patient-profiles'),
     path('profiles/<str:profile_name>/', PatientProfileDetailView.as_view(), name='patient-profile-detail'),
@@ -2,14 +2,24 @@ from django.contrib.auth.models import User
 from rest_framework import status, generics
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from rest_framework.permissions import IsAuthenticated
-from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
+from rest_framework.exceptions import NotFound
+from rest_framework.renderers import BrowsableAPIRenderer
 from django.shortcuts import get_object_or_404
-from .serializers import RegisterSerializer, LoginSerializer, AppointmentSerializer,PatientProfileSerializer,AppointmentConfigSerializer
-from .models import Appointment,PatientProfile,AppointmentConfig
+from django.db.models import Count, Max
+from .serializers import RegisterSerializer, LoginSerializer, AppointmentSerializer,AppointmentListSerializer,GroupAppointmentSerializer,PatientProfileSerializer,AppointmentConfigSerializer,WaitlistEntrySerializer,RescheduleRequestSerializer
+from .models import Appointment,PatientProfile,AppointmentConfig,WaitlistEntry
+from .authentication import StatelessJWTAuthentication
+from .throttling import BookingThrottle
+from . import booking_rules, profile_cache, queue_tracker, reschedule, stats, waitlist
+import json
 from datetime import date,time
 import razorpay
 from razorpay.errors import BadRequestError, ServerError
+from appointment.metrics import timer
+from appointment.conditional import conditional, not_modified, set_validators
+from appointment.db_router import replica_reads
+from appointment.serialization import FastJSONRenderer
 from django.conf import settings
 from django.http import JsonResponse
 from rest_framework.decorators import api_view, authentication_classes, permission_classes
@@ -35,7 +45,7 @@ class LoginView(APIView):
 
 class ProtectedView(APIView):
     """Protected API endpoint"""
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [StatelessJWTAuthentication]
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
@@ -48,7 +58,7 @@ class ProtectedView(APIView):
 class AppointmentConfigView(generics.RetrieveUpdateAPIView):
     """View for getting and updating appointment configuration"""
     serializer_class = AppointmentConfigSerializer
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [StatelessJWTAuthentication]
     permission_classes = [IsAuthenticated]
     
     def get_object(self):
@@ -60,65 +70,26 @@ class CreateAppointmentView(generics.CreateAPIView):
     """Create new appointment and auto-assign token"""
     queryset = Appointment.objects.all()
     serializer_class = AppointmentSerializer
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [StatelessJWTAuthentication]
     permission_classes = [IsAuthenticated]
+    throttle_classes = [BookingThrottle]
 
-    def perform_create(self, serializer):
-        selected_date = serializer.validated_data['date']
-        selected_time = serializer.validated_data['time']
-
-        # Check if appointment date is not in the past
-        if selected_date < date.today():
-            raise serializer.ValidationError({"date": "Cannot book appointments for past dates."})
+    def create(self, request, *args, **kwargs):
+        # {"profiles": [...]} books the same slot for several saved profiles at once
+        if 'profiles' not in request.data:
+            return super().create(request, *args, **kwargs)
+        serializer = GroupAppointmentSerializer(data=request.data, context=self.get_serializer_context())
+        serializer.is_valid(raise_exception=True)
+        appointments = serializer.save(user=request.user)
+        return Response(AppointmentSerializer(appointments, many=True).data, status=status.HTTP_201_CREATED)
 
-        # Check if date is Sunday
-        if selected_date.weekday() == 6:
-            raise serializer.ValidationError({"date": "Appointments are not available on Sundays."})
-            
-        # Check lunch break
-        if selected_time.hour == 13:
-            raise serializer.ValidationError({"time": "Appointments are not available during lunch break (1 PM to 2 PM)."})
-
-        # Get configuration
-        config = AppointmentConfig.objects.first()
-        if not config:
-            config = AppointmentConfig.objects.create()
-
-        # Check daily appointment limit
-        daily_count = Appointment.objects.filter(date=selected_date).count()
-        if daily_count >= config.max_daily_appointments:
-            raise serializer.ValidationError(
-                {"date": f"Maximum appointments ({config.max_daily_appointments}) for this day have been reached."}
-            )
-            
-        # Check hourly appointment limit
-        start_hour_time = time(hour=selected_time.hour)
-        end_hour_time = time(hour=selected_time.hour, minute=59, second=59)
-        
-        hourly_count = Appointment.objects.filter(
-            date=selected_date,
-            time__gte=start_hour_time,
-            time__lte=end_hour_time
-        ).count()
-        
-        if hourly_count >= config.max_per_hour:
-            raise serializer.ValidationError({
-                "time": f"Maximum appointments ({config.max_per_hour}) for this hour have been reached. Please select a different time."
-            })
-
-        # Use transaction to prevent race conditions
-        from django.db import transaction
-        with transaction.atomic():
-            # Count all appointments on the selected date
-            existing_appointments = Appointment.objects.filter(date=selected_date).count()
-            token_number = existing_appointments + 1
-
-            # Assign the logged-in user to the appointment
-            serializer.save(user=self.request.user, token_number=token_number)
+    def perform_create(self, serializer):
+        # AppointmentSerializer.create re-checks capacity and assigns the token under the config lock
+        serializer.save(user=self.request.user)
 
 class UpdateAppointmentView(APIView):
     """Update appointment date and reassign token"""
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [StatelessJWTAuthentication]
     permission_classes = [IsAuthenticated]
 
     def put(self, request):
@@ -132,68 +103,36 @@ class UpdateAppointmentView(APIView):
 
         try:
             # Get appointment
-            appointment = get_object_or_404(Appointment, id=appointment_id, user=request.user)
+            appointment = get_object_or_404(Appointment.objects.active(), id=appointment_id, user=request.user)
             
             # Convert string to date and time objects
             from datetime import datetime
             new_date = datetime.strptime(new_date_str, '%Y-%m-%d').date()
             new_time = datetime.strptime(new_time_str, '%H:%M').time()
             
-            # Validate date and time
-            if new_date < date.today():
-                return Response({"error": "Appointment date cannot be in the past"}, 
-                                status=status.HTTP_400_BAD_REQUEST)
-                                
-            # Check if date is Sunday
-            if new_date.weekday() == 6:
-                return Response({"error": "Appointments are not available on Sundays"}, 
-                                status=status.HTTP_400_BAD_REQUEST)
-                                
-            # Check lunch break
-            if new_time.hour == 13:
-                return Response({"error": "Appointments are not available during lunch break (1 PM to 2 PM)"}, 
-                                status=status.HTTP_400_BAD_REQUEST)
-                
-            # Get configuration
-            config = AppointmentConfig.objects.first()
-            if not config:
-                config = AppointmentConfig.objects.create()
-                
             # Check if there are any changes
             if appointment.date == new_date and appointment.time == new_time:
                 return Response({"message": "No changes made", "appointment": AppointmentSerializer(appointment).data}, 
                                 status=status.HTTP_200_OK)
                 
-            # Check daily appointment limit
-            daily_count = Appointment.objects.filter(date=new_date).exclude(id=appointment_id).count()
-            if daily_count >= config.max_daily_appointments:
-                return Response(
-                    {"error": f"Maximum appointments ({config.max_daily_appointments}) for this day have been reached"}, 
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-                
-            # Check hourly appointment limit
-            start_hour_time = time(hour=new_time.hour)
-            end_hour_time = time(hour=new_time.hour, minute=59, second=59)
-            
-            hourly_count = Appointment.objects.filter(
-                date=new_date,
-                time__gte=start_hour_time,
-                time__lte=end_hour_time
-            ).exclude(id=appointment_id).count()
-            
-            if hourly_count >= config.max_per_hour:
-                return Response({
-                    "error": f"Maximum appointments ({config.max_per_hour}) for this hour have been reached. Please select a different time."
-                }, status=status.HTTP_400_BAD_REQUEST)
+            # Same rules as booking; the appointment itself does not count against capacity
+            slot = booking_rules.BookingSlot(new_date, new_time, appointment.department, exclude_id=appointment.id)
+            violations, _ = booking_rules.evaluate(slot, booking_rules.calendar_rules())
+            if violations:
+                return Response({"error": violations[0].message}, status=status.HTTP_400_BAD_REQUEST)
             
         except ValueError:
             return Response({"error": "Invalid date or time format. Use YYYY-MM-DD for date and HH:MM for time"}, 
                             status=status.HTTP_400_BAD_REQUEST)
 
-        # Use transaction to prevent race conditions when updating token
+        # Capacity under the config lock; a move to another day gets a token there
         from django.db import transaction
         with transaction.atomic():
+            violations, token_number = booking_rules.reserve(slot)
+            if violations:
+                return Response({"error": violations[0].message}, status=status.HTTP_400_BAD_REQUEST)
+            if new_date != appointment.date:
+                appointment.token_number = token_number
             appointment.date = new_date
             appointment.time = new_time
             appointment.save()
@@ -202,20 +141,51 @@ class UpdateAppointmentView(APIView):
                         status=status.HTTP_200_OK)
 
 
+class RescheduleAppointmentsView(APIView):
+    """Staff only: move a day's appointments (optionally one doctor or department) to another day at once"""
+    authentication_classes = [StatelessJWTAuthentication]
+    permission_classes = [IsAdminUser]
+
+    def post(self, request):
+        serializer = RescheduleRequestSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            plan = reschedule.reschedule(**serializer.validated_data)
+        except reschedule.RescheduleError as e:
+            body = {"error": str(e)}
+            if e.plan is not None:
+                body["unplaced"] = [appointment.id for appointment in e.plan.unplaced]
+            return Response(body, status=status.HTTP_409_CONFLICT)
+        return Response(plan.as_dict(), status=status.HTTP_200_OK)
+
+
 class ViewAppointmentsView(generics.ListAPIView):
-    """View only the logged-in user's appointments"""
+    """View only the logged-in user's booked appointments (?include_cancelled=1 adds cancelled ones)"""
     serializer_class = AppointmentSerializer
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [StatelessJWTAuthentication]
     permission_classes = [IsAuthenticated]
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
 
     def get_queryset(self):
-        return Appointment.objects.filter(user=self.request.user)
+        if self.request.query_params.get('include_cancelled') in ('1', 'true'):
+            return Appointment.objects.filter(user=self.request.user)
+        return Appointment.objects.active().filter(user=self.request.user)
+
+    def _fingerprint(self, request, *args, **kwargs):
+        state = self.get_queryset().aggregate(n=Count('id'), last=Max('updated_at'))
+        return state['n'], state['last']
+
+    @replica_reads
+    @conditional(_fingerprint)
+    def list(self, request, *args, **kwargs):
+        # Rows straight from values(); see appointment/serialization.py
+        return Response(AppointmentListSerializer(self.get_queryset()).data)
 
 # **3. Payment Integration**
 razorpay_client = razorpay.Client(auth=(settings.RAZORPAY_KEY_ID, settings.RAZORPAY_KEY_SECRET))
 
 @api_view(["POST"])
-@authentication_classes([JWTAuthentication])
+@authentication_classes([StatelessJWTAuthentication])
 @permission_classes([IsAuthenticated])
 def create_razorpay_order(request):
     """Create a Razorpay order but do NOT finalize booking yet"""
@@ -242,11 +212,12 @@ def create_razorpay_order(request):
         currency = "INR"
 
         try:
-            razorpay_order = razorpay_client.order.create({
-                "amount": amount,
-                "currency": currency,
-                "payment_capture": "1"
-            })
+            with timer("payment"):
+                razorpay_order = razorpay_client.order.create({
+                    "amount": amount,
+                    "currency": currency,
+                    "payment_capture": "1"
+                })
         except BadRequestError as e:
             return JsonResponse({"error": f"Razorpay error: {str(e)}"}, status=400)
         except ServerError as e:
@@ -270,7 +241,7 @@ def create_razorpay_order(request):
 
 
 @api_view(["POST"])
-@authentication_classes([JWTAuthentication])
+@authentication_classes([StatelessJWTAuthentication])
 @permission_classes([IsAuthenticated])
 def verify_payment(request):
     """Verify Razorpay payment and confirm appointment booking"""
@@ -319,13 +290,20 @@ def verify_payment(request):
 
 
 class PatientProfileView(generics.ListCreateAPIView):
-    """Create and list patient profiles"""
+    """
+    Create and list patient profiles. The list is served from the per-user
+    profile cache with an ETag; a matching If-None-Match gets 304.
+    """
     serializer_class = PatientProfileSerializer
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [StatelessJWTAuthentication]
     permission_classes = [IsAuthenticated]
     
     def get_queryset(self):
         return PatientProfile.objects.filter(user=self.request.user)
+
+    def list(self, request, *args, **kwargs):
+        profiles, etag = profile_cache.get_profiles(request.user.id)
+        return not_modified(request, etag) or set_validators(Response(profiles), etag)
         
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
@@ -334,40 +312,45 @@ class PatientProfileView(generics.ListCreateAPIView):
 class PatientProfileDetailView(generics.RetrieveUpdateDestroyAPIView):
     """Retrieve, update, or delete a patient profile using profile_name"""
     serializer_class = PatientProfileSerializer
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [StatelessJWTAuthentication]
     permission_classes = [IsAuthenticated]
     lookup_field = 'profile_name'  
     
     def get_queryset(self):
         return PatientProfile.objects.filter(user=self.request.user)
 
+    def retrieve(self, request, *args, **kwargs):
+        profile = profile_cache.get_profile(request.user.id, kwargs['profile_name'])
+        if profile is None:
+            return Response({"error": "Profile not found"}, status=status.HTTP_404_NOT_FOUND)
+        return Response(profile)
+
 class GetProfileForAppointmentView(APIView):
     """Fetch profile data for use in appointment booking using profile_name"""
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [StatelessJWTAuthentication]
     permission_classes = [IsAuthenticated]
     
     def get(self, request, profile_name):
-        try:
-            profile = PatientProfile.objects.get(profile_name=profile_name, user=request.user)
-            return Response({
-                "name": profile.patient_name,
-                "age": profile.age,
-                "sex": profile.sex
-            }, status=status.HTTP_200_OK)
-        except PatientProfile.DoesNotExist:
+        profile = profile_cache.get_profile(request.user.id, profile_name)
+        if profile is None:
             return Response({"error": "Profile not found"}, status=status.HTTP_404_NOT_FOUND)
+        return Response({
+            "name": profile["patient_name"],
+            "age": profile["age"],
+            "sex": profile["sex"]
+        }, status=status.HTTP_200_OK)
         
 
 
 class CancelAppointmentView(generics.DestroyAPIView):
     """Cancel an appointment"""
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [StatelessJWTAuthentication]
     permission_classes = [IsAuthenticated]
     queryset = Appointment.objects.all()
     
     def get_queryset(self):
-        # Ensure users can only cancel their own appointments
-        return Appointment.objects.filter(user=self.request.user)
+        # Ensure users can only cancel their own, still active appointments
+        return Appointment.objects.filter(user=self.request.user, status='Booked')
     
     def destroy(self, request, *args, **kwargs):
         instance = self.get_object()
@@ -385,9 +368,96 @@ class CancelAppointmentView(generics.DestroyAPIView):
             # For example, not allowing cancellation if it's too close to the appointment time
             pass
             
-        # Perform the deletion
-        self.perform_destroy(instance)
+        # Soft-cancel and hand the freed slot to the oldest waitlisted request
+        cancelled, _ = waitlist.cancel_and_backfill(instance)
+        if not cancelled:
+            raise NotFound
         return Response(
             {"message": "Appointment cancelled successfully"}, 
             status=status.HTTP_200_OK
-        )
\ No newline at end of file
+        )
+
+
+class WaitlistView(generics.ListCreateAPIView):
+    """Join the waitlist for a full hour, or list the user's waitlist entries"""
+    serializer_class = WaitlistEntrySerializer
+    authentication_classes = [StatelessJWTAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        return WaitlistEntry.objects.filter(user=self.request.user)
+
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        entry = serializer.save(user=request.user)
+        return Response(
+            {**serializer.data, "position": waitlist.position(entry)},
+            status=status.HTTP_201_CREATED
+        )
+
+
+class LeaveWaitlistView(generics.DestroyAPIView):
+    """Withdraw a waiting entry"""
+    authentication_classes = [StatelessJWTAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        return WaitlistEntry.objects.filter(user=self.request.user, status='Waiting')
+
+    def perform_destroy(self, instance):
+        # Kept for history; only Waiting entries are ever promoted
+        instance.status = 'Withdrawn'
+        instance.save(update_fields=['status'])
+
+
+# **4. Live Queue**
+class QueueAdvanceView(APIView):
+    """Staff: move a department's queue to the next token (or to a given token)"""
+    authentication_classes = [StatelessJWTAuthentication]
+    permission_classes = [IsAdminUser]
+
+    def post(self, request, department):
+        token = request.data.get("token")
+        if token is not None and not str(token).isdigit():
+            return Response({"error": "token must be a positive integer"}, status=status.HTTP_400_BAD_REQUEST)
+
+        queue, advanced = queue_tracker.advance_queue(department, int(token) if token is not None else None)
+        if not advanced:
+            return Response({"error": "No more tokens waiting in this department today"}, status=status.HTTP_409_CONFLICT)
+        return Response({
+            "department": queue.department,
+            "now_serving": queue.now_serving,
+            "served_count": queue.served_count,
+            "avg_consult_minutes": round(queue.avg_consult_seconds / 60, 1),
+            "version": queue.version,
+        }, status=status.HTTP_200_OK)
+
+
+# **5. Dashboard**
+
+class StatsView(APIView):
+    """Staff only: bookings, revenue and load for a date range, read from the DailyStats rollup"""
+    authentication_classes = [StatelessJWTAuthentication]
+    permission_classes = [IsAdminUser]
+    MAX_RANGE_DAYS = 366
+
+    @replica_reads
+    def get(self, request):
+        from datetime import datetime, timedelta
+        try:
+            end = datetime.strptime(request.query_params['end'], '%Y-%m-%d').date() if 'end' in request.query_params else date.today()
+            start = (datetime.strptime(request.query_params['start'], '%Y-%m-%d').date()
+                     if 'start' in request.query_params else end - timedelta(days=29))
+        except ValueError:
+            return Response({"error": "Use YYYY-MM-DD for start and end"}, status=status.HTTP_400_BAD_REQUEST)
+
+        group_by = request.query_params.get('group_by', 'day')
+        if group_by not in stats.GROUPINGS:
+            return Response({"error": f"group_by must be one of {', '.join(stats.GROUPINGS)}"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if start > end or (end - start).days >= self.MAX_RANGE_DAYS:
+            return Response({"error": f"start must not be after end, and the range is limited to {self.MAX_RANGE_DAYS} days"},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        return Response(stats.summarize(start, end, group_by), status=status.HTTP_200_OK)
@@ -0,0 +1,82 @@
+"""
+Waitlist backfill for full hourly slots.
+
+Users turned away by the max_per_hour check enqueue once instead of retrying
+the create endpoint. When a booking is cancelled, the oldest waiting entry
+for that date and hour is turned into an appointment inside the same
+transaction as the cancellation. Capacity is shared across departments, so
+the hour has one queue in joining order whatever the department, and the
+position shown to a user is their place in it. A promotion is a booking like
+any other and must pass the booking rules for its slot.
+"""
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import booking_rules
+from .models import Appointment, WaitlistEntry
+
+
+def waiting_for_slot(day, hour):
+    return WaitlistEntry.objects.filter(date=day, hour=hour, status='Waiting')
+
+
+def position(entry):
+    """1-based place of a waiting entry in its slot's queue, in the order promote_next() takes them"""
+    ahead = Q(created_at__lt=entry.created_at) | Q(created_at=entry.created_at, id__lte=entry.id)
+    return waiting_for_slot(entry.date, entry.hour).filter(ahead).count()
+
+
+def promote_next(day, hour, config=None):
+    """
+    Book the next waiting entry for a freed (date, hour) slot, checked with the same booking
+    rules as any other booking. Entries whose slot has since been closed are expired and
+    skipped; if the hour is still at capacity (e.g. max_per_hour was lowered) nobody is
+    promoted. Must run inside the transaction that freed the slot, under lock_config()
+    (whose row can be passed as config); returns the new Appointment or None.
+    """
+    entries = waiting_for_slot(day, hour).select_for_update(skip_locked=True).order_by('created_at', 'id')
+    for entry in entries:
+        slot = booking_rules.BookingSlot(entry.date, entry.time, entry.department)
+        violations, _ = booking_rules.evaluate(slot, booking_rules.calendar_rules())
+        if not violations:
+            break
+        entry.status = 'Expired'
+        entry.save(update_fields=['status'])
+    else:
+        return None
+    violations, _ = booking_rules.evaluate(
+        slot, booking_rules.capacity_rules(), booking_rules.take_snapshot(slot, config),
+    )
+    if violations:
+        return None
+
+    # token_number is left to the pre_save signal (highest token of the day + 1)
+    appointment = Appointment.objects.create(
+        user_id=entry.user_id, name=entry.name, age=entry.age, sex=entry.sex,
+        date=entry.date, time=entry.time, department=entry.department, doctor=entry.doctor,
+    )
+    entry.status = 'Promoted'
+    entry.appointment = appointment
+    entry.promoted_at = timezone.now()
+    entry.save(update_fields=['status', 'appointment', 'promoted_at'])
+    return appointment
+
+
+def cancel_and_backfill(appointment):
+    """
+    Cancel a booking (the row is kept for audit) and hand its slot to the waitlist atomically.
+    Returns (cancelled, promoted appointment or None); cancelled is False when the booking
+    was no longer active, e.g. a second, concurrent cancel of the same appointment.
+    """
+    with transaction.atomic():
+        # The promotion adds a booking and a token, so it takes the config lock like booking does
+        config = booking_rules.lock_config()
+        # Re-read under the lock: only the request that actually cancels may free the seat
+        locked = Appointment.objects.select_for_update().filter(pk=appointment.pk, status='Booked').first()
+        if locked is None:
+            return False, None
+        locked.status = appointment.status = 'Cancelled'
+        locked.cancelled_at = appointment.cancelled_at = timezone.now()
+        locked.save(update_fields=['status', 'cancelled_at'])
+        return True, promote_next(locked.date, locked.time.hour, config)
@@ -1,6 +1,6 @@
 # hospital_assistant/admin.py
 from django.contrib import admin
-from .models import ChatSession, ChatMessage
+from .models import ChatSession, ChatMessage, LLMUsage
 
 class ChatMessageInline(admin.TabularInline):
     model = ChatMessage
@@ -23,4 +23,10 @@ class ChatMessageAdmin(admin.ModelAdmin):
     
     def short_message(self, obj):
         return obj.message[:50] + ('...' if len(obj.message) > 50 else '')
-    short_message.short_description = 'Message'
\ No newline at end of file
+    short_message.short_description = 'Message'
+
+@admin.register(LLMUsage)
+class LLMUsageAdmin(admin.ModelAdmin):
+    list_display = ['user', 'day', 'tokens', 'calls']
+    list_filter = ['day']
+    search_fields = ['user__username']
\ No newline at end of file
@@ -1,6 +1,19 @@
+import gc
+
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class ChatConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'chat'
+
+    def ready(self):
+        # With `gunicorn --preload` this runs once in the master: the TF-IDF
+        # index is built before fork and shared copy-on-write by all workers.
+        # gc.freeze() moves everything allocated so far out of the collector's
+        # reach so GC passes in the workers don't touch (and copy) those pages.
+        if getattr(settings, "CHAT_PRELOAD_ASSISTANT", False):
+            from .gemini_assistant import get_assistant
+            get_assistant()
+            gc.freeze()
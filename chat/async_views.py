@@ -0,0 +1,87 @@
+# hospital_assistant/async_views.py
+import json
+import uuid
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+
+from appointment.metrics import timer
+from appointments.authentication import async_jwt_required
+from appointments.throttling import ChatThrottle
+from .models import ChatSession, ChatMessage
+from .serializers import ChatRequestSerializer
+from .gemini_assistant import assistant_is_loaded, get_assistant
+from .intents import record_turn, route_message
+from .quotas import atokens_used_today, charge, quota_exceeded
+
+
+@csrf_exempt
+@require_POST
+@async_jwt_required
+async def async_chat_view(request):
+    """
+    Async variant of ChatView: the Gemini call is awaited instead of holding a
+    worker thread, so one ASGI process can keep many LLM calls in flight.
+    """
+    try:
+        data = json.loads(request.body or b"{}")
+    except ValueError:
+        return JsonResponse({"error": "Invalid JSON body"}, status=400)
+
+    # Same token bucket as ChatView's DRF throttle
+    throttle = ChatThrottle()
+    if not throttle.allow_request(request, None):
+        response = JsonResponse({"detail": "Request was throttled."}, status=429)
+        response["Retry-After"] = str(int(throttle.wait() + 1))
+        return response
+
+    serializer = ChatRequestSerializer(data=data)
+    if not serializer.is_valid():
+        return JsonResponse(serializer.errors, status=400)
+
+    user_message = serializer.validated_data['message']
+    session_id = serializer.validated_data.get('session_id', '')
+
+    routed = route_message(user_message)
+
+    if not routed and quota_exceeded(await atokens_used_today(request.user)):
+        return JsonResponse({"error": "Daily assistant quota reached. Please try again tomorrow."}, status=429)
+
+    # Get or create chat session
+    chat_session = None
+    if session_id:
+        chat_session = await ChatSession.objects.filter(session_id=session_id, user=request.user).afirst()
+    if chat_session is None:
+        chat_session = await ChatSession.objects.acreate(user=request.user, session_id=str(uuid.uuid4()))
+
+    chat_history = []
+    if not routed and session_id == chat_session.session_id:  # an existing session, not one just created
+        recent_messages = (
+            chat_session.messages.order_by('-timestamp', '-id')
+            .values_list('is_user', 'message')[:settings.CHAT_HISTORY_MESSAGES]
+        )
+        chat_history = [message async for message in recent_messages][::-1]
+
+    await ChatMessage.objects.acreate(session=chat_session, is_user=True, message=user_message)
+
+    if routed:
+        response = routed.text
+    else:
+        if assistant_is_loaded():
+            assistant = get_assistant()
+        else:
+            # First chat in this process: build the index off the event loop
+            assistant = await sync_to_async(get_assistant, thread_sensitive=False)()
+
+        with timer("llm"):
+            reply = await assistant.agenerate_response(user_message, chat_history, chat_session.summary)
+        response = reply.text
+        await sync_to_async(charge)(request.user, reply.tokens)
+    record_turn(routed.intent if routed else "llm")
+
+    await ChatMessage.objects.acreate(session=chat_session, is_user=False, message=response)
+
+    return JsonResponse({'response': response, 'session_id': chat_session.session_id})
@@ -0,0 +1,195 @@
+# hospital_assistant/chunking.py
+#
+# Heading- and sentence-aware chunking of knowledge_base.txt, and the
+# retrieval index built from it.
+#
+# The file is split into sections at standalone heading lines ("Technical
+# Support:"), and each section into units headed by a question or label line
+# ("4. What is the consultation fee?"). A unit longer than the chunk size is
+# split between sentences with a few sentences of overlap, and every chunk
+# repeats its heading so it can be retrieved on its own.
+#
+# Chunks carry a content-derived id, their section title and character
+# offsets into the source (newlines normalized to "\n"). KnowledgeIndex keeps
+# a hash per section, so re-indexing an edited file only re-chunks and
+# re-vectorizes the sections that changed.
+import hashlib
+import re
+import threading
+from typing import NamedTuple
+
+HEADING_MAX_CHARS = 80
+DEFAULT_SECTION = "General"
+
+# A run of lines that contain something other than whitespace
+_BLOCK = re.compile(r"(?:[ \t]*\S[^\n]*(?:\n|\Z))+")
+# A sentence, or a list item, ending at . ! ? (plus closing quotes) or a line break before "- "
+_SENTENCE = re.compile(r"\S.*?(?:[.!?][\"'”)]*(?=\s|\Z)|(?=\n\s*- )|\Z)", re.S)
+
+
+class Chunk(NamedTuple):
+    id: str
+    section: str
+    heading: str
+    start: int
+    end: int
+    text: str
+
+
+def _is_heading(line):
+    return len(line) <= HEADING_MAX_CHARS and line.endswith((":", "?"))
+
+
+def _slug(title):
+    return re.sub(r"[^a-z0-9]+", "-", title.lower()).strip("-") or "section"
+
+
+def split_sections(text):
+    """
+    Split normalized text into (title, start, end) spans.
+    A section starts at a block consisting of a single heading line ending with ':'.
+    """
+    sections = []
+    title, start = DEFAULT_SECTION, 0
+    for match in _BLOCK.finditer(text):
+        lines = match.group().strip().split("\n")
+        first = lines[0].strip()
+        if len(lines) == 1 and first.endswith(":") and _is_heading(first):
+            if text[start:match.start()].strip():
+                sections.append((title, start, match.start()))
+            title, start = first.rstrip(":").strip(), match.start()
+    if text[start:].strip():
+        sections.append((title, start, len(text)))
+    return sections
+
+
+def chunk_section(text, title, start, end, max_chars=400, overlap_chars=100):
+    """Chunks for text[start:end]; offsets are absolute"""
+    chunks = []
+    for match in _BLOCK.finditer(text, start, end):
+        block_start = match.start()
+        lines = match.group().rstrip().split("\n")
+        first = lines[0].strip()
+        if len(lines) == 1 and first.endswith(":") and _is_heading(first):
+            continue  # the section title itself
+
+        heading = first if _is_heading(first) and len(lines) > 1 else ""
+        body_offset = block_start + (len(lines[0]) + 1 if heading else 0)
+        body = text[body_offset:match.start() + len(match.group().rstrip())]
+        prefix = f"{heading}\n" if heading else f"{title}:\n" if title != DEFAULT_SECTION else ""
+
+        sentences = [(body_offset + m.start(), body_offset + m.end()) for m in _SENTENCE.finditer(body)]
+        for first_sentence, last_sentence in _pack_sentences(sentences, max_chars - len(prefix), overlap_chars):
+            chunk_start, chunk_end = sentences[first_sentence][0], sentences[last_sentence][1]
+            body_text = " ".join(text[chunk_start:chunk_end].split())
+            chunk_text = prefix + body_text
+            digest = hashlib.sha1(f"{title}\n{chunk_text}".encode("utf-8")).hexdigest()[:10]
+            chunks.append(Chunk(
+                id=f"{_slug(title)}-{digest}", section=title, heading=heading or title,
+                start=block_start if heading and first_sentence == 0 else chunk_start, end=chunk_end, text=chunk_text,
+            ))
+    return chunks
+
+
+def _pack_sentences(spans, max_chars, overlap_chars):
+    """
+    Group consecutive sentence spans into windows of at most max_chars.
+    Each window after the first starts with the trailing sentences of the previous one
+    totalling at most overlap_chars. A single sentence longer than max_chars is its own window.
+    """
+    windows = []
+    first = 0
+    while first < len(spans):
+        last = first
+        while last + 1 < len(spans) and spans[last + 1][1] - spans[first][0] <= max_chars:
+            last += 1
+        windows.append((first, last))
+        if last == len(spans) - 1:
+            break
+        next_first = last + 1
+        while next_first - 1 > first and spans[last][1] - spans[next_first - 1][0] <= overlap_chars:
+            next_first -= 1
+        first = next_first
+    return windows
+
+
+def normalize(text):
+    return text.replace("\r\n", "\n").replace("\r", "\n")
+
+
+class KnowledgeIndex:
+    """
+    Chunks plus TF-IDF vectors for retrieval, updatable section by section.
+
+    Term counts come from a stateless HashingVectorizer, so a chunk's row is
+    computed once and reused until its text changes; only the IDF weighting
+    (a cheap pass over the count matrix) is redone on each update.
+    """
+
+    def __init__(self, max_chars=400, overlap_chars=100):
+        self.max_chars = max_chars
+        self.overlap_chars = overlap_chars
+        self.sections = {}  # (title, occurrence) -> {"hash", "start", "chunks"}
+        self.chunks = []
+        self._counts = {}  # chunk id -> sparse term-count row
+        self._matrix = None
+        self._lock = threading.Lock()
+        self._hasher = None
+        self._tfidf = None
+
+    def update(self, text):
+        """Re-index `text`, re-chunking only changed sections; returns (changed, reused) section counts"""
+        from scipy.sparse import vstack
+        from sklearn.feature_extraction.text import HashingVectorizer, TfidfTransformer
+
+        text = normalize(text)
+        with self._lock:
+            if self._hasher is None:
+                self._hasher = HashingVectorizer(alternate_sign=False, norm=None)
+
+            sections, chunks, changed, seen = {}, [], 0, {}
+            for title, start, end in split_sections(text):
+                occurrence = seen[title] = seen.get(title, -1) + 1
+                key = (title, occurrence)
+                digest = hashlib.sha1(text[start:end].encode("utf-8")).hexdigest()
+                previous = self.sections.get(key)
+                if previous and previous["hash"] == digest:
+                    # Same content, possibly moved: shift offsets instead of re-chunking
+                    shift = start - previous["start"]
+                    section_chunks = [c._replace(start=c.start + shift, end=c.end + shift) for c in previous["chunks"]]
+                else:
+                    section_chunks = chunk_section(text, title, start, end, self.max_chars, self.overlap_chars)
+                    changed += 1
+                sections[key] = {"hash": digest, "start": start, "chunks": section_chunks}
+                chunks.extend(section_chunks)
+
+            new = [chunk for chunk in chunks if chunk.id not in self._counts]
+            if new:
+                rows = self._hasher.transform([chunk.text for chunk in new])
+                for i, chunk in enumerate(new):
+                    self._counts[chunk.id] = rows[i]
+            live = {chunk.id for chunk in chunks}
+            self._counts = {chunk_id: row for chunk_id, row in self._counts.items() if chunk_id in live}
+
+            tfidf = TfidfTransformer()
+            matrix = tfidf.fit_transform(vstack([self._counts[chunk.id] for chunk in chunks])) if chunks else None
+            # Swap everything at once so concurrent searches see a consistent index
+            self.sections, self.chunks, self._tfidf, self._matrix = sections, chunks, tfidf, matrix
+            return changed, len(sections) - changed
+
+    def search(self, query, top_k=3, min_score=0.1):
+        """Best (chunk, score) pairs for a query, highest first"""
+        import numpy as np
+        from sklearn.metrics.pairwise import cosine_similarity
+
+        chunks, tfidf, matrix = self.chunks, self._tfidf, self._matrix
+        if matrix is None:
+            return []
+        query_vector = tfidf.transform(self._hasher.transform([query]))
+        scores = cosine_similarity(query_vector, matrix)[0]
+        top = np.argsort(scores)[-top_k:][::-1]
+        return [(chunks[i], float(scores[i])) for i in top if scores[i] > min_score]
+
+    def describe(self):
+        """Chunk metadata without the vectors, e.g. for inspection or export"""
+        return [chunk._asdict() for chunk in self.chunks]
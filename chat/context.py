@@ -0,0 +1,122 @@
+# hospital_assistant/context.py
+#
+# Packs the Gemini prompt into a fixed token budget. Tokens are estimated at
+# ~4 characters each (close for English with Gemini's tokenizer, and free,
+# unlike a count_tokens round trip). Sections are added in priority order and
+# anything that does not fit is dropped or trimmed, never the instructions
+# or the question itself.
+import math
+import re
+
+from django.conf import settings
+
+from appointment.metrics import registry
+
+TOKEN_BUCKETS = (100, 250, 500, 750, 1000, 1500, 2000, 3000, 5000, 10000)
+# Chunks sharing this fraction of their words with an already packed chunk are treated as duplicates
+DUPLICATE_OVERLAP = 0.8
+
+registry.histogram(
+    "chat_prompt_tokens",
+    "Estimated prompt tokens per chat turn, by prompt section.",
+    label_names=("section",),
+    buckets=TOKEN_BUCKETS,
+)
+
+_WORD = re.compile(r"\w+")
+
+
+def estimate_tokens(text):
+    return math.ceil(len(text) / 4) if text else 0
+
+
+def _words(text):
+    return set(_WORD.findall(text.lower()))
+
+
+class ContextBuilder:
+    """
+    Collects prompt sections against a token budget.
+
+    `reserve` is for text that is always sent (instructions, the query);
+    the `add_*` methods only add what still fits and return whether they did.
+    """
+
+    def __init__(self, budget):
+        self.budget = budget
+        self.used = 0
+        self.sections = {}
+        self.tokens = {}
+        self._chunk_words = []
+
+    @property
+    def remaining(self):
+        return max(self.budget - self.used, 0)
+
+    def _take(self, section, text):
+        cost = estimate_tokens(text)
+        self.used += cost
+        self.tokens[section] = self.tokens.get(section, 0) + cost
+
+    def reserve(self, section, text):
+        self._take(section, text)
+
+    def add(self, section, text, trim=False):
+        """Add a block of text; with trim=True keep its tail when it does not fit whole"""
+        if not text:
+            return False
+        if estimate_tokens(text) > self.remaining:
+            if not trim or self.remaining == 0:
+                return False
+            text = text[-self.remaining * 4:]
+            text = text[text.find("\n") + 1:] if "\n" in text else text  # drop the cut-off first line
+        self.sections.setdefault(section, []).append(text)
+        self._take(section, text)
+        return True
+
+    def add_chunks(self, scored_chunks, section="knowledge"):
+        """Pack knowledge-base chunks best score first, skipping near-duplicates of packed ones"""
+        packed = 0
+        for chunk, _score in sorted(scored_chunks, key=lambda item: item[1], reverse=True):
+            words = _words(chunk)
+            if any(self._overlap(words, seen) >= DUPLICATE_OVERLAP for seen in self._chunk_words):
+                continue
+            if self.add(section, chunk):
+                self._chunk_words.append(words)
+                packed += 1
+        return packed
+
+    @staticmethod
+    def _overlap(words, other):
+        if not words or not other:
+            return 0.0
+        return len(words & other) / min(len(words), len(other))
+
+    def add_history(self, history, section="history"):
+        """
+        Pack (is_user, text) messages newest first while they fit; returns them oldest first.
+        Each message is cut to an eighth of the budget so one long reply cannot crowd out the rest,
+        and packing stops at the first message that does not fit so the transcript has no gaps.
+        """
+        max_chars = self.budget // 8 * 4
+        kept = []
+        for is_user, text in reversed(history):
+            if len(text) > max_chars:
+                text = text[:max_chars - 1].rstrip() + "…"
+            line = f"{'User' if is_user else 'Assistant'}: {text}"
+            if not self.add(section, line):
+                break
+            kept.append(line)
+        kept.reverse()
+        self.sections[section] = kept
+        return kept
+
+    def text(self, section, separator="\n\n"):
+        return separator.join(self.sections.get(section, []))
+
+    def record_metrics(self):
+        if not getattr(settings, "METRICS_ENABLED", False):
+            return
+        for section, tokens in self.tokens.items():
+            registry.observe("chat_prompt_tokens", (section,), tokens)
+        registry.observe("chat_prompt_tokens", ("total",), self.used)
@@ -44,6 +44,13 @@ SYMPTOM_DATA = {
     }
 }
 
+# Hospital facts used in prompts and template answers (the fee is settings.CONSULTATION_FEE)
+HOSPITAL_INFO = {
+    "currency": "₹",
+    "payment_methods": ["Pay Now (Razorpay UPI)", "Pay Later"],
+    "hospital_name": "Holistic Hospitals"
+}
+
 # Hospital schedule data
 HOSPITAL_SCHEDULE = {
     "general_hours": {
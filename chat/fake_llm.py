@@ -0,0 +1,61 @@
+# hospital_assistant/fake_llm.py
+#
+# Local stand-in for the Gemini model with the same start_chat()/send_message
+# surface. Used by tests and benchmarks, and by the app itself when
+# CHAT_LLM_BACKEND=fake, to exercise timeouts, the circuit breaker and
+# request coalescing without network calls.
+import asyncio
+import random
+import threading
+import time
+from types import SimpleNamespace
+
+
+class FakeLLMError(Exception):
+    """Injected upstream failure"""
+
+
+class FakeChat:
+    def __init__(self, model):
+        self.model = model
+
+    def send_message(self, text):
+        failing = self.model._begin(text)
+        time.sleep(self.model.latency)
+        return self.model._finish(failing)
+
+    async def send_message_async(self, text):
+        failing = self.model._begin(text)
+        await asyncio.sleep(self.model.latency)
+        return self.model._finish(failing)
+
+
+class FakeLLM:
+    """
+    Replies with `reply` after `latency` seconds.
+    Fails a random `error_rate` share of calls, or every call while `failing` is set.
+    """
+
+    def __init__(self, reply="Fake assistant reply", latency=0.0, error_rate=0.0, seed=None):
+        self.reply = reply
+        self.latency = latency
+        self.error_rate = error_rate
+        self.failing = False
+        self.calls = 0
+        self.prompts = []
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def start_chat(self, history=None):
+        return FakeChat(self)
+
+    def _begin(self, text):
+        with self._lock:
+            self.calls += 1
+            self.prompts.append(text)
+            return self.failing or self._random.random() < self.error_rate
+
+    def _finish(self, failing):
+        if failing:
+            raise FakeLLMError("injected upstream failure")
+        return SimpleNamespace(text=self.reply)
@@ -1,249 +1,223 @@
 # hospital_assistant/gemini_assistant.py
+#
+# numpy, scikit-learn and google.generativeai are imported lazily: importing
+# this module (and so the URLconf) stays cheap, and workers that only serve
+# booking traffic never pay for building the assistant.
 import os
-import numpy as np
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
-import google.generativeai as genai
-from dotenv import load_dotenv
+import threading
+import time
+from typing import NamedTuple
 from django.conf import settings
 
-# Load environment variables from .env file
-load_dotenv()
+from .chunking import KnowledgeIndex
+from .context import ContextBuilder, estimate_tokens
+from .intents import StructuredAnswers
+from .llm_gateway import LLMGateway
 
-# Initialize Gemini client
-genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
+_gemini_configured = False
+_gemini_lock = threading.Lock()
 
-class HospitalChatAssistant:
-    def __init__(self, knowledge_base_text, symptom_data=None, schedule_data=None):
-        # Split the knowledge base into chunks for better retrieval
-        self.chunks = self._chunk_text(knowledge_base_text)
-        
-        # Create a vectorizer and embeddings for the chunks
-        self.vectorizer = TfidfVectorizer()
-        self.chunk_embeddings = self.vectorizer.fit_transform(self.chunks)
-        
-        # Load symptom data if provided
-        self.symptom_data = symptom_data or {}
+
+def _configure_gemini():
+    """Load .env and configure the Gemini client once per process"""
+    global _gemini_configured
+    import google.generativeai as genai
+    if not _gemini_configured:
+        with _gemini_lock:
+            if not _gemini_configured:
+                from dotenv import load_dotenv
+                load_dotenv()
+                genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
+                _gemini_configured = True
+    return genai
+
+
+class LLMReply(NamedTuple):
+    text: str
+    source: str  # "llm", "coalesced", "cache" or "fallback" (see LLMGateway.call)
+    tokens: int  # estimated prompt + reply tokens spent upstream; 0 when nothing was spent
+
+
+def _reply(prompt, text, source):
+    spent = source in ("llm", "coalesced")
+    return LLMReply(text, source, estimate_tokens(prompt) + estimate_tokens(text) if spent else 0)
+
+
+class HospitalChatAssistant(StructuredAnswers):
+    def __init__(self, knowledge_base_text, symptom_data=None, schedule_data=None, knowledge_base_path=None):
+        # Split the knowledge base into heading-aware chunks and index them for retrieval
+        self.knowledge = KnowledgeIndex(settings.CHAT_CHUNK_MAX_CHARS, settings.CHAT_CHUNK_OVERLAP_CHARS)
+        self.knowledge.update(knowledge_base_text)
         
-        # Load schedule data if provided
-        self.schedule_data = schedule_data or {}
+        # When built from a file, edits to it are picked up without a restart
+        self.knowledge_base_path = knowledge_base_path
+        self._knowledge_mtime = os.path.getmtime(knowledge_base_path) if knowledge_base_path else None
+        self._knowledge_checked_at = time.monotonic()
         
-        # Additional context for the assistant
-        self.context = {
-            "consultation_fee": 500,
-            "currency": "₹",
-            "payment_methods": ["Pay Now (Razorpay UPI)", "Pay Later"],
-            "hospital_name": "Holistic Hospitals"
-        }
+        # Symptom and schedule data, hospital facts and the medical disclaimer
+        super().__init__(symptom_data, schedule_data)
         
-        # Medical disclaimer for symptom-related responses
-        self.medical_disclaimer = """
-        IMPORTANT: This is not a substitute for professional medical advice. 
-        For emergencies, please call emergency services immediately. 
-        The symptom information provided is for informational purposes only.
-        """
+        # The Gemini model is created on first use in each process, so a
+        # master that preloads the assistant never opens a client before fork
+        self._model = None
+        self._model_lock = threading.Lock()
         
-        # Initialize the Gemini model
-        self.model = genai.GenerativeModel('gemini-1.5-pro')
+        # Concurrency cap, deadlines, circuit breaker and coalescing for every model call
+        self.gateway = LLMGateway.from_settings()
+    
+    @property
+    def model(self):
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    if settings.CHAT_LLM_BACKEND == 'fake':
+                        from .fake_llm import FakeLLM
+                        self._model = FakeLLM(latency=settings.CHAT_FAKE_LLM_LATENCY,
+                                              error_rate=settings.CHAT_FAKE_LLM_ERROR_RATE)
+                    else:
+                        self._model = _configure_gemini().GenerativeModel('gemini-1.5-pro')
+        return self._model
     
-    def _chunk_text(self, text, max_chunk_size=300):
-        """Split text into smaller chunks for better retrieval"""
-        paragraphs = text.split('\n\n')
-        chunks = []
+    def refresh_knowledge_base(self, force=False):
+        """Re-index the knowledge base file if it changed; only edited sections are re-chunked"""
+        if not self.knowledge_base_path:
+            return False
+        interval = settings.CHAT_KNOWLEDGE_RELOAD_SECONDS
+        now = time.monotonic()
+        if not force and (interval <= 0 or now - self._knowledge_checked_at < interval):
+            return False
+        self._knowledge_checked_at = now
         
-        current_chunk = ""
-        for para in paragraphs:
-            if len(current_chunk) + len(para) < max_chunk_size:
-                current_chunk += para + "\n\n"
-            else:
-                if current_chunk:
-                    chunks.append(current_chunk.strip())
-                current_chunk = para + "\n\n"
-                
-        if current_chunk:
-            chunks.append(current_chunk.strip())
-            
-        return chunks
+        try:
+            mtime = os.path.getmtime(self.knowledge_base_path)
+            if not force and mtime == self._knowledge_mtime:
+                return False
+            with open(self.knowledge_base_path, 'r', encoding='utf-8') as f:
+                text = f.read()
+        except OSError:
+            return False
+        self._knowledge_mtime = mtime
+        self.knowledge.update(text)
+        return True
     
     def _retrieve_relevant_chunks(self, query, top_k=3):
         """Find the most relevant chunks for the given query"""
-        # Convert query to vector using the same vectorizer
-        query_vector = self.vectorizer.transform([query])
-        
-        # Calculate similarity scores
-        similarity_scores = cosine_similarity(query_vector, self.chunk_embeddings)[0]
-        
-        # Get indices of top k chunks
-        top_indices = np.argsort(similarity_scores)[-top_k:][::-1]
-        
-        # Return top chunks and their scores
-        return [(self.chunks[i], similarity_scores[i]) for i in top_indices if similarity_scores[i] > 0.1]
+        self.refresh_knowledge_base()
+        return [(chunk.text, score) for chunk, score in self.knowledge.search(query, top_k=top_k)]
+    
+    def _instructions(self, context_info):
+        """Fixed instructions wrapped around the packed context"""
+        return f"""You are a helpful hospital appointment assistant. 
+You help patients with booking appointments, understanding payment options, symptom assessment, and other hospital-related queries.
+Use ONLY the following context to answer the user's question. If the information is not in the context, 
+politely say you don't have that specific information and offer to help with related topics you do know about.
+
+CONTEXT INFORMATION:
+{context_info}
+
+Additional system information:
+- Consultation fee: {self.context['currency']}{settings.CONSULTATION_FEE}
+- Payment methods: {', '.join(self.context['payment_methods'])}
+- Hospital Name: {self.context['hospital_name']}
+
+Be concise, friendly, and helpful in your responses. For medical queries, always emphasize the importance of consulting a healthcare professional."""
     
-    def identify_symptoms(self, symptoms_text):
+    def build_prompt(self, query, chat_history=None, summary=None):
         """
-        Process symptom descriptions and return relevant information
+        Pack everything the model sees for one turn into CHAT_CONTEXT_TOKEN_BUDGET.
+        chat_history is a list of (is_user, text) pairs, oldest first, without the current query.
+        Priority: structured facts, best knowledge-base chunks, most recent history, summary.
         """
-        # Convert symptoms to lowercase for matching
-        symptoms_text_lower = symptoms_text.lower()
+        builder = ContextBuilder(settings.CHAT_CONTEXT_TOKEN_BUDGET)
+        builder.reserve("instructions", self._instructions(""))
+        builder.reserve("query", f"User: {query}")
+        query_lower = query.lower()
         
-        # Look for symptom keywords in the text
-        matched_symptoms = []
-        for symptom, info in self.symptom_data.items():
-            if symptom.lower() in symptoms_text_lower:
-                matched_symptoms.append((symptom, info))
+        # Check if this is a symptom query
+        if any(keyword in query_lower for keyword in ["symptom", "pain", "feeling", "hurt", "ache", "sick", "fever", "cough"]):
+            builder.add("facts", f"[Symptom identification response: {self.identify_symptoms(query)}]", trim=True)
         
-        if not matched_symptoms:
-            return "I couldn't identify specific symptoms from your description. Could you provide more details about what you're experiencing?"
-            
-        # Format response with matched symptoms
-        response = "Based on the symptoms you've described, here's some information:\n\n"
+        # Check if this is a schedule query
+        if any(keyword in query_lower for keyword in ["schedule", "hours", "timing", "when", "open", "close", "available"]):
+            builder.add("facts", f"[Hospital schedule information: {self.get_schedule_info(query)}]", trim=True)
         
-        for symptom, info in matched_symptoms:
-            response += f"**{symptom}**\n"
-            response += f"Possible conditions: {', '.join(info['possible_conditions'])}\n"
-            response += f"Recommended action: {info['recommendation']}\n\n"
-            
-        response += f"\n{self.medical_disclaimer}"
+        # Retrieve more candidates than will fit; the builder keeps the best distinct ones
+        builder.add_chunks(self._retrieve_relevant_chunks(query, top_k=settings.CHAT_RETRIEVAL_CANDIDATES))
         
-        return response
-    
-    def get_schedule_info(self, query):
-        """Retrieve relevant schedule information based on query"""
-        if not self.schedule_data:
-            return "I don't have detailed schedule information available."
-            
-        # Extract day or department from query if mentioned
-        days = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
-        departments = list(self.schedule_data.get("departments", {}).keys())
+        history = builder.add_history(chat_history or [])
+        builder.add("summary", summary or "", trim=True)
         
-        day_mentioned = next((day for day in days if day in query.lower()), None)
-        dept_mentioned = next((dept for dept in departments if dept.lower() in query.lower()), None)
-        
-        if day_mentioned and dept_mentioned:
-            # Return specific department schedule for a day
-            try:
-                schedule = self.schedule_data["departments"][dept_mentioned]["schedule"][day_mentioned]
-                return f"{dept_mentioned} hours on {day_mentioned.capitalize()}: {schedule}"
-            except KeyError:
-                return f"I don't have specific schedule information for {dept_mentioned} on {day_mentioned}."
+        context_info = "\n\n".join(filter(None, [builder.text("facts"), builder.text("knowledge")]))
+        if not context_info:
+            context_info = "I don't have specific information about that in my knowledge base."
         
-        elif day_mentioned:
-            # Return general hospital hours for that day
-            try:
-                hours = self.schedule_data["general_hours"][day_mentioned]
-                return f"Hospital hours on {day_mentioned.capitalize()}: {hours}"
-            except KeyError:
-                return f"I don't have general hospital hours information for {day_mentioned}."
-                
-        elif dept_mentioned:
-            # Return department schedule for all days
-            try:
-                dept_schedule = self.schedule_data["departments"][dept_mentioned]["schedule"]
-                response = f"{dept_mentioned} schedule:\n"
-                for day, hours in dept_schedule.items():
-                    response += f"- {day.capitalize()}: {hours}\n"
-                return response
-            except KeyError:
-                return f"I don't have schedule information for {dept_mentioned}."
+        parts = [f"System: {self._instructions(context_info)}"]
+        if builder.sections.get("summary"):
+            # Older turns were compacted by prune_chat_sessions
+            parts.append(f"Summary of the earlier conversation:\n{builder.text('summary')}")
+        if history:
+            parts.append("Recent conversation:\n" + "\n".join(history))
+        parts.append(f"User: {query}")
         
-        else:
-            # Return general hospital hours
-            try:
-                response = "Hospital general hours:\n"
-                for day, hours in self.schedule_data["general_hours"].items():
-                    response += f"- {day.capitalize()}: {hours}\n"
-                return response
-            except KeyError:
-                return "I don't have detailed schedule information available."
+        builder.record_metrics()
+        return "\n\n".join(parts)
     
-    def generate_response(self, query, chat_history=None):
-        """Generate a response using Gemini based on the query and retrieved information"""
-        # Initialize chat history if not provided
-        if chat_history is None:
-            chat_history = []
-        
-        # Initialize context info
-        context_info = ""
+    def generate_response(self, query, chat_history=None, summary=None):
+        """Generate an LLMReply using Gemini based on the query and retrieved information"""
+        prompt = self.build_prompt(query, chat_history, summary)
         
-        # Check if this is a symptom query
-        if any(keyword in query.lower() for keyword in ["symptom", "pain", "feeling", "hurt", "ache", "sick", "fever", "cough"]):
-            # Try to identify symptoms first
-            symptom_response = self.identify_symptoms(query)
-            
-            # Include symptom response in the context for Gemini
-            context_info = f"[Symptom identification response: {symptom_response}]\n\n"
-        
-        # Check if this is a schedule query
-        if any(keyword in query.lower() for keyword in ["schedule", "hours", "timing", "when", "open", "close", "available"]):
-            schedule_info = self.get_schedule_info(query)
-            context_info += f"[Hospital schedule information: {schedule_info}]\n\n"
-        
-        # Retrieve relevant chunks from knowledge base
-        relevant_chunks = self._retrieve_relevant_chunks(query)
+        def send(prompt):
+            # One request per turn: history travels inside the packed prompt
+            return self.model.start_chat(history=[]).send_message(prompt).text
         
-        # If no relevant information found in specialized processors
-        if not context_info and not relevant_chunks:
-            context_info = "I don't have specific information about that in my knowledge base."
-        elif relevant_chunks:
-            # Combine the relevant chunks into context
-            if context_info:
-                context_info += "\n\n"
-            context_info += "\n\n".join([chunk for chunk, score in relevant_chunks])
+        # Errors, timeouts and an open breaker come back as a cached or fallback answer;
+        # answers built on this patient's conversation are never cached for others
+        shareable = not chat_history and not summary
+        return _reply(prompt, *self.gateway.call(prompt, send, question=query, shareable=shareable))
+    
+    async def agenerate_response(self, query, chat_history=None, summary=None):
+        """Async variant of generate_response for use from async views"""
+        prompt = self.build_prompt(query, chat_history, summary)
         
-        # Keep just recent history to avoid token limits
-        if len(chat_history) > 4:  # Keep just the last 2 exchanges
-            chat_history = chat_history[-4:]
+        async def send(prompt):
+            response = await self.model.start_chat(history=[]).send_message_async(prompt)
+            return response.text
         
-        # Construct the prompt for Gemini
-        system_prompt = f"""You are a helpful hospital appointment assistant. 
-You help patients with booking appointments, understanding payment options, symptom assessment, and other hospital-related queries.
-Use ONLY the following context to answer the user's question. If the information is not in the context, 
-politely say you don't have that specific information and offer to help with related topics you do know about.
+        shareable = not chat_history and not summary
+        return _reply(prompt, *await self.gateway.acall(prompt, send, question=query, shareable=shareable))
 
-CONTEXT INFORMATION:
-{context_info}
+_assistant = None
+_assistant_lock = threading.Lock()
 
-Additional system information:
-- Consultation fee: {self.context['currency']}{self.context['consultation_fee']}
-- Payment methods: {', '.join(self.context['payment_methods'])}
-- Hospital Name: {self.context['hospital_name']}
 
-Be concise, friendly, and helpful in your responses. For medical queries, always emphasize the importance of consulting a healthcare professional."""
-        
-        try:
-            # Start a fresh chat
-            chat = self.model.start_chat(history=[])
-            
-            # Add system prompt as first message
-            chat.send_message(f"System: {system_prompt}")
-            
-            # Add conversation history
-            for i in range(0, len(chat_history), 2):
-                if i+1 < len(chat_history):
-                    # Add user message and assistant response as context
-                    chat.send_message(f"User: {chat_history[i]}")
-                    chat.send_message(f"Assistant: {chat_history[i+1]}")
-            
-            # Send the user query
-            response = chat.send_message(query)
-            
-            # Extract the assistant's reply
-            assistant_reply = response.text
-            
-            return assistant_reply
-            
-        except Exception as e:
-            # Handle API errors gracefully
-            print(f"Error calling Gemini API: {e}")
-            return "I'm sorry, I encountered an error while generating a response. Please try again."
+def get_assistant():
+    """Return the process-wide assistant, building it on first use (thread-safe)"""
+    global _assistant
+    if _assistant is None:
+        with _assistant_lock:
+            if _assistant is None:
+                from .data import SYMPTOM_DATA, HOSPITAL_SCHEDULE
+                knowledge_base_text, knowledge_base_path = load_knowledge_base()
+                _assistant = HospitalChatAssistant(
+                    knowledge_base_text,
+                    symptom_data=SYMPTOM_DATA,
+                    schedule_data=HOSPITAL_SCHEDULE,
+                    knowledge_base_path=knowledge_base_path
+                )
+    return _assistant
+
+
+def assistant_is_loaded():
+    return _assistant is not None
+
 
 # Load knowledge base function
 def load_knowledge_base():
+    """Knowledge base text and the path it was read from (None for the built-in fallback)"""
     try:
-        import os
-        knowledge_base_path = os.path.join(settings.BASE_DIR, 'hospital_assistant', 'knowledge_base.txt')
+        knowledge_base_path = settings.CHAT_KNOWLEDGE_BASE_PATH
         with open(knowledge_base_path, 'r', encoding='utf-8') as f:
-            return f.read()
+            return f.read(), knowledge_base_path
     except FileNotFoundError:
         # Fallback knowledge base
         return """Hospital Appointment Booking Assistant - Knowledge Base
@@ -294,4 +268,4 @@ of doctors and their available slots based on current scheduling data.
 
 8. What time should I arrive for my appointment?
 To ensure a smooth experience, it is recommended to arrive at least
-15-20 minutes before your token number is expected to be called."""
+15-20 minutes before your token number is expected to be called.""", None
@@ -0,0 +1,212 @@
+# hospital_assistant/intents.py
+#
+# Questions with a fixed, structured answer (consultation fee, payment
+# methods, department hours, doctor lists, known symptoms) are answered from
+# templates without calling Gemini. Anything open-ended, ambiguous or long
+# falls through to the LLM.
+import re
+
+from django.conf import settings
+
+from appointment.metrics import registry
+from .data import HOSPITAL_INFO, HOSPITAL_SCHEDULE, SYMPTOM_DATA
+
+registry.counter("chat_turns_total", "Chat turns by how they were answered (an intent name, or llm).", label_names=("route",))
+
+# Longer messages are usually not a single factual question
+MAX_ROUTED_WORDS = 16
+OPEN_ENDED = re.compile(r"\b(why|explain|compare|difference|should i|what if|tell me more|recommend|suggest|but)\b")
+
+
+class StructuredAnswers:
+    """Answers computed directly from the symptom and schedule data"""
+
+    def __init__(self, symptom_data=None, schedule_data=None):
+        # Load symptom data if provided
+        self.symptom_data = symptom_data or {}
+        
+        # Load schedule data if provided
+        self.schedule_data = schedule_data or {}
+        
+        # Additional context for the assistant
+        self.context = dict(HOSPITAL_INFO)
+        
+        # Medical disclaimer for symptom-related responses
+        self.medical_disclaimer = """
+        IMPORTANT: This is not a substitute for professional medical advice. 
+        For emergencies, please call emergency services immediately. 
+        The symptom information provided is for informational purposes only.
+        """
+    
+    def identify_symptoms(self, symptoms_text):
+        """
+        Process symptom descriptions and return relevant information
+        """
+        # Convert symptoms to lowercase for matching
+        symptoms_text_lower = symptoms_text.lower()
+        
+        # Look for symptom keywords in the text
+        matched_symptoms = []
+        for symptom, info in self.symptom_data.items():
+            if symptom.lower() in symptoms_text_lower:
+                matched_symptoms.append((symptom, info))
+        
+        if not matched_symptoms:
+            return "I couldn't identify specific symptoms from your description. Could you provide more details about what you're experiencing?"
+            
+        # Format response with matched symptoms
+        response = "Based on the symptoms you've described, here's some information:\n\n"
+        
+        for symptom, info in matched_symptoms:
+            response += f"**{symptom}**\n"
+            response += f"Possible conditions: {', '.join(info['possible_conditions'])}\n"
+            response += f"Recommended action: {info['recommendation']}\n\n"
+            
+        response += f"\n{self.medical_disclaimer}"
+        
+        return response
+    
+    def get_schedule_info(self, query):
+        """Retrieve relevant schedule information based on query"""
+        if not self.schedule_data:
+            return "I don't have detailed schedule information available."
+            
+        # Extract day or department from query if mentioned
+        days = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+        departments = list(self.schedule_data.get("departments", {}).keys())
+        
+        day_mentioned = next((day for day in days if day in query.lower()), None)
+        dept_mentioned = next((dept for dept in departments if dept.lower() in query.lower()), None)
+        
+        if day_mentioned and dept_mentioned:
+            # Return specific department schedule for a day
+            try:
+                schedule = self.schedule_data["departments"][dept_mentioned]["schedule"][day_mentioned]
+                return f"{dept_mentioned} hours on {day_mentioned.capitalize()}: {schedule}"
+            except KeyError:
+                return f"I don't have specific schedule information for {dept_mentioned} on {day_mentioned}."
+        
+        elif day_mentioned:
+            # Return general hospital hours for that day
+            try:
+                hours = self.schedule_data["general_hours"][day_mentioned]
+                return f"Hospital hours on {day_mentioned.capitalize()}: {hours}"
+            except KeyError:
+                return f"I don't have general hospital hours information for {day_mentioned}."
+                
+        elif dept_mentioned:
+            # Return department schedule for all days
+            try:
+                dept_schedule = self.schedule_data["departments"][dept_mentioned]["schedule"]
+                response = f"{dept_mentioned} schedule:\n"
+                for day, hours in dept_schedule.items():
+                    response += f"- {day.capitalize()}: {hours}\n"
+                return response
+            except KeyError:
+                return f"I don't have schedule information for {dept_mentioned}."
+        
+        else:
+            # Return general hospital hours
+            try:
+                response = "Hospital general hours:\n"
+                for day, hours in self.schedule_data["general_hours"].items():
+                    response += f"- {day.capitalize()}: {hours}\n"
+                return response
+            except KeyError:
+                return "I don't have detailed schedule information available."
+
+
+class RoutedAnswer:
+    def __init__(self, intent, text):
+        self.intent = intent
+        self.text = text
+
+
+class IntentRouter(StructuredAnswers):
+    """Picks a template answer when exactly one structured intent clearly matches"""
+
+    def __init__(self, symptom_data=None, schedule_data=None):
+        super().__init__(symptom_data, schedule_data)
+        self.departments = list(self.schedule_data.get("departments", {}))
+        self.matchers = [
+            ("fee", self._is_fee_question),
+            ("payment_methods", self._is_payment_question),
+            ("doctors", self._is_doctor_question),
+            ("hours", self._is_hours_question),
+            ("symptoms", self._is_symptom_question),
+        ]
+
+    def _department(self, text):
+        return next((dept for dept in self.departments if dept.lower() in text), None)
+
+    def _is_fee_question(self, text):
+        return re.search(r"\b(fees?|cost|costs|charges?|price)\b", text) is not None
+
+    def _is_payment_question(self, text):
+        about_payment = re.search(r"\b(pay|payment|payments|upi|razorpay)\b", text)
+        asks_how = re.search(r"\b(how|methods?|options?|ways?|accept|modes?)\b", text)
+        # Failed or deducted payments need the support answer, not the list of methods
+        problem = re.search(r"\b(fail|failed|deducted|refund|error|issue|problem)\b", text)
+        return bool(about_payment and asks_how and not problem)
+
+    def _is_doctor_question(self, text):
+        return re.search(r"\b(doctors?|specialists?)\b", text) is not None and self._department(text) is not None
+
+    def _is_hours_question(self, text):
+        return re.search(r"\b(hours|timings?|open|opens|close|closes|closed|schedule)\b", text) is not None
+
+    def _is_symptom_question(self, text):
+        return any(symptom in text for symptom in self.symptom_data)
+
+    def route(self, message):
+        """RoutedAnswer for a high-confidence structured question, otherwise None"""
+        text = " ".join(message.lower().split())
+        if len(text.split()) > MAX_ROUTED_WORDS or OPEN_ENDED.search(text):
+            return None
+        intents = [intent for intent, matches in self.matchers if matches(text)]
+        if len(intents) != 1:
+            return None
+        intent = intents[0]
+        return RoutedAnswer(intent, getattr(self, f"_answer_{intent}")(message, text))
+
+    def _answer_fee(self, message, text):
+        return (
+            f"The standard consultation fee at {self.context['hospital_name']} is "
+            f"{self.context['currency']}{settings.CONSULTATION_FEE}. "
+            f"You can pay it when booking or choose Pay Later."
+        )
+
+    def _answer_payment_methods(self, message, text):
+        return (
+            f"You can choose {' or '.join(self.context['payment_methods'])}. "
+            "Pay Now takes you to a Razorpay UPI payment screen; with Pay Later your appointment "
+            "is booked without a payment at that moment."
+        )
+
+    def _answer_doctors(self, message, text):
+        department = self._department(text)
+        doctors = self.schedule_data["departments"][department].get("doctors", [])
+        if not doctors:
+            return f"I don't have a doctor list for {department}. You will see available doctors when booking."
+        return f"{department} doctors: {', '.join(doctors)}. You can choose one when booking an appointment."
+
+    def _answer_hours(self, message, text):
+        return self.get_schedule_info(message)
+
+    def _answer_symptoms(self, message, text):
+        return self.identify_symptoms(message)
+
+
+router = IntentRouter(SYMPTOM_DATA, HOSPITAL_SCHEDULE)
+
+
+def route_message(message):
+    """Template answer for the message, or None when the LLM should answer"""
+    if not settings.CHAT_INTENT_ROUTING:
+        return None
+    return router.route(message)
+
+
+def record_turn(route):
+    if getattr(settings, "METRICS_ENABLED", False):
+        registry.inc("chat_turns_total", (route,))
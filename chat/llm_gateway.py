@@ -0,0 +1,281 @@
+# hospital_assistant/llm_gateway.py
+#
+# Every Gemini call goes through LLMGateway so a slow or failing upstream
+# cannot take the whole process down with it:
+#
+# - a bounded semaphore caps concurrent calls; waiting for a slot counts
+#   against the call's deadline, so requests queue briefly instead of piling up
+# - each call has a deadline; a timed-out call keeps its slot until the
+#   upstream actually returns, so the cap holds even for abandoned calls
+# - a circuit breaker opens after consecutive failures and rejects calls
+#   outright until a cool-down passes, then lets a single trial call through
+# - identical prompts already in flight are coalesced onto one upstream call
+# - when no answer is available the last good answer to the same question is
+#   served from the shared cache (appointment/cache.py), or else a fixed
+#   fallback message; only answers to prompts without any patient's history
+#   or summary are stored there, since every user can be served them
+import asyncio
+import hashlib
+import logging
+import threading
+import time
+import weakref
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+
+from django.conf import settings
+
+from appointment.cache import namespace
+from appointment.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+FALLBACK_MESSAGE = "I'm sorry, I encountered an error while generating a response. Please try again."
+
+registry.counter("llm_calls_total", "LLM gateway calls by outcome.", label_names=("outcome",))
+
+
+class LLMUnavailable(Exception):
+    """No upstream answer: breaker open, no free slot before the deadline, timeout or error"""
+
+    def __init__(self, reason):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker: closed -> open -> half-open (one trial) -> closed"""
+
+    def __init__(self, failure_threshold=5, cooldown=30.0):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        return "half-open" if time.monotonic() - self.opened_at >= self.cooldown else "open"
+
+    def allow(self):
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half-open" and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_running = False
+
+    def release_trial(self):
+        """Give back a half-open trial slot without judging the upstream"""
+        with self._lock:
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial_running or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self._trial_running = False
+
+
+class _AnswerCache:
+    """Last good answer per normalized question, shared by the workers through the "llm_answers" namespace"""
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.cache = namespace("llm_answers")
+
+    @staticmethod
+    def key(question):
+        return hashlib.sha1(" ".join(question.lower().split()).encode("utf-8")).hexdigest()
+
+    def get(self, question):
+        if self.ttl <= 0:
+            return None
+        return self.cache.get(self.key(question))
+
+    def put(self, question, answer):
+        if self.ttl > 0:
+            self.cache.set(self.key(question), answer, self.ttl)
+
+
+class _LoopState:
+    """asyncio primitives are bound to one event loop, so async calls get their own per loop"""
+
+    def __init__(self, max_concurrency):
+        self.semaphore = asyncio.BoundedSemaphore(max_concurrency)
+        self.inflight = {}
+
+
+class LLMGateway:
+    def __init__(self, max_concurrency=8, timeout=20.0, failure_threshold=5, cooldown=30.0, cache_ttl=86400):
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.breaker = CircuitBreaker(failure_threshold, cooldown)
+        self.answers = _AnswerCache(cache_ttl)
+        self._semaphore = threading.BoundedSemaphore(max_concurrency)
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="llm")
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._loops = weakref.WeakKeyDictionary()
+
+    @classmethod
+    def from_settings(cls):
+        return cls(
+            max_concurrency=settings.LLM_MAX_CONCURRENCY,
+            timeout=settings.LLM_TIMEOUT_SECONDS,
+            failure_threshold=settings.LLM_BREAKER_FAILURES,
+            cooldown=settings.LLM_BREAKER_COOLDOWN_SECONDS,
+            cache_ttl=settings.LLM_FALLBACK_CACHE_TTL,
+        )
+
+    @staticmethod
+    def _flight_key(prompt):
+        return hashlib.sha1(prompt.encode("utf-8")).hexdigest()
+
+    def _record(self, outcome):
+        if getattr(settings, "METRICS_ENABLED", False):
+            registry.inc("llm_calls_total", (outcome,))
+
+    def _fallback(self, question, error):
+        logger.warning("LLM unavailable (%s); serving fallback", error.reason)
+        cached = self.answers.get(question) if question else None
+        self._record("served_cache" if cached else "served_fallback")
+        return (cached, "cache") if cached else (FALLBACK_MESSAGE, "fallback")
+
+    # Sync path (WSGI views)
+
+    def call(self, prompt, send, question=None, shareable=True):
+        """
+        Run send(prompt) -> text under the gateway's limits.
+        Returns (text, source) where source is "llm", "coalesced", "cache" or "fallback".
+        The answer is cached for question only if shareable (the prompt holds nothing user-specific).
+        """
+        deadline = time.monotonic() + self.timeout
+        key = self._flight_key(prompt)
+        with self._lock:
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = Future()
+
+        if not leader:
+            try:
+                text = flight.result(timeout=max(deadline - time.monotonic(), 0))
+            except FutureTimeout:
+                return self._fallback(question, LLMUnavailable("timeout"))
+            except LLMUnavailable as e:
+                return self._fallback(question, e)
+            self._record("coalesced")
+            return text, "coalesced"
+
+        try:
+            text = self._execute(prompt, send, deadline)
+        except LLMUnavailable as e:
+            flight.set_exception(e)
+            return self._fallback(question, e)
+        else:
+            flight.set_result(text)
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+        if question and shareable:
+            self.answers.put(question, text)
+        return text, "llm"
+
+    def _execute(self, prompt, send, deadline):
+        if not self.breaker.allow():
+            self._record("rejected_open")
+            raise LLMUnavailable("circuit open")
+        if not self._semaphore.acquire(timeout=max(deadline - time.monotonic(), 0)):
+            # Local overload says nothing about the upstream, so the breaker's counts are left alone
+            self.breaker.release_trial()
+            self._record("overloaded")
+            raise LLMUnavailable("no free slot")
+
+        future = self._executor.submit(send, prompt)
+        # The slot is held until the upstream call really ends, even if we stop waiting
+        future.add_done_callback(lambda _: self._semaphore.release())
+        try:
+            text = future.result(timeout=max(deadline - time.monotonic(), 0))
+        except FutureTimeout:
+            self.breaker.record_failure()
+            self._record("timeout")
+            raise LLMUnavailable("timeout")
+        except Exception as e:
+            self.breaker.record_failure()
+            self._record("error")
+            raise LLMUnavailable(f"upstream error: {e}")
+        self.breaker.record_success()
+        self._record("ok")
+        return text
+
+    # Async path (ASGI views)
+
+    async def acall(self, prompt, asend, question=None, shareable=True):
+        """Async variant of call(); asend(prompt) is a coroutine function returning text"""
+        loop = asyncio.get_running_loop()
+        state = self._loops.get(loop)
+        if state is None:
+            state = self._loops[loop] = _LoopState(self.max_concurrency)
+
+        key = self._flight_key(prompt)
+        task = state.inflight.get(key)
+        leader = task is None
+        if leader:
+            task = state.inflight[key] = loop.create_task(self._aexecute(prompt, asend, state))
+            task.add_done_callback(lambda done: (state.inflight.pop(key, None), done.cancelled() or done.exception()))
+
+        try:
+            # shield: a follower giving up must not cancel the shared upstream call
+            text = await asyncio.wait_for(asyncio.shield(task), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            return self._fallback(question, LLMUnavailable("timeout"))
+        except LLMUnavailable as e:
+            return self._fallback(question, e)
+
+        if not leader:
+            self._record("coalesced")
+            return text, "coalesced"
+        if question and shareable:
+            self.answers.put(question, text)
+        return text, "llm"
+
+    async def _aexecute(self, prompt, asend, state):
+        deadline = time.monotonic() + self.timeout
+        if not self.breaker.allow():
+            self._record("rejected_open")
+            raise LLMUnavailable("circuit open")
+        try:
+            await asyncio.wait_for(state.semaphore.acquire(), timeout=max(deadline - time.monotonic(), 0))
+        except asyncio.TimeoutError:
+            self.breaker.release_trial()
+            self._record("overloaded")
+            raise LLMUnavailable("no free slot")
+        try:
+            text = await asyncio.wait_for(asend(prompt), timeout=max(deadline - time.monotonic(), 0))
+        except asyncio.TimeoutError:
+            self.breaker.record_failure()
+            self._record("timeout")
+            raise LLMUnavailable("timeout")
+        except Exception as e:
+            self.breaker.record_failure()
+            self._record("error")
+            raise LLMUnavailable(f"upstream error: {e}")
+        finally:
+            state.semaphore.release()
+        self.breaker.record_success()
+        self._record("ok")
+        return text
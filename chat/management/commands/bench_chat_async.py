@@ -0,0 +1,122 @@
+import asyncio
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import AsyncClient, Client, override_settings
+from django.urls import reverse
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from appointments.management.commands.bench_booking import percentile
+from chat.fake_llm import FakeLLM
+from chat.gemini_assistant import get_assistant
+
+BENCH_USERNAME = "bench_chat_user"
+# Open-ended, so the intent router passes it to the (fake) LLM
+BENCH_MESSAGE = "Can you explain how booking and payment work together?"
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the sync ChatView (a fixed pool of threads, as under gunicorn sync workers) with "
+        "the native async chat view under a slow fake LLM. Writes to the configured database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=100)
+        parser.add_argument("--latency", type=float, default=0.2, help="Seconds per fake LLM call")
+        parser.add_argument("--error-rate", type=float, default=0.0, help="Share of fake LLM calls that fail")
+        parser.add_argument("--sync-threads", type=int, default=8,
+                            help="Threads serving the sync view (gunicorn workers x threads)")
+        parser.add_argument("--output", help="Optional JSON results path")
+
+    def handle(self, *args, **options):
+        if connection.vendor == "sqlite" and connection.settings_dict["NAME"] in ("", ":memory:"):
+            raise CommandError("An in-memory SQLite database cannot be shared between worker threads.")
+
+        User.objects.filter(username=BENCH_USERNAME).delete()
+        user = User.objects.create(username=BENCH_USERNAME)
+        refresh = RefreshToken.for_user(user)
+        refresh["username"] = user.username
+        self.auth = f"Bearer {refresh.access_token}"
+
+        # The in-process clients always send Host: testserver
+        allowed_hosts = [*settings.ALLOWED_HOSTS, "testserver"]
+        # Every request sends the same prompt, so the gateway coalesces concurrent ones;
+        # upstream_calls shows how many actually reached the model
+        model = FakeLLM(reply="Benchmark reply", latency=options["latency"], error_rate=options["error_rate"], seed=0)
+        try:
+            with override_settings(ALLOWED_HOSTS=allowed_hosts), \
+                    mock.patch.object(get_assistant(), "_model", model):
+                sync_result = self._run_sync(options["requests"], options["sync_threads"])
+                sync_result["upstream_calls"] = model.calls
+                async_result = asyncio.run(self._run_async(options["requests"]))
+                async_result["upstream_calls"] = model.calls - sync_result["upstream_calls"]
+        finally:
+            User.objects.filter(username=BENCH_USERNAME).delete()
+
+        report = {
+            "parameters": {k: options[k] for k in ("requests", "latency", "error_rate", "sync_threads")},
+            "sync": sync_result,
+            "async": async_result,
+            "speedup": round(sync_result["wall_time_sec"] / async_result["wall_time_sec"], 2),
+        }
+        for mode in ("sync", "async"):
+            result = report[mode]
+            self.stdout.write(
+                f"{mode:<6} {result['throughput_per_sec']:>8} req/s  p50={result['p50_ms']}ms "
+                f"p95={result['p95_ms']}ms  upstream={result['upstream_calls']}  statuses={result['statuses']}"
+            )
+        self.stdout.write(self.style.SUCCESS(f"async speedup: {report['speedup']}x"))
+
+        if options["output"]:
+            os.makedirs(os.path.dirname(options["output"]) or ".", exist_ok=True)
+            with open(options["output"], "w") as f:
+                json.dump(report, f, indent=2)
+
+    def _summarize(self, latencies, statuses, wall_time):
+        latencies = sorted(latencies)
+        counts = {}
+        for code in statuses:
+            counts[str(code)] = counts.get(str(code), 0) + 1
+        return {
+            "wall_time_sec": round(wall_time, 3),
+            "throughput_per_sec": round(len(latencies) / wall_time, 2),
+            "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+            "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+            "statuses": counts,
+        }
+
+    def _run_sync(self, requests, threads):
+        def send(_):
+            client = Client(raise_request_exception=False)
+            start = time.perf_counter()
+            response = client.post(reverse("chat-api"), {"message": BENCH_MESSAGE},
+                                   content_type="application/json", HTTP_AUTHORIZATION=self.auth)
+            return time.perf_counter() - start, response.status_code
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            results = list(pool.map(send, range(requests)))
+        wall_time = time.perf_counter() - started
+        return self._summarize([r[0] for r in results], [r[1] for r in results], wall_time)
+
+    async def _run_async(self, requests):
+        client = AsyncClient(raise_request_exception=False)
+
+        async def send():
+            start = time.perf_counter()
+            response = await client.post(reverse("chat-api-async"), {"message": BENCH_MESSAGE},
+                                         content_type="application/json", headers={"authorization": self.auth})
+            return time.perf_counter() - start, response.status_code
+
+        started = time.perf_counter()
+        results = await asyncio.gather(*(send() for _ in range(requests)))
+        wall_time = time.perf_counter() - started
+        return self._summarize([r[0] for r in results], [r[1] for r in results], wall_time)
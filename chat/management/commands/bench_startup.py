@@ -0,0 +1,94 @@
+import json
+import os
+import subprocess
+import sys
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+LOAD_URLCONF = """
+import time
+start = time.perf_counter()
+import django
+django.setup()
+from importlib import import_module
+from django.conf import settings
+import_module(settings.ROOT_URLCONF)
+print("STARTUP_SECONDS", time.perf_counter() - start)
+"""
+
+BUILD_ASSISTANT = LOAD_URLCONF + """
+start = time.perf_counter()
+from chat.gemini_assistant import get_assistant
+get_assistant()
+print("ASSISTANT_SECONDS", time.perf_counter() - start)
+"""
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure worker startup: wall time to set up Django and load the URLconf, the extra cost "
+        "of building the chat assistant, and per-module import times from `python -X importtime`."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--top", type=int, default=15, help="Number of modules to list")
+        parser.add_argument("--output", help="Optional JSON results path")
+
+    def handle(self, *args, **options):
+        startup, imports = self._run(LOAD_URLCONF, importtime=True)
+        with_assistant, _ = self._run(BUILD_ASSISTANT)
+
+        top_level = sorted(
+            ((name, cumulative) for name, _, cumulative, depth in imports if depth == 0),
+            key=lambda item: item[1], reverse=True,
+        )[:options["top"]]
+        by_package = defaultdict(int)
+        for name, self_us, _, _ in imports:
+            by_package[name.split(".")[0]] += self_us
+        packages = sorted(by_package.items(), key=lambda item: item[1], reverse=True)[:options["top"]]
+
+        report = {
+            "startup_seconds": round(startup["STARTUP_SECONDS"], 3),
+            "assistant_build_seconds": round(with_assistant["ASSISTANT_SECONDS"], 3),
+            "top_level_imports_ms": {name: round(us / 1000, 1) for name, us in top_level},
+            "self_time_by_package_ms": {name: round(us / 1000, 1) for name, us in packages},
+        }
+
+        self.stdout.write(f"Django setup + URLconf: {report['startup_seconds']}s")
+        self.stdout.write(f"Building the chat assistant: +{report['assistant_build_seconds']}s")
+        self.stdout.write("Slowest top-level imports (cumulative):")
+        for name, ms in report["top_level_imports_ms"].items():
+            self.stdout.write(f"  {ms:>9.1f} ms  {name}")
+        self.stdout.write("Import self time by package:")
+        for name, ms in report["self_time_by_package_ms"].items():
+            self.stdout.write(f"  {ms:>9.1f} ms  {name}")
+
+        if options["output"]:
+            os.makedirs(os.path.dirname(options["output"]) or ".", exist_ok=True)
+            with open(options["output"], "w") as f:
+                json.dump(report, f, indent=2)
+
+    def _run(self, code, importtime=False):
+        """Run `code` in a fresh interpreter; return its timing markers and parsed import times"""
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get("DJANGO_SETTINGS_MODULE", "appointment.settings"))
+        command = [sys.executable] + (["-X", "importtime"] if importtime else []) + ["-c", code]
+        result = subprocess.run(command, capture_output=True, text=True, cwd=settings.BASE_DIR, env=env)
+        if result.returncode != 0:
+            raise CommandError(result.stderr[-2000:])
+
+        markers = {}
+        for line in result.stdout.splitlines():
+            key, _, value = line.partition(" ")
+            if key.endswith("_SECONDS"):
+                markers[key] = float(value)
+
+        imports = []
+        for line in result.stderr.splitlines():
+            if not line.startswith("import time:") or "self [us]" in line:
+                continue
+            self_us, cumulative_us, name = line[len("import time:"):].split("|")
+            depth = (len(name) - len(name.lstrip(" ")) - 1) // 2
+            imports.append((name.strip(), int(self_us), int(cumulative_us), depth))
+        return markers, imports
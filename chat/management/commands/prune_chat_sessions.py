@@ -0,0 +1,50 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from chat.retention import compact_session, delete_in_batches, idle_sessions, long_sessions
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete chat sessions idle for more than --idle-days, then compact sessions longer than "
+        "--compact-over messages into their rolling summary, keeping the newest --keep messages. "
+        "Meant to run from cron."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--idle-days", type=int, default=settings.CHAT_SESSION_TTL_DAYS)
+        parser.add_argument("--compact-over", type=int, default=settings.CHAT_COMPACT_THRESHOLD,
+                            help="Compact sessions with more messages than this")
+        parser.add_argument("--keep", type=int, default=settings.CHAT_COMPACT_KEEP,
+                            help="Recent messages left verbatim in a compacted session")
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument("--dry-run", action="store_true", help="Only report what would change")
+
+    def handle(self, *args, **options):
+        if options["keep"] < 0 or options["compact_over"] <= options["keep"] or options["batch_size"] < 1:
+            raise CommandError("Expected 0 <= --keep < --compact-over and a positive --batch-size")
+
+        cutoff = timezone.now() - timedelta(days=options["idle_days"])
+        idle = idle_sessions(cutoff)
+        long = long_sessions(options["compact_over"])
+
+        if options["dry_run"]:
+            self.stdout.write(f"{idle.count()} idle sessions would be deleted")
+            self.stdout.write(f"{long.count()} long sessions would be compacted")
+            return
+
+        deleted = 0
+        for deleted in delete_in_batches(idle, options["batch_size"]):
+            self.stdout.write(f"deleted {deleted} idle sessions")
+
+        compacted = folded = 0
+        for session in long.only("id"):
+            folded += compact_session(session, options["keep"])
+            compacted += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Deleted {deleted} idle sessions; compacted {compacted} sessions ({folded} messages summarized)"
+        ))
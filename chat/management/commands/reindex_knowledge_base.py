@@ -0,0 +1,58 @@
+import json
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from chat.chunking import KnowledgeIndex
+
+
+class Command(BaseCommand):
+    help = (
+        "Chunk and index the chat knowledge base and report chunk statistics. With --previous, "
+        "re-index incrementally against an earlier --output export and report which sections changed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--path", default=settings.CHAT_KNOWLEDGE_BASE_PATH)
+        parser.add_argument("--output", help="Write chunk metadata (ids, sections, offsets, text) as JSON")
+        parser.add_argument("--previous", help="Chunk metadata exported by an earlier run")
+
+    def handle(self, *args, **options):
+        try:
+            with open(options["path"], encoding="utf-8") as f:
+                text = f.read()
+        except OSError as e:
+            raise CommandError(f"Cannot read knowledge base: {e}")
+
+        index = KnowledgeIndex(settings.CHAT_CHUNK_MAX_CHARS, settings.CHAT_CHUNK_OVERLAP_CHARS)
+        previous_ids = set()
+        if options["previous"]:
+            with open(options["previous"], encoding="utf-8") as f:
+                previous_ids = {chunk["id"] for chunk in json.load(f)["chunks"]}
+
+        import sklearn.feature_extraction.text  # noqa: F401  (keep import time out of the measurement)
+        start = time.perf_counter()
+        index.update(text)
+        elapsed = time.perf_counter() - start
+
+        lengths = [len(chunk.text) for chunk in index.chunks]
+        self.stdout.write(
+            f"{len(index.sections)} sections, {len(lengths)} chunks "
+            f"(avg {sum(lengths) // max(len(lengths), 1)} chars, max {max(lengths, default=0)}) in {elapsed * 1000:.1f} ms"
+        )
+        if options["previous"]:
+            current_ids = {chunk.id for chunk in index.chunks}
+            changed = sorted({chunk.section for chunk in index.chunks if chunk.id not in previous_ids})
+            self.stdout.write(
+                f"{len(current_ids & previous_ids)} chunks unchanged, {len(current_ids - previous_ids)} new, "
+                f"{len(previous_ids - current_ids)} removed"
+            )
+            for section in changed:
+                self.stdout.write(f"  changed section: {section}")
+
+        if options["output"]:
+            os.makedirs(os.path.dirname(options["output"]) or ".", exist_ok=True)
+            with open(options["output"], "w", encoding="utf-8") as f:
+                json.dump({"source": str(options["path"]), "chunks": index.describe()}, f, indent=2, ensure_ascii=False)
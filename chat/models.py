@@ -8,6 +8,9 @@ class ChatSession(models.Model):
     session_id = models.CharField(max_length=100, unique=True)
     created_at = models.DateTimeField(auto_now_add=True)
     last_interaction = models.DateTimeField(auto_now=True)
+    # Rolling summary of messages removed by prune_chat_sessions; used in place of that raw history
+    summary = models.TextField(blank=True, default='')
+    summarized_until = models.DateTimeField(blank=True, null=True)
     
     def __str__(self):
         return f"Chat Session: {self.user.username} - {self.created_at}"
@@ -23,4 +26,17 @@ class ChatMessage(models.Model):
         ordering = ['timestamp']
     
     def __str__(self):
-        return f"{'User' if self.is_user else 'Assistant'}: {self.message[:30]}..."
\ No newline at end of file
+        return f"{'User' if self.is_user else 'Assistant'}: {self.message[:30]}..."
+
+class LLMUsage(models.Model):
+    """Estimated LLM tokens spent per user per day: one counter row, not one row per message"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='llm_usage')
+    day = models.DateField()
+    tokens = models.PositiveIntegerField(default=0)
+    calls = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['user', 'day'], name='llm_usage_user_day_uniq')]
+    
+    def __str__(self):
+        return f"{self.user.username} {self.day}: {self.tokens} tokens"
\ No newline at end of file
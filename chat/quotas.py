@@ -0,0 +1,46 @@
+# hospital_assistant/quotas.py
+#
+# Per-user daily LLM token quota. Usage is an estimate (prompt plus reply at
+# ~4 characters per token) added to one LLMUsage row per user per day with a
+# single upsert, so accounting costs one write per LLM turn however many
+# messages a user sends. Template-routed answers and cached/fallback replies
+# are not charged.
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+from .models import LLMUsage
+
+
+def quota_enabled():
+    return settings.CHAT_DAILY_TOKEN_QUOTA > 0
+
+
+def _today():
+    return timezone.localdate()
+
+
+def tokens_used_today(user):
+    return LLMUsage.objects.filter(user=user, day=_today()).values_list('tokens', flat=True).first() or 0
+
+
+async def atokens_used_today(user):
+    return await LLMUsage.objects.filter(user=user, day=_today()).values_list('tokens', flat=True).afirst() or 0
+
+
+def quota_exceeded(used):
+    return quota_enabled() and used >= settings.CHAT_DAILY_TOKEN_QUOTA
+
+
+def charge(user, tokens):
+    """Add one call and `tokens` to today's counter (INSERT ... ON CONFLICT, PostgreSQL and SQLite)"""
+    if not tokens:
+        return
+    table = LLMUsage._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {table} (user_id, day, tokens, calls) VALUES (%s, %s, %s, 1) "
+            f"ON CONFLICT (user_id, day) DO UPDATE "
+            f"SET tokens = {table}.tokens + EXCLUDED.tokens, calls = {table}.calls + 1",
+            [user.pk, _today(), tokens],
+        )
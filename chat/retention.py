@@ -0,0 +1,93 @@
+# hospital_assistant/retention.py
+#
+# Keeps chat storage and prompt size bounded: idle sessions are deleted in
+# batches, and long sessions have their older messages folded into
+# ChatSession.summary, which the assistant reads instead of the raw history.
+# The summary is extractive (no LLM call), so compaction costs nothing per session.
+import re
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max
+from django.db.models.functions import Coalesce
+
+from .models import ChatSession, ChatMessage
+
+_SENTENCE_END = re.compile(r'(?<=[.!?])\s+')
+
+
+def _first_sentence(text, limit=160):
+    sentence = _SENTENCE_END.split(' '.join(text.split()), maxsplit=1)[0]
+    return sentence if len(sentence) <= limit else sentence[:limit - 1].rstrip() + '…'
+
+
+def summarize(previous_summary, messages):
+    """
+    Extend a rolling summary with (is_user, text) pairs.
+    Keeps one line per exchange: what the patient asked and the gist of the answer.
+    Oldest lines are dropped once the summary exceeds CHAT_SUMMARY_MAX_CHARS.
+    """
+    lines = [line for line in previous_summary.splitlines() if line.strip()]
+    question = None
+    for is_user, text in messages:
+        if is_user:
+            if question:
+                lines.append(f"- Asked: {question}")
+            question = _first_sentence(text)
+        else:
+            answer = _first_sentence(text)
+            lines.append(f"- Asked: {question} Answered: {answer}" if question else f"- Told: {answer}")
+            question = None
+    if question:
+        lines.append(f"- Asked: {question}")
+
+    while lines and len('\n'.join(lines)) > settings.CHAT_SUMMARY_MAX_CHARS:
+        lines.pop(0)
+    return '\n'.join(lines)
+
+
+def compact_session(session, keep_last):
+    """Fold all but the newest `keep_last` messages into the session summary and delete them"""
+    with transaction.atomic():
+        session = ChatSession.objects.select_for_update().only('id', 'summary').get(pk=session.pk)
+        keep_ids = list(session.messages.order_by('-timestamp', '-id').values_list('id', flat=True)[:keep_last])
+        old = session.messages.exclude(id__in=keep_ids).order_by('timestamp', 'id')
+        rows = list(old.values_list('is_user', 'message', 'timestamp'))
+        if not rows:
+            return 0
+
+        session.summary = summarize(session.summary, [(is_user, text) for is_user, text, _ in rows])
+        session.summarized_until = rows[-1][2]
+        # update() leaves last_interaction alone, so compaction does not count as activity
+        ChatSession.objects.filter(pk=session.pk).update(
+            summary=session.summary, summarized_until=session.summarized_until
+        )
+        old.delete()
+    return len(rows)
+
+
+def idle_sessions(cutoff):
+    """Sessions whose newest message (or creation, if empty) is older than cutoff"""
+    return (
+        ChatSession.objects
+        .annotate(last_activity=Coalesce(Max('messages__timestamp'), 'created_at'))
+        .filter(last_activity__lt=cutoff)
+    )
+
+
+def long_sessions(threshold):
+    return ChatSession.objects.annotate(message_count=Count('messages')).filter(message_count__gt=threshold)
+
+
+def delete_in_batches(queryset, batch_size):
+    """Delete sessions (and their messages) batch by batch; yields the running total"""
+    deleted = 0
+    while True:
+        ids = list(queryset.order_by('id').values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return
+        with transaction.atomic():
+            ChatMessage.objects.filter(session_id__in=ids).delete()
+            ChatSession.objects.filter(id__in=ids).delete()
+        deleted += len(ids)
+        yield deleted
@@ -1,5 +1,8 @@
 # hospital_assistant/serializers.py
+from collections import defaultdict
+
 from rest_framework import serializers
+from appointment.serialization import ValuesSerializer
 from .models import ChatSession, ChatMessage
 
 class ChatMessageSerializer(serializers.ModelSerializer):
@@ -15,8 +18,31 @@ class ChatSessionSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = ChatSession
-        fields = ['id', 'session_id', 'created_at', 'last_interaction', 'messages']
-        read_only_fields = ['id', 'created_at', 'last_interaction']
+        fields = ['id', 'session_id', 'created_at', 'last_interaction', 'summary', 'messages']
+        read_only_fields = ['id', 'created_at', 'last_interaction', 'summary']
+
+class ChatMessageListSerializer(ValuesSerializer):
+    """Read-only message rows; same output as ChatMessageSerializer"""
+    model = ChatMessage
+    fields = ['id', 'is_user', 'message', 'timestamp']
+
+
+class ChatSessionListSerializer(ValuesSerializer):
+    """Read-only session rows with their messages (one extra query); same output as ChatSessionSerializer"""
+    model = ChatSession
+    fields = ['id', 'session_id', 'created_at', 'last_interaction', 'summary']
+
+    class _SessionMessages(ChatMessageListSerializer):
+        fields = [*ChatMessageListSerializer.fields, 'session_id']
+
+    def extend(self, rows):
+        messages = defaultdict(list)
+        queryset = ChatMessage.objects.filter(session_id__in=[row['id'] for row in rows])
+        for message in self._SessionMessages(queryset).data:
+            messages[message.pop('session_id')].append(message)
+        for row in rows:
+            row['messages'] = messages[row['id']]
+
 
 class ChatRequestSerializer(serializers.Serializer):
     """Serializer for chat request"""
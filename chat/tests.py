@@ -1,3 +1,415 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from io import StringIO
+from types import SimpleNamespace
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
 from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from appointment.metrics import registry
+from appointments.authentication import user_cache
+from appointments.throttling import bucket_store
+from appointments.tests import QueryBudgetMixin, auth_header, authenticated_client
+from .models import ChatSession, ChatMessage, LLMUsage
+from .serializers import ChatSessionListSerializer, ChatSessionSerializer
+from .chunking import KnowledgeIndex, chunk_section
+from .context import ContextBuilder, estimate_tokens
+from .fake_llm import FakeLLM
+from .llm_gateway import FALLBACK_MESSAGE, LLMGateway
+from .intents import route_message
+from .gemini_assistant import get_assistant
+
+
+class FakeChat:
+    """Stands in for a Gemini chat session; records prompts instead of calling the API"""
+
+    def __init__(self, model):
+        self.model = model
+
+    def send_message(self, text):
+        self.model.sent.append(text)
+        return SimpleNamespace(text="Stub assistant reply")
+
+    async def send_message_async(self, text):
+        return self.send_message(text)
+
+
+class FakeModel:
+    def __init__(self):
+        self.sent = []
+
+    def start_chat(self, history=None):
+        return FakeChat(self)
+
+
+class ChatAPITestCase(QueryBudgetMixin, TestCase):
+    """Shared fixture: one very long session plus many short ones"""
+
+    LONG_SESSION_MESSAGES = 400
+    SHORT_SESSIONS = 30
+    SHORT_SESSION_MESSAGES = 10
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('chatter', password='secret123')
+        other = User.objects.create_user('someone-else', password='secret123')
+
+        cls.long_session = ChatSession.objects.create(user=cls.user, session_id='long-session')
+        sessions = [ChatSession(user=cls.user, session_id=f'short-{i}') for i in range(cls.SHORT_SESSIONS)]
+        sessions += [ChatSession(user=other, session_id=f'other-{i}') for i in range(cls.SHORT_SESSIONS)]
+        ChatSession.objects.bulk_create(sessions)
+
+        messages = [
+            ChatMessage(session=cls.long_session, is_user=i % 2 == 0, message=f'Long session message {i}')
+            for i in range(cls.LONG_SESSION_MESSAGES)
+        ]
+        for session in ChatSession.objects.exclude(id=cls.long_session.id):
+            messages += [
+                ChatMessage(session=session, is_user=i % 2 == 0, message=f'Short message {i}')
+                for i in range(cls.SHORT_SESSION_MESSAGES)
+            ]
+        ChatMessage.objects.bulk_create(messages, batch_size=1000)
+
+    def setUp(self):
+        user_cache.clear()
+        bucket_store.clear()
+        cache.clear()
+        self.client = authenticated_client(self.user)
+        self.fake_model = FakeModel()
+        patcher = mock.patch.object(get_assistant(), '_model', self.fake_model)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+
+class ChatEndpointTests(ChatAPITestCase):
+
+    def test_chat_new_session(self):
+        # user, quota read, session, user message, usage upsert, assistant message (+1 spare)
+        with self.assertMaxQueries(7):
+            response = self.client.post(reverse('chat-api'), {'message': 'Can you explain how booking works?'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['response'], 'Stub assistant reply')
+        self.assertMaxResponseSize(response, 300)
+
+    def test_chat_long_session(self):
+        payload = {'message': 'Can you explain what happens at a cardiology follow-up?', 'session_id': self.long_session.session_id}
+        with self.assertMaxQueries(7):
+            response = self.client.post(reverse('chat-api'), payload, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['session_id'], self.long_session.session_id)
+        # System prompt, the last two exchanges and the query; never the whole session
+        self.assertLessEqual(len(self.fake_model.sent), 6)
+
+    async def test_async_chat_long_session(self):
+        payload = {'message': 'Can you explain what happens at a cardiology follow-up?', 'session_id': self.long_session.session_id}
+        response = await self.async_client.post(
+            reverse('chat-api-async'), payload, content_type='application/json',
+            headers={'authorization': auth_header(self.user)},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['response'], 'Stub assistant reply')
+        self.assertLessEqual(len(self.fake_model.sent), 6)
+
+    def test_chat_rejects_empty_message(self):
+        with self.assertMaxQueries(1):
+            response = self.client.post(reverse('chat-api'), {'message': '   '}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class ChatHistoryEndpointTests(ChatAPITestCase):
+
+    def test_history_single_session(self):
+        # +1 for the ETag aggregate
+        with self.assertMaxQueries(4):
+            response = self.client.get(reverse('chat-history'), {'session_id': self.long_session.session_id})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['messages']), self.LONG_SESSION_MESSAGES)
+        self.assertMaxResponseSize(response, self.LONG_SESSION_MESSAGES * 150)
+
+    def test_history_all_sessions(self):
+        with self.assertMaxQueries(4):
+            response = self.client.get(reverse('chat-history'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), self.SHORT_SESSIONS + 1)
+        total_messages = self.LONG_SESSION_MESSAGES + self.SHORT_SESSIONS * self.SHORT_SESSION_MESSAGES
+        self.assertMaxResponseSize(response, total_messages * 150)
+
+    def test_history_is_conditional(self):
+        etag = self.client.get(reverse('chat-history'))['ETag']
+        with self.assertMaxQueries(2):
+            response = self.client.get(reverse('chat-history'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        ChatMessage.objects.create(session=self.long_session, is_user=True, message='One more question')
+        response = self.client.get(reverse('chat-history'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+        # Each session has its own validators
+        single = {'session_id': self.long_session.session_id}
+        self.assertNotEqual(self.client.get(reverse('chat-history'), single)['ETag'], response['ETag'])
+
+    def test_history_fast_serializer_matches_model_serializer(self):
+        sessions = ChatSession.objects.filter(user=self.user).order_by('-last_interaction')
+        expected = ChatSessionSerializer(sessions.prefetch_related('messages'), many=True).data
+        self.assertEqual(ChatSessionListSerializer(sessions).data, expected)
+        self.assertEqual(ChatSessionListSerializer(sessions.none()).data, [])
+
+    def test_history_unknown_session(self):
+        with self.assertMaxQueries(3):
+            response = self.client.get(reverse('chat-history'), {'session_id': 'missing'})
+        self.assertEqual(response.status_code, 404)
+
+
+class ChatRetentionTests(ChatAPITestCase):
+
+    def prune(self, **options):
+        call_command('prune_chat_sessions', stdout=StringIO(), **options)
+
+    def test_idle_sessions_are_deleted(self):
+        stale = ChatSession.objects.filter(session_id__startswith='other-')
+        ChatMessage.objects.filter(session__in=stale).update(timestamp=timezone.now() - timedelta(days=60))
+        self.prune(idle_days=30, batch_size=7, compact_over=1000, keep=10)
+        self.assertFalse(ChatSession.objects.filter(session_id__startswith='other-').exists())
+        self.assertEqual(ChatSession.objects.filter(user=self.user).count(), self.SHORT_SESSIONS + 1)
+
+    def test_long_session_is_compacted_into_summary(self):
+        self.prune(compact_over=40, keep=10)
+        self.long_session.refresh_from_db()
+        self.assertEqual(self.long_session.messages.count(), 10)
+        self.assertIn('Long session message 388', self.long_session.summary)
+        self.assertLessEqual(len(self.long_session.summary), settings.CHAT_SUMMARY_MAX_CHARS)
+        # Short sessions are left alone
+        self.assertEqual(ChatMessage.objects.filter(session__session_id='short-0').count(), self.SHORT_SESSION_MESSAGES)
+
+        payload = {'message': 'Can you explain what happens at a cardiology follow-up?', 'session_id': self.long_session.session_id}
+        with self.assertMaxQueries(7):
+            self.client.post(reverse('chat-api'), payload, format='json')
+        self.assertTrue(any(self.long_session.summary in text for text in self.fake_model.sent))
+
+
+class PromptBudgetTests(ChatAPITestCase):
+
+    def test_prompt_fits_budget(self):
+        assistant = get_assistant()
+        history = [(i % 2 == 0, f'Message {i} ' + 'padding ' * 200) for i in range(6)]
+        with self.settings(CHAT_CONTEXT_TOKEN_BUDGET=800):
+            prompt = assistant.build_prompt('How do I book an appointment and what is the fee?', history, 'x' * 5000)
+        self.assertLessEqual(estimate_tokens(prompt), 800 + 50)
+        # The newest message is kept before older ones
+        self.assertIn('Message 5', prompt)
+        self.assertNotIn('Message 0', prompt)
+        self.assertIn('User: How do I book an appointment', prompt)
+
+    def test_duplicate_chunks_are_packed_once(self):
+        builder = ContextBuilder(budget=1000)
+        chunk = 'Consultation fee is 500 rupees and payment is by UPI or later at the desk.'
+        packed = builder.add_chunks([(chunk, 0.9), (chunk + ' Thanks.', 0.8), ('Cardiology opens at 9.', 0.5)])
+        self.assertEqual(packed, 2)
+
+    def test_history_roles_and_single_call(self):
+        payload = {'message': 'And on Saturday?', 'session_id': 'short-0'}
+        self.client.post(reverse('chat-api'), payload, format='json')
+        self.assertEqual(len(self.fake_model.sent), 1)
+        prompt = self.fake_model.sent[0]
+        self.assertIn('User: Short message 8\nAssistant: Short message 9', prompt)
+        self.assertEqual(prompt.count('And on Saturday?'), 1)
+
+
+class KnowledgeChunkingTests(TestCase):
+    TEXT = (
+        "Payments:\n\n"
+        "Refund policy:\n" + " ".join(f"Refund rule number {i} applies to cancelled visits." for i in range(20)) + "\n\n"
+        "Clinics:\n\n"
+        "Where is cardiology?\nCardiology is on the second floor.\n"
+    )
+
+    def test_long_paragraph_is_split_with_overlap_and_heading(self):
+        chunks = chunk_section(self.TEXT, "Payments", 0, self.TEXT.index("Clinics:"), max_chars=200, overlap_chars=60)
+        self.assertGreater(len(chunks), 3)
+        for chunk in chunks:
+            self.assertLessEqual(len(chunk.text), 200)
+            self.assertTrue(chunk.text.startswith("Refund policy:\n"))
+            self.assertEqual(chunk.section, "Payments")
+        # Consecutive chunks share their boundary sentence
+        self.assertIn(chunks[0].text.split(". ")[-1], chunks[1].text)
+        self.assertEqual(self.TEXT[chunks[1].start:chunks[1].start + 18], "Refund rule number")
+
+    def test_incremental_update_rechunks_changed_sections_only(self):
+        index = KnowledgeIndex(max_chars=200, overlap_chars=60)
+        self.assertEqual(index.update(self.TEXT), (2, 0))
+        payment_ids = [chunk.id for chunk in index.chunks if chunk.section == "Payments"]
+
+        self.assertEqual(index.update(self.TEXT.replace("second floor", "third floor")), (1, 1))
+        self.assertEqual([chunk.id for chunk in index.chunks if chunk.section == "Payments"], payment_ids)
+        best, score = index.search("which floor is cardiology on")[0]
+        self.assertIn("third floor", best.text)
+
+
+class IntentRoutingTests(ChatAPITestCase):
+
+    def test_structured_questions_skip_the_llm(self):
+        cases = {
+            'What is the consultation fee?': '₹500',
+            'How can I pay?': 'Razorpay UPI',
+            'Who are the doctors in Cardiology?': 'Dr. Sharma',
+            'Pediatrics hours on saturday': 'Pediatrics hours on Saturday',
+            'I have a headache': 'Migraine',
+        }
+        for message, expected in cases.items():
+            with self.subTest(message=message):
+                response = self.client.post(reverse('chat-api'), {'message': message}, format='json')
+                self.assertEqual(response.status_code, 200)
+                self.assertIn(expected, response.json()['response'])
+        self.assertEqual(self.fake_model.sent, [])
+
+    def test_fee_answer_follows_the_configured_fee(self):
+        with self.settings(CONSULTATION_FEE=650):
+            response = self.client.post(reverse('chat-api'), {'message': 'What is the consultation fee?'}, format='json')
+        self.assertIn('₹650', response.json()['response'])
+
+    def test_open_ended_or_ambiguous_questions_use_the_llm(self):
+        for message in [
+            'Why is the consultation fee higher on weekends?',
+            'What are the fees and opening hours for cardiology?',
+            'My payment failed but money was deducted, how do I pay again?',
+        ]:
+            with self.subTest(message=message):
+                self.assertIsNone(route_message(message))
+
+    def test_routed_turn_is_counted(self):
+        registry.reset()
+        with self.settings(METRICS_ENABLED=True):
+            self.client.post(reverse('chat-api'), {'message': 'What is the consultation fee?'}, format='json')
+            self.client.post(reverse('chat-api'), {'message': 'Can you explain how booking works?'}, format='json')
+        rendered = registry.render()
+        self.assertIn('chat_turns_total{route="fee"} 1', rendered)
+        self.assertIn('chat_turns_total{route="llm"} 1', rendered)
+
+
+class LLMGatewayTests(TestCase):
+
+    def setUp(self):
+        cache.clear()  # fallback answers live in the shared cache
+
+    @staticmethod
+    def sender(model):
+        return lambda prompt: model.start_chat().send_message(prompt).text
+
+    def test_breaker_opens_and_serves_cached_answer(self):
+        model = FakeLLM(reply="Fresh answer")
+        gateway = LLMGateway(failure_threshold=2, cooldown=0.2)
+        send = self.sender(model)
+        self.assertEqual(gateway.call("p1", send, question="Fee?"), ("Fresh answer", "llm"))
+
+        model.failing = True
+        self.assertEqual(gateway.call("p2", send, question="  fee? "), ("Fresh answer", "cache"))
+        self.assertEqual(gateway.call("p3", send, question="Other?"), (FALLBACK_MESSAGE, "fallback"))
+        self.assertEqual(gateway.breaker.state, "open")
+
+        # Open: the upstream is not called at all
+        calls = model.calls
+        gateway.call("p4", send, question="Other?")
+        self.assertEqual(model.calls, calls)
+
+        # After the cool-down a single trial call closes the breaker again
+        model.failing = False
+        time.sleep(0.25)
+        self.assertEqual(gateway.call("p5", send), ("Fresh answer", "llm"))
+        self.assertEqual(gateway.breaker.state, "closed")
+
+    def test_deadline_and_concurrency_cap(self):
+        gateway = LLMGateway(max_concurrency=2, timeout=0.3)
+        active, peak, lock = [0], [0], threading.Lock()
+
+        def send(prompt):
+            with lock:
+                active[0] += 1
+                peak[0] = max(peak[0], active[0])
+            time.sleep(0.1 if prompt != "slow" else 0.5)
+            with lock:
+                active[0] -= 1
+            return prompt
+
+        self.assertEqual(gateway.call("slow", send), (FALLBACK_MESSAGE, "fallback"))
+        with ThreadPoolExecutor(max_workers=6) as pool:
+            results = list(pool.map(lambda i: gateway.call(f"p{i}", send), range(6)))
+        self.assertLessEqual(peak[0], 2)
+        # The abandoned slow call kept its slot, so some callers ran out of time waiting
+        self.assertIn((FALLBACK_MESSAGE, "fallback"), results)
+        self.assertIn("llm", {source for _, source in results})
+
+    def test_identical_prompts_are_coalesced(self):
+        model = FakeLLM(reply="Shared", latency=0.2)
+        gateway = LLMGateway()
+        with ThreadPoolExecutor(max_workers=5) as pool:
+            results = list(pool.map(lambda _: gateway.call("same", self.sender(model)), range(5)))
+        self.assertEqual(model.calls, 1)
+        self.assertEqual(sorted(source for _, source in results), ["coalesced"] * 4 + ["llm"])
+
+        async def run():
+            async def send(prompt):
+                return (await model.start_chat().send_message_async(prompt)).text
+            return await asyncio.gather(*(gateway.acall("same-async", send) for _ in range(5)))
+
+        results = asyncio.run(run())
+        self.assertEqual(model.calls, 2)
+        self.assertEqual({text for text, _ in results}, {"Shared"})
+
+    def test_answers_with_patient_context_are_not_shared(self):
+        assistant = get_assistant()
+        model = FakeLLM(reply="Your fever from Monday sounds like flu")
+        with mock.patch.object(assistant, '_model', model), mock.patch.object(assistant, 'gateway', LLMGateway()):
+            # Patient A's prompt carries their conversation
+            reply = assistant.generate_response("What should I do?", [(True, "I have had a fever since Monday")])
+            self.assertEqual(reply.text, "Your fever from Monday sounds like flu")
+
+            # Patient B asks the same question during an outage
+            model.failing = True
+            reply = assistant.generate_response("What should I do?")
+            self.assertEqual(reply.text, FALLBACK_MESSAGE)
+
+    def test_chat_view_survives_failing_llm(self):
+        model = FakeLLM(error_rate=1.0)
+        user = User.objects.create_user('gateway-user', password='secret123')
+        with mock.patch.object(get_assistant(), '_model', model):
+            response = authenticated_client(user).post(
+                reverse('chat-api'), {'message': 'Could you explain the process in detail?'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(model.calls, 1)
+
+
+class ChatLimitTests(ChatAPITestCase):
+
+    def test_usage_is_aggregated_and_quota_enforced(self):
+        payload = {'message': 'Can you explain how booking works?'}
+        for _ in range(2):
+            self.assertEqual(self.client.post(reverse('chat-api'), payload, format='json').status_code, 200)
+        usage = LLMUsage.objects.get(user=self.user)
+        self.assertEqual(usage.calls, 2)
+        self.assertGreater(usage.tokens, 0)
+
+        with self.settings(CHAT_DAILY_TOKEN_QUOTA=usage.tokens):
+            response = self.client.post(reverse('chat-api'), payload, format='json')
+            self.assertEqual(response.status_code, 429)
+            # Template answers cost nothing and stay available
+            response = self.client.post(reverse('chat-api'), {'message': 'What is the consultation fee?'}, format='json')
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(self.fake_model.sent), 2)
 
-# Create your tests here.
+    def test_chat_is_throttled_per_user(self):
+        payload = {'message': 'What is the consultation fee?'}
+        with self.settings(THROTTLE_RATES={'chat': '2/min'}):
+            statuses = [self.client.post(reverse('chat-api'), payload, format='json').status_code for _ in range(3)]
+            self.assertEqual(statuses, [200, 200, 429])
+            other = User.objects.create_user('fresh-chatter', password='secret123')
+            response = authenticated_client(other).post(reverse('chat-api'), payload, format='json')
+            self.assertEqual(response.status_code, 200)
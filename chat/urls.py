@@ -1,8 +1,10 @@
 # hospital_assistant/urls.py
 from django.urls import path
 from .views import ChatView, ChatHistoryView
+from .async_views import async_chat_view
 
 urlpatterns = [
     path('api/chat/', ChatView.as_view(), name='chat-api'),
     path('api/chat-history/', ChatHistoryView.as_view(), name='chat-history'),
+    path('api/async/chat/', async_chat_view, name='chat-api-async'),
 ]
\ No newline at end of file
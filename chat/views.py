@@ -1,32 +1,31 @@
 # hospital_assistant/views.py
 import uuid
+from django.conf import settings
+from django.db.models import Count, Max
 from rest_framework.views import APIView
+from rest_framework.renderers import BrowsableAPIRenderer
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.permissions import IsAuthenticated
-from rest_framework_simplejwt.authentication import JWTAuthentication
-from .serializers import ChatRequestSerializer, ChatResponseSerializer, ChatSessionSerializer
+from appointments.authentication import StatelessJWTAuthentication
+from appointments.throttling import ChatThrottle
+from .serializers import ChatRequestSerializer, ChatResponseSerializer, ChatSessionListSerializer, ChatSessionSerializer
 from .models import ChatSession, ChatMessage
-from .gemini_assistant import HospitalChatAssistant, load_knowledge_base
-from .data import SYMPTOM_DATA, HOSPITAL_SCHEDULE
-
-# Load knowledge base
-
-knowledge_base_text = load_knowledge_base()
-# Initialize the assistant
-
-assistant = HospitalChatAssistant(
-    knowledge_base_text,
-    symptom_data=SYMPTOM_DATA,
-    schedule_data=HOSPITAL_SCHEDULE
-)
+from .gemini_assistant import get_assistant
+from .intents import record_turn, route_message
+from .quotas import charge, quota_exceeded, tokens_used_today
+from appointment.metrics import timer
+from appointment.conditional import conditional
+from appointment.db_router import replica_reads
+from appointment.serialization import FastJSONRenderer
 
 class ChatView(APIView):
     """
     API endpoint for interacting with the hospital chat assistant
     """
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [StatelessJWTAuthentication]
     permission_classes = [IsAuthenticated]
+    throttle_classes = [ChatThrottle]
     
     def post(self, request, *args, **kwargs):
         # Validate request data
@@ -38,6 +37,16 @@ class ChatView(APIView):
         user_message = serializer.validated_data['message']
         session_id = serializer.validated_data.get('session_id', '')
         
+        # Structured questions are answered from templates, without Gemini
+        routed = route_message(user_message)
+        
+        # Only LLM turns count against the daily token quota
+        if not routed and quota_exceeded(tokens_used_today(request.user)):
+            return Response(
+                {"error": "Daily assistant quota reached. Please try again tomorrow."},
+                status=status.HTTP_429_TOO_MANY_REQUESTS
+            )
+        
         # Get or create chat session
         if session_id:
             try:
@@ -58,6 +67,16 @@ class ChatView(APIView):
                 session_id=str(uuid.uuid4())
             )
         
+        # Recent history, read before saving the new message so it is not sent twice;
+        # the prompt builder trims it further to fit the token budget
+        chat_history = []
+        if not routed and session_id == chat_session.session_id:  # an existing session, not one just created
+            recent_messages = (
+                chat_session.messages.order_by('-timestamp', '-id')
+                .values_list('is_user', 'message')[:settings.CHAT_HISTORY_MESSAGES]
+            )
+            chat_history = list(reversed(recent_messages))
+        
         # Save user message
         ChatMessage.objects.create(
             session=chat_session,
@@ -65,13 +84,15 @@ class ChatView(APIView):
             message=user_message
         )
         
-        # Get conversation history for this session
-        chat_history = []
-        for msg in chat_session.messages.all().order_by('timestamp'):
-            chat_history.append(msg.message)
-        
-        # Generate response using the Gemini-powered assistant
-        response = assistant.generate_response(user_message, chat_history)
+        if routed:
+            response = routed.text
+        else:
+            # Generate response using the Gemini-powered assistant
+            with timer("llm"):
+                reply = get_assistant().generate_response(user_message, chat_history, chat_session.summary)
+            response = reply.text
+            charge(request.user, reply.tokens)
+        record_turn(routed.intent if routed else "llm")
         
         # Save assistant response
         ChatMessage.objects.create(
@@ -92,9 +113,23 @@ class ChatHistoryView(APIView):
     """
     API endpoint for retrieving chat history
     """
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [StatelessJWTAuthentication]
     permission_classes = [IsAuthenticated]
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
+
+    def _fingerprint(self, request, *args, **kwargs):
+        # Session count and activity plus message count and newest message, in one aggregate
+        sessions = ChatSession.objects.filter(user=request.user)
+        if request.query_params.get('session_id'):
+            sessions = sessions.filter(session_id=request.query_params['session_id'])
+        state = sessions.aggregate(
+            session_count=Count('id', distinct=True), message_count=Count('messages'),
+            last_interaction=Max('last_interaction'), last_message=Max('messages__timestamp'),
+        )
+        return tuple(state.values())
     
+    @replica_reads
+    @conditional(_fingerprint)
     def get(self, request, *args, **kwargs):
         # Get session ID from query parameters
         session_id = request.query_params.get('session_id', None)
@@ -116,5 +151,4 @@ class ChatHistoryView(APIView):
         else:
             # Get all sessions for user
             chat_sessions = ChatSession.objects.filter(user=request.user).order_by('-last_interaction')
-            serializer = ChatSessionSerializer(chat_sessions, many=True)
-            return Response(serializer.data)
+            return Response(ChatSessionListSerializer(chat_sessions).data)